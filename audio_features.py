@@ -0,0 +1,139 @@
+import numpy as np
+
+# Spotify returns at most 100 tracks per /audio-features call
+AUDIO_FEATURES_BATCH_SIZE = 100
+
+FEATURE_COLUMNS = ('energy', 'valence', 'tempo', 'danceability', 'acousticness', 'instrumentalness')
+# BPM mapped onto 0..1 so every column weighs the same in distances
+TEMPO_RANGE = (50.0, 200.0)
+
+# Mood words -> target feature values (0..1, tempo in BPM); unspecified features are ignored
+MOOD_TARGETS = {
+    "chill": {"energy": 0.3, "valence": 0.5, "tempo": 90, "acousticness": 0.6},
+    "relax": {"energy": 0.25, "tempo": 85, "acousticness": 0.7},
+    "calm": {"energy": 0.2, "tempo": 80, "acousticness": 0.7},
+    "study": {"energy": 0.25, "danceability": 0.4, "instrumentalness": 0.7, "tempo": 90},
+    "focus": {"energy": 0.3, "instrumentalness": 0.8, "tempo": 100},
+    "coding": {"energy": 0.45, "instrumentalness": 0.7, "tempo": 110},
+    "sleep": {"energy": 0.1, "tempo": 70, "acousticness": 0.8, "instrumentalness": 0.7},
+    "workout": {"energy": 0.9, "tempo": 135, "danceability": 0.7},
+    "gym": {"energy": 0.9, "tempo": 130},
+    "running": {"energy": 0.85, "tempo": 165, "danceability": 0.6},
+    "energetic": {"energy": 0.9, "valence": 0.7},
+    "party": {"energy": 0.8, "danceability": 0.85, "valence": 0.75, "tempo": 122},
+    "dance": {"energy": 0.75, "danceability": 0.9, "tempo": 120},
+    "happy": {"valence": 0.85, "energy": 0.65},
+    "upbeat": {"valence": 0.8, "energy": 0.7, "tempo": 120},
+    "sad": {"valence": 0.15, "energy": 0.3, "acousticness": 0.5},
+    "melancholy": {"valence": 0.2, "energy": 0.3},
+    "romantic": {"valence": 0.55, "energy": 0.35, "acousticness": 0.5, "tempo": 90},
+    "angry": {"energy": 0.95, "valence": 0.2},
+    "morning": {"energy": 0.5, "valence": 0.7, "acousticness": 0.5},
+    "night": {"energy": 0.45, "valence": 0.4},
+}
+
+def _scale(column, value):
+    if column == 'tempo':
+        low, high = TEMPO_RANGE
+        return np.clip((value - low) / (high - low), 0.0, 1.0)
+    return value
+
+def mood_target(mood_description):
+    """(target, weights) over FEATURE_COLUMNS for the mood, or None when no mood word is known.
+
+    Targets of several matching words ("chill study") are averaged per feature.
+    """
+    sums = np.zeros(len(FEATURE_COLUMNS), dtype=np.float32)
+    counts = np.zeros(len(FEATURE_COLUMNS), dtype=np.float32)
+    for word in (mood_description or "").lower().split():
+        for key, targets in MOOD_TARGETS.items():
+            if word.startswith(key):
+                for column, value in targets.items():
+                    index = FEATURE_COLUMNS.index(column)
+                    sums[index] += _scale(column, value)
+                    counts[index] += 1
+    if not counts.any():
+        return None
+    return sums / np.maximum(counts, 1), (counts > 0).astype(np.float32)
+
+def load_features(track_ids, db):
+    """Stored features for the given tracks as {track_id: {feature: value}}"""
+    if not track_ids:
+        return {}
+    try:
+        cursor = db.cursor()
+        format_strings = ','.join(['%s'] * len(track_ids))
+        cursor.execute(f"""
+            SELECT track_id, {', '.join(FEATURE_COLUMNS)} FROM track_features
+            WHERE track_id IN ({format_strings})
+        """, list(track_ids))
+        rows = cursor.fetchall()
+        cursor.close()
+    except Exception as e:
+        print(f"Warning: Error reading track features: {e}")
+        return {}
+    return {row[0]: dict(zip(FEATURE_COLUMNS, row[1:])) for row in rows}
+
+def save_features(features_map, db):
+    """Upsert {track_id: {feature: value}} into track_features"""
+    if not features_map:
+        return
+    try:
+        cursor = db.cursor()
+        placeholders = ', '.join(['%s'] * (len(FEATURE_COLUMNS) + 1))
+        updates = ', '.join(f"{column} = VALUES({column})" for column in FEATURE_COLUMNS)
+        cursor.executemany(f"""
+            INSERT INTO track_features (track_id, {', '.join(FEATURE_COLUMNS)}) VALUES ({placeholders})
+            ON DUPLICATE KEY UPDATE {updates}, fetched_at = NOW()
+        """, [(track_id, *(features.get(column) for column in FEATURE_COLUMNS))
+              for track_id, features in features_map.items()])
+        db.commit()
+        cursor.close()
+    except Exception as e:
+        print(f"Warning: Error storing track features: {e}")
+        db.rollback()
+
+class FeatureStore:
+    """Column store of audio features: one float32 row per track, NaN where unknown.
+
+    Columns are scaled to 0..1 on the way in, so scoring a mood against every
+    track is one vectorized distance over the matrix.
+    """
+
+    def __init__(self, track_ids, features_map):
+        self.track_ids = list(track_ids)
+        self.rows = {track_id: row for row, track_id in enumerate(self.track_ids)}
+        self.matrix = np.full((len(self.track_ids), len(FEATURE_COLUMNS)), np.nan, dtype=np.float32)
+        for row, track_id in enumerate(self.track_ids):
+            features = features_map.get(track_id)
+            if not features:
+                continue
+            self.matrix[row] = [np.nan if features.get(c) is None else _scale(c, float(features[c]))
+                                for c in FEATURE_COLUMNS]
+
+    @classmethod
+    def from_tracks(cls, tracks):
+        """Store aligned with `tracks`, read from their 'audio_features' entries"""
+        return cls([t.get('id') for t in tracks],
+                   {t.get('id'): t.get('audio_features') for t in tracks if t.get('audio_features')})
+
+    def __len__(self):
+        return len(self.track_ids)
+
+    def has_features(self):
+        """Boolean array: rows with every feature known"""
+        return ~np.isnan(self.matrix).any(axis=1)
+
+    def score(self, mood_description):
+        """Closeness (0..1, higher is better) of every track to the mood's feature target.
+
+        Tracks missing a targeted feature score 0, as does everything when
+        the mood names no known feature target.
+        """
+        target = mood_target(mood_description)
+        if target is None or not len(self):
+            return np.zeros(len(self), dtype=np.float32)
+        values, weights = target
+        difference = np.abs(self.matrix[:, weights > 0] - values[weights > 0])
+        distance = difference.mean(axis=1)
+        return np.nan_to_num(1.0 - distance, nan=0.0).astype(np.float32)
@@ -0,0 +1,1050 @@
+"""Benchmarks for the Spotify ingestion pipeline.
+
+Runs against a local mock of the Spotify Web API, so no credentials are needed:
+
+    python bench.py fetch --workers 1,4,8 --latency 0.05
+    python bench.py ratelimit --server-limit 20
+    python bench.py genres --tracks 10000 --churn 0.02
+    python bench.py match --candidates 10000 --selections 500
+    python bench.py llm --moods 16 --concurrency 1,4,8 --latency 0.5
+    python bench.py curate --tracks 10000 --max-tracks 20
+    python bench.py features --tracks 2000
+    python bench.py features --tracks 2000 --deprecated
+    python bench.py nn --tracks 50000 --queries 200
+    python bench.py publish --playlists 20 --tracks 1000
+
+The analytics bench needs MySQL and seeds a scratch database that must already hold the schema:
+
+    sed 's/spotify_tracks/spotify_bench/g' db.sql | mysql -u root -p
+    python bench.py analytics --database spotify_bench --playlists 5000
+    python bench.py history --database spotify_bench --batches 40
+
+The schema bench builds the pre-migration schema itself in an empty scratch database, then
+measures query plans and latencies before and after migrate.py brings it up to date:
+
+    mysql -u root -p -e 'CREATE DATABASE spotify_schema_bench'
+    python bench.py schema --database spotify_schema_bench --tracks 50000
+"""
+import argparse
+import os
+import contextlib
+import copy
+import io
+import json
+import random
+import tempfile
+import threading
+import time
+import warnings
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import spotipy
+
+from curator import LocalCurator
+from genre_cache import ArtistGenreCache
+from genre_index import genre_dictionary
+from link import STORE_CHUNK_SIZE, SpotifyAPI
+from llm_cache import PlaylistCache, MemoryCacheBackend
+from llm_backends import OfflineBackend
+from llm_handler import LLMHandler
+from nn_index import TrackIndex, mood_vector
+from scheduler import RequestScheduler
+from track_matcher import TrackMatcher
+
+TITLE_WORDS = ["love", "night", "summer", "heart", "fire", "dream", "river", "city", "blue", "gold",
+               "rain", "dance", "light", "road", "home", "wild", "young", "electric", "ghost", "paradise"]
+
+GENRE_POOL = ["pop", "rock", "indie", "hip hop", "jazz", "lo-fi", "house", "techno",
+              "ambient", "classical", "r&b", "soul", "metal", "folk", "edm", "funk"]
+
+
+def spotify_id(kind, i):
+    """Deterministic base62-safe 22 character ID"""
+    return f"{kind[0]}{i:021d}"
+
+
+class MockSpotifyHandler(BaseHTTPRequestHandler):
+    """Serves just enough of the Web API for SpotifyAPI's read and publish paths"""
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _page(self, items_for, total, query, path):
+        limit = int(query.get("limit", ["50"])[0])
+        offset = int(query.get("offset", ["0"])[0])
+        items = [items_for(i) for i in range(offset, min(offset + limit, total))]
+        next_url = None
+        if offset + limit < total:
+            next_url = f"{self.server.base_url}{path}?limit={limit}&offset={offset + limit}"
+        return {"items": items, "total": total, "limit": limit, "offset": offset, "next": next_url}
+
+    def do_GET(self):
+        server = self.server
+        server.request_count += 1
+        time.sleep(server.latency)
+        if not server.admit():
+            server.throttled_count += 1
+            return self._send(429, {"error": {"status": 429, "message": "API rate limit exceeded"}},
+                              headers={"Retry-After": "1"})
+
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = url.path.strip("/").split("/")[1:]  # drop "v1"
+
+        if parts == ["me"]:
+            server.me_requests += 1
+            return self._send(200, {"id": "bench-user", "display_name": "bench"})
+        if parts == ["me", "playlists"]:
+            return self._send(200, self._page(server.playlist, server.n_playlists, query, url.path))
+        if len(parts) == 2 and parts[0] == "playlists" and parts[1] in server.created:
+            items = server.created[parts[1]]
+            return self._send(200, {"id": parts[1], "name": parts[1], "tracks": {"total": len(items)},
+                                    "external_urls": {"spotify": f"https://open.spotify.com/playlist/{parts[1]}"}})
+        if len(parts) == 3 and parts[0] == "playlists" and parts[2] in ("tracks", "items"):
+            return self._send(200, self._page(server.playlist_item, server.n_tracks, query, url.path))
+        if parts[:1] == ["artists"]:
+            ids = query.get("ids", [""])[0].split(",")
+            return self._send(200, {"artists": [server.artist(a) for a in ids if a]})
+        if parts[:1] == ["audio-features"]:
+            server.audio_feature_requests += 1
+            if server.audio_features_deprecated:
+                return self._send(403, {"error": {"status": 403, "message": "Forbidden"}})
+            ids = query.get("ids", [""])[0].split(",")
+            return self._send(200, {"audio_features": [server.audio_features(t) for t in ids if t]})
+        return self._send(404, {"error": {"status": 404, "message": "Not found"}})
+
+    def do_POST(self):
+        server = self.server
+        server.request_count += 1
+        time.sleep(server.latency)
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")[1:]
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"null")
+
+        if len(parts) == 3 and parts[0] == "users" and parts[2] == "playlists":
+            with server._lock:
+                playlist_id = spotify_id("playlist", 10 ** 6 + len(server.created))
+                server.created[playlist_id] = []
+            return self._send(201, {"id": playlist_id, "name": payload["name"]})
+        if len(parts) == 3 and parts[0] == "playlists" and parts[2] in ("tracks", "items"):
+            with server._lock:
+                if server.fail_writes_after is not None:
+                    if server.fail_writes_after <= 0:
+                        return self._send(400, {"error": {"status": 400, "message": "Injected failure"}})
+                    server.fail_writes_after -= 1
+                server.add_requests += 1
+                server.max_items_per_add = max(server.max_items_per_add, len(payload))
+                server.created[parts[1]].extend(payload)
+            return self._send(201, {"snapshot_id": f"snap-{len(server.created[parts[1]])}"})
+        return self._send(404, {"error": {"status": 404, "message": "Not found"}})
+
+
+class MockSpotifyServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency=0.05, n_playlists=200, n_tracks=2000, n_artists=400, rate_limit=None,
+                 audio_features_deprecated=False):
+        super().__init__(("127.0.0.1", 0), MockSpotifyHandler)
+        self.latency = latency
+        self.n_playlists = n_playlists
+        self.n_tracks = n_tracks
+        self.n_artists = n_artists
+        self.rate_limit = rate_limit  # requests per rolling second, None = unlimited
+        self.request_count = 0
+        self.throttled_count = 0
+        self.audio_features_deprecated = audio_features_deprecated  # answer 403 like new Spotify apps get
+        self.audio_feature_requests = 0
+        # Playlists created through the API: id -> track URIs in insertion order
+        self.created = {}
+        self.fail_writes_after = None  # add-items calls to accept before answering 400
+        self.me_requests = 0
+        self.add_requests = 0
+        self.max_items_per_add = 0
+        self.base_url = f"http://127.0.0.1:{self.server_address[1]}"
+        self._recent = deque()
+        self._lock = threading.Lock()
+
+    def admit(self):
+        """Rolling one-second window, like Spotify's undisclosed per-app limit"""
+        if self.rate_limit is None:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] > 1.0:
+                self._recent.popleft()
+            if len(self._recent) >= self.rate_limit:
+                return False
+            self._recent.append(now)
+            return True
+
+    def playlist(self, i):
+        return {"id": spotify_id("playlist", i), "name": f"Playlist {i}",
+                "snapshot_id": f"snap-{i}", "tracks": {"total": self.n_tracks},
+                "owner": {"display_name": "bench"}}
+
+    def playlist_item(self, i):
+        artist = i % self.n_artists
+        return {"track": {
+            "id": spotify_id("track", i), "name": f"Track {i}", "popularity": i % 100,
+            "artists": [{"id": spotify_id("artist", artist), "name": f"Artist {artist}"}],
+            "album": {"name": f"Album {i // 12}", "release_date": str(1970 + i % 55)}
+        }}
+
+    def artist(self, artist_id):
+        i = int(artist_id[1:])
+        return {"id": artist_id, "name": f"Artist {i}",
+                "genres": [GENRE_POOL[i % len(GENRE_POOL)], GENRE_POOL[(i * 7) % len(GENRE_POOL)]]}
+
+    def audio_features(self, track_id):
+        """Deterministic fixture features: the same track always gets the same values"""
+        rng = random.Random(track_id)
+        return {"id": track_id, "energy": rng.random(), "valence": rng.random(),
+                "tempo": rng.uniform(60, 180), "danceability": rng.random(),
+                "acousticness": rng.random(), "instrumentalness": rng.random()}
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+    def client(self):
+        sp = spotipy.Spotify(auth="mock-token", requests_timeout=30,
+                             retries=0, status_retries=0, status_forcelist=())
+        sp.prefix = f"{self.base_url}/v1/"
+        return sp
+
+
+def bench_fetch(args):
+    warnings.simplefilter("ignore", DeprecationWarning)
+    with MockSpotifyServer(args.latency, args.playlists, args.tracks, args.artists) as server:
+        print(f"Mock Spotify at {server.base_url}: {args.playlists} playlists, "
+              f"{args.tracks} tracks, {args.latency * 1000:.0f}ms latency")
+        print(f"{'workers':>8} {'playlists (s)':>14} {'tracks (s)':>11} {'requests':>9} "
+              f"{'warm tracks (s)':>16} {'warm requests':>14}")
+        for workers in args.workers:
+            # Fresh genre cache per run so every row starts cold; an own empty track index, since the
+            # shared one is checked against MySQL and nothing here is stored
+            api = SpotifyAPI(sp=server.client(), max_workers=workers, genre_cache=ArtistGenreCache(),
+                             scheduler=RequestScheduler(rate=10000, burst=10000), track_index=TrackIndex())
+            server.request_count = 0
+
+            start = time.perf_counter()
+            playlists = api.get_user_playlists()
+            playlists_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            tracks = sum(1 for _ in api.iter_playlist_tracks(playlists[0]["id"], store=False))
+            tracks_time = time.perf_counter() - start
+            cold_requests = server.request_count
+
+            # Second pass: every artist is now cached, only playlist pages are fetched
+            server.request_count = 0
+            start = time.perf_counter()
+            sum(1 for _ in api.iter_playlist_tracks(playlists[0]["id"], store=False))
+            warm_time = time.perf_counter() - start
+
+            api.close()
+            assert len(playlists) == args.playlists and tracks == args.tracks
+            print(f"{workers:>8} {playlists_time:>14.2f} {tracks_time:>11.2f} {cold_requests:>9} "
+                  f"{warm_time:>16.2f} {server.request_count:>14}")
+
+
+def bench_ratelimit(args):
+    warnings.simplefilter("ignore", DeprecationWarning)
+    with MockSpotifyServer(args.latency, n_tracks=args.tracks, n_artists=args.artists,
+                           rate_limit=args.server_limit) as server:
+        print(f"Mock Spotify limited to {args.server_limit} req/s, {args.tracks} tracks, "
+              f"{args.workers} workers")
+        print(f"{'client rate':>12} {'time (s)':>9} {'requests':>9} {'429s':>6} "
+              f"{'retries':>8} {'failures':>9} {'tracks w/o genres':>18}")
+        for rate in args.rates:
+            scheduler = RequestScheduler(rate=rate, burst=rate, base_delay=0.1)
+            api = SpotifyAPI(sp=server.client(), max_workers=args.workers,
+                             genre_cache=ArtistGenreCache(), scheduler=scheduler, track_index=TrackIndex())
+            server.request_count = server.throttled_count = 0
+
+            start = time.perf_counter()
+            tracks = list(api.iter_playlist_tracks(spotify_id("playlist", 0), store=False))
+            elapsed = time.perf_counter() - start
+            api.close()
+
+            stats = scheduler.stats()
+            missing = sum(1 for t in tracks if not t["artist_genres"])
+            print(f"{rate:>12.0f} {elapsed:>9.2f} {server.request_count:>9} {server.throttled_count:>6} "
+                  f"{stats['retries']:>8} {stats['failures']:>9} {missing:>18}")
+
+
+class RowCountingDB:
+    """In-memory stand-in for the tables store_tracks_batch writes, counting the rows each write
+    actually changes (as MySQL's ROW_COUNT() would) and the statements sent; unknown SQL fails"""
+
+    def __init__(self):
+        self.tracks = {}
+        self.genres = {}
+        self.artist_genres = set()
+        self.rows_written = Counter()
+        self.statements = 0
+
+    def cursor(self):
+        return RowCountingCursor(self)
+
+    def start_transaction(self, isolation_level=None):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class RowCountingCursor:
+    def __init__(self, db):
+        self.db = db
+        self.result = []
+        self.description = None
+        self.rowcount = 0
+
+    def execute(self, sql, params=()):
+        self._run(" ".join(sql.split()), [list(params)])
+
+    def executemany(self, sql, rows):
+        self._run(" ".join(sql.split()), [list(row) for row in rows])
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+    def _run(self, sql, batches):
+        db = self.db
+        db.statements += 1
+        self.result = []
+        written = 0
+        if sql.startswith("SELECT name, id FROM genres"):
+            self.result = [(name, db.genres[name]) for name in batches[0] if name in db.genres]
+        elif sql.startswith("INSERT IGNORE INTO genres"):
+            for (name,) in batches:
+                if name not in db.genres:
+                    db.genres[name] = len(db.genres) + 1
+                    written += 1
+            db.rows_written["genres"] += written
+        elif sql.startswith("INSERT INTO tracks"):
+            for row in batches:
+                # ON DUPLICATE KEY UPDATE rewrites every column; rows with nothing new count as unchanged
+                row = tuple(row)
+                if db.tracks.get(row[0]) != row:
+                    written += 1
+                    db.tracks[row[0]] = row
+            db.rows_written["tracks"] += written
+        elif sql.startswith("SELECT track_id, genre_id FROM artist_genres WHERE track_id IN"):
+            wanted = set(batches[0])
+            self.result = [row for row in db.artist_genres if row[0] in wanted]
+        elif sql.startswith("DELETE FROM artist_genres WHERE (track_id, genre_id) IN"):
+            values = batches[0]
+            pairs = set(zip(values[::2], values[1::2]))
+            written = len(db.artist_genres & pairs)
+            db.artist_genres -= pairs
+            db.rows_written["artist_genres"] += written
+        elif sql.startswith("DELETE FROM artist_genres WHERE track_id IN"):
+            wanted = set(batches[0])
+            removed = {row for row in db.artist_genres if row[0] in wanted}
+            written = len(removed)
+            db.artist_genres -= removed
+            db.rows_written["artist_genres"] += written
+        elif sql.startswith(("INSERT IGNORE INTO artist_genres", "INSERT INTO artist_genres")):
+            rows = {tuple(row) for row in batches}
+            written = len(rows - db.artist_genres)
+            db.artist_genres |= rows
+            db.rows_written["artist_genres"] += written
+        elif sql.startswith("SELECT track_id, playlist_id, COUNT(*) FROM custom_playlist_tracks"):
+            pass  # no custom playlists in this bench
+        else:
+            raise ValueError(f"RowCountingDB does not handle: {sql[:60]}")
+        self.rowcount = written
+
+
+def legacy_store_genres(db, tracks_data):
+    """artist_genres refresh as it was before diffing: delete every row of the batch, insert them all again"""
+    genre_ids = genre_dictionary.resolve({g for t in tracks_data for g in t['artist_genres']}, db)
+    cursor = db.cursor()
+    track_ids = [t['id'] for t in tracks_data]
+    cursor.execute(f"DELETE FROM artist_genres WHERE track_id IN ({','.join(['%s'] * len(track_ids))})", track_ids)
+    cursor.executemany("INSERT INTO artist_genres (track_id, genre_id) VALUES (%s, %s)",
+                       [(t['id'], genre_ids[g]) for t in tracks_data for g in t['artist_genres']])
+
+
+def bench_genres(args):
+    """Rows store_tracks_batch writes to artist_genres when re-ingesting the same tracks, vs delete-then-insert"""
+    import db_pool
+
+    rng = random.Random(42)
+    tracks = [{
+        "id": spotify_id("track", i), "track_name": f"Track {i}", "artist": f"Artist {i % 2000}",
+        "album": f"Album {i // 12}", "release_date": "2010-01-01", "popularity": 50,
+        "artist_genres": rng.sample(GENRE_POOL, args.genres_per_track)
+    } for i in range(args.tracks)]
+    # Re-ingest: a small share of tracks had one artist genre swapped since the last run
+    reingest = [dict(t) for t in tracks]
+    for track in rng.sample(reingest, int(args.tracks * args.churn)):
+        genres = track["artist_genres"]
+        track["artist_genres"] = genres[1:] + [next(g for g in GENRE_POOL if g not in genres)]
+
+    def chunks(records):
+        return [records[i:i + STORE_CHUNK_SIZE] for i in range(0, len(records), STORE_CHUNK_SIZE)]
+
+    connection = db_pool.connection
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            api = SpotifyAPI(sp=spotipy.Spotify(auth="unused"), history_mode="off",
+                             track_index=TrackIndex(os.path.join(tmp, "index.npz")))
+            db = RowCountingDB()
+            db_pool.connection = lambda: contextlib.nullcontext(db)
+            for chunk in chunks(tracks):
+                api.store_tracks_batch(chunk)
+            first = db.rows_written["artist_genres"]
+
+            legacy_db = copy.deepcopy(db)
+            legacy_db.rows_written.clear()
+            legacy_db.statements = 0
+            for chunk in chunks(reingest):
+                legacy_store_genres(legacy_db, chunk)
+
+            db.rows_written.clear()
+            db.statements = 0
+            for chunk in chunks(reingest):
+                api.store_tracks_batch(chunk)
+            api.close()
+    finally:
+        db_pool.connection = connection
+
+    print(f"{args.tracks} tracks x {args.genres_per_track} genres, {args.churn:.0%} of tracks changed "
+          f"(first ingest wrote {first} artist_genres rows)")
+    print(f"{'re-ingest':>24} {'artist_genres rows':>19} {'statements':>11}")
+    print(f"{'delete-then-insert':>24} {legacy_db.rows_written['artist_genres']:>19} {legacy_db.statements:>11}")
+    print(f"{'store_tracks_batch':>24} {db.rows_written['artist_genres']:>19} {db.statements:>11}")
+    print(f"same artist_genres afterwards: {db.artist_genres == legacy_db.artist_genres}, "
+          f"tracks rows rewritten: {db.rows_written['tracks']}")
+
+
+def legacy_match(selected, candidates):
+    """The nested exact-match loop TrackMatcher replaced"""
+    for track in selected:
+        track['track_id'] = None
+        for original in candidates:
+            if (track['track_name'].lower() == original.get('track_name', '').lower() and
+                    track['artist'].lower() == original.get('artist', '').lower()):
+                track['track_id'] = original.get('id')
+                break
+
+
+def paraphrase(rng, track):
+    """How the LLM tends to echo a track back: exact, re-cased/decorated, or with a typo"""
+    name, artist = track['track_name'], track['artist']
+    roll = rng.random()
+    if roll < 0.6:
+        return name, artist
+    if roll < 0.8:
+        return rng.choice([name.upper(), f"{name} - Remastered 2011", f"{name} (feat. Guest)"]), artist.lower()
+    i = rng.randrange(len(name) - 1)
+    return name[:i] + name[i + 1] + name[i] + name[i + 2:], artist
+
+
+def bench_match(args):
+    """Resolving the LLM's (track, artist) echoes back to candidate IDs"""
+    rng = random.Random(7)
+    candidates = [{
+        "id": spotify_id("track", i),
+        "track_name": " ".join(rng.sample(TITLE_WORDS, 3)).title(),
+        "artist": f"Artist {rng.randrange(args.candidates // 10)}",
+        "album": f"Album {i}"
+    } for i in range(args.candidates)]
+    picks = rng.sample(range(args.candidates), args.selections)
+    selected = []
+    for row in picks:
+        name, artist = paraphrase(rng, candidates[row])
+        selected.append({"track_name": name, "artist": artist})
+
+    def correct(ids):
+        return sum(track_id == candidates[row]['id'] for track_id, row in zip(ids, picks))
+
+    legacy_tracks = [dict(t) for t in selected]
+    start = time.perf_counter()
+    legacy_match(legacy_tracks, candidates)
+    legacy_ms = (time.perf_counter() - start) * 1000
+    legacy_ids = [t['track_id'] for t in legacy_tracks]
+
+    start = time.perf_counter()
+    matcher = TrackMatcher(candidates)
+    matched = [matcher.match_track(t['track_name'], t['artist']) for t in selected]
+    matcher_ms = (time.perf_counter() - start) * 1000
+    matcher_ids = [m['id'] if m else None for m in matched]
+
+    print(f"{args.candidates} candidates x {args.selections} selections (60% exact, 20% decorated, 20% typo)")
+    print(f"{'':>14} {'time ms':>9} {'matched':>8} {'correct':>8}")
+    print(f"{'nested loop':>14} {legacy_ms:>9.1f} {sum(i is not None for i in legacy_ids):>8} {correct(legacy_ids):>8}")
+    print(f"{'TrackMatcher':>14} {matcher_ms:>9.1f} {sum(i is not None for i in matcher_ids):>8} {correct(matcher_ids):>8}")
+
+
+def bench_llm(args):
+    """Multi-mood generation on the offline backend: one blocking call per mood vs the concurrent batch API"""
+    rng = random.Random(3)
+    tracks = [{
+        "id": spotify_id("track", i),
+        "track_name": " ".join(rng.sample(TITLE_WORDS, 3)).title(),
+        "artist": f"Artist {rng.randrange(500)}",
+        "album": f"Album {i % 800}",
+        "artist_genres": rng.sample(GENRE_POOL, 2),
+        "popularity": rng.randrange(100),
+        "release_date": f"{rng.randrange(1960, 2025)}-01-01"
+    } for i in range(args.tracks)]
+    moods = [f"{word} {genre}" for word, genre in zip(TITLE_WORDS * 10, GENRE_POOL * 10)][:args.moods]
+    requests = [{"mood_description": mood, "max_tracks": 10} for mood in moods]
+
+    def handler():
+        # A fresh cache per run so nothing is served from memory
+        backend = OfflineBackend(latency=args.latency, tokens_per_second=args.tps,
+                                 truncate_rate=args.truncate, malformed_rate=args.malformed)
+        return LLMHandler(cache=PlaylistCache(MemoryCacheBackend()), backend=backend)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        sync_handler = handler()
+        start = time.perf_counter()
+        for request in requests:
+            sync_handler.analyze_tracks_and_create_playlist(tracks, request["mood_description"], "", request["max_tracks"])
+        sequential = time.perf_counter() - start
+
+    print(f"{args.moods} moods over {args.tracks} tracks, {args.latency:.2f}s to first token, "
+          f"{args.tps or 'unlimited'} tokens/s, {args.truncate:.0%} truncated, {args.malformed:.0%} malformed")
+    print(f"{'':>22} {'seconds':>8} {'playlists/s':>12} {'short':>6}")
+    print(f"{'sequential':>22} {sequential:>8.2f} {args.moods / sequential:>12.1f}")
+    for concurrency in args.concurrency:
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            results = handler().generate_playlists(tracks, requests, concurrency=concurrency)
+            elapsed = time.perf_counter() - start
+        short = sum(len(r["tracks"]) < 10 for r in results)
+        print(f"{f'batch, concurrency {concurrency}':>22} {elapsed:>8.2f} {args.moods / elapsed:>12.1f} {short:>6}")
+
+
+def bench_curate(args):
+    """Local curation vs the old first-N fallback: speed, artist spread and genre fit"""
+    rng = random.Random(5)
+    tracks = [{
+        "id": spotify_id("track", i),
+        "track_name": " ".join(rng.sample(TITLE_WORDS, 3)).title(),
+        "artist": f"Artist {rng.randrange(args.tracks // 20)}",
+        "album": f"Album {i}",
+        "artist_genres": rng.sample(GENRE_POOL, 2),
+        "popularity": rng.randrange(100),
+        "release_date": f"{rng.randrange(1960, 2025)}-01-01"
+    } for i in range(args.tracks)]
+    by_id = {t["id"]: t for t in tracks}
+    moods = {"chill study": {"lo-fi", "ambient", "jazz", "classical", "soul"},
+             "gym workout": {"edm", "house", "hip hop", "metal", "techno"},
+             "90s rock": {"rock"}}
+
+    start = time.perf_counter()
+    curator = LocalCurator(tracks)
+    build_ms = (time.perf_counter() - start) * 1000
+    print(f"{args.tracks} candidates, {args.max_tracks} tracks per playlist, curator built in {build_ms:.1f}ms")
+    print(f"{'mood':>12} {'method':>10} {'ms':>6} {'artists':>8} {'genre fit':>10}")
+    for mood, fitting in moods.items():
+        start = time.perf_counter()
+        curated = curator.curate(mood, max_tracks=args.max_tracks)
+        curate_ms = (time.perf_counter() - start) * 1000
+        for method, picks, ms in [("first-N", tracks[:args.max_tracks], 0.0),
+                                  ("curator", [by_id[t["track_id"]] for t in curated["tracks"]], curate_ms)]:
+            artists = len({t["artist"] for t in picks})
+            fit = sum(bool(fitting & set(t["artist_genres"])) for t in picks) / len(picks)
+            print(f"{mood:>12} {method:>10} {ms:>6.1f} {artists:>8} {fit:>10.0%}")
+
+
+def bench_features(args):
+    """Audio-feature enrichment through the mock API and vectorized mood scoring"""
+    warnings.simplefilter("ignore", DeprecationWarning)
+    with MockSpotifyServer(args.latency, 1, args.tracks, args.tracks // 5,
+                           audio_features_deprecated=args.deprecated) as server:
+        api = SpotifyAPI(sp=server.client(), genre_cache=ArtistGenreCache(),
+                         scheduler=RequestScheduler(rate=10000, burst=10000), track_index=TrackIndex())
+        try:
+            tracks = list(api.iter_playlist_tracks(spotify_id("playlist", 0), store=False))
+            start = time.perf_counter()
+            store = api.enrich_audio_features(tracks, persist=False)
+            fetch_s = time.perf_counter() - start
+        finally:
+            api.close()
+
+    print(f"{len(tracks)} tracks: {server.audio_feature_requests} /audio-features calls in {fetch_s:.2f}s, "
+          f"{int(store.has_features().sum())} tracks with features")
+    for mood in ("chill study", "gym workout", "happy party"):
+        start = time.perf_counter()
+        for _ in range(100):
+            scores = store.score(mood)
+        score_ms = (time.perf_counter() - start) * 10
+        best = tracks[int(np.argmax(scores))].get("audio_features") or {}
+        print(f"{mood:>12}: {score_ms:.3f}ms per scoring pass, best match "
+              + ", ".join(f"{k}={v:.2f}" for k, v in best.items() if k != "id"))
+
+
+def bench_nn(args):
+    """Track index: build, save/load, query latency and recall against exact search"""
+    rng = random.Random(9)
+    # Real catalogs carry thousands of micro-genres ("swedish indie pop"), not a handful
+    vocabulary = [f"{prefix} {genre}" for prefix in ("", "uk", "swedish", "dark", "alt", "nu", "chill", "deep",
+                                                     "latin", "japanese", "experimental", "melodic")
+                  for genre in GENRE_POOL]
+    tracks = [{
+        "id": spotify_id("track", i),
+        "artist_genres": [g.strip() for g in rng.sample(vocabulary, rng.randint(1, 4))],
+        "popularity": rng.randrange(100),
+        "release_date": f"{rng.randrange(1960, 2025)}-01-01",
+        "audio_features": {"energy": rng.random(), "valence": rng.random(), "tempo": rng.uniform(60, 180),
+                           "danceability": rng.random(), "acousticness": rng.random(),
+                           "instrumentalness": rng.random()} if rng.random() < 0.7 else None
+    } for i in range(args.tracks)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "index.npz")
+        start = time.perf_counter()
+        index = TrackIndex(path)
+        for i in range(0, len(tracks), 500):  # same chunking as streaming ingestion
+            index.add(tracks[i:i + 500])
+        build_s = time.perf_counter() - start
+        start = time.perf_counter()
+        index.save()
+        save_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        index = TrackIndex.load(path)
+        load_ms = (time.perf_counter() - start) * 1000
+        size_mb = os.path.getsize(path) / 1e6
+    print(f"{args.tracks} tracks: built in {build_s:.2f}s, saved in {save_ms:.0f}ms ({size_mb:.1f}MB), "
+          f"loaded in {load_ms:.0f}ms")
+
+    queries = [index._vectors[rng.randrange(len(index))] for _ in range(args.queries)]
+    queries += [mood_vector(m) for m in ("chill study", "gym workout", "90s rock", "happy party")]
+    latencies = []
+    recall = []
+    for vector in queries:
+        start = time.perf_counter()
+        found = index.query(vector, args.k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        exact = np.argsort(-(index._vectors @ vector), kind="stable")[:args.k]
+        exact_ids = {index.ids[row] for row in exact}
+        recall.append(len(exact_ids & {track_id for track_id, _ in found}) / args.k)
+    latencies.sort()
+    start = time.perf_counter()
+    for vector in queries:
+        np.argsort(-(index._vectors @ vector))[:args.k]
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    print(f"k={args.k}: index p50 {latencies[len(latencies) // 2]:.3f}ms, "
+          f"p95 {latencies[int(len(latencies) * 0.95)]:.3f}ms, recall {np.mean(recall):.0%}; "
+          f"exact scan {exact_ms:.2f}ms per query")
+
+
+def bench_publish(args):
+    """Publishing: 100-item chunks in order, cached user id, concurrency across playlists, resume"""
+    warnings.simplefilter("ignore", DeprecationWarning)
+    playlists = [[spotify_id("track", p * args.tracks + i) for i in range(args.tracks)]
+                 for p in range(args.playlists)]
+    with MockSpotifyServer(args.latency, 1, 1, 1) as server:
+        api = SpotifyAPI(sp=server.client(), scheduler=RequestScheduler(rate=10000, burst=10000),
+                         max_workers=max(args.concurrency), track_index=TrackIndex())
+        try:
+            print(f"{args.playlists} playlists x {args.tracks} tracks, {args.latency * 1000:.0f}ms per request")
+            print(f"{'concurrency':>12} {'seconds':>8} {'add calls':>10} {'max items':>10} {'/me calls':>10} {'in order':>9}")
+            for concurrency in args.concurrency:
+                server.created.clear()
+                server.me_requests = server.add_requests = server.max_items_per_add = 0
+                api._user_id = None
+                start = time.perf_counter()
+                created = list(api.fetcher.imap(
+                    lambda track_ids: api.create_spotify_playlist("Bench", "", track_ids)["id"],
+                    playlists, window=concurrency
+                ))
+                elapsed = time.perf_counter() - start
+                in_order = all(server.created[playlist_id] == [f"spotify:track:{t}" for t in track_ids]
+                               for playlist_id, track_ids in zip(created, playlists))
+                print(f"{concurrency:>12} {elapsed:>8.2f} {server.add_requests:>10} {server.max_items_per_add:>10} "
+                      f"{server.me_requests:>10} {str(in_order):>9}")
+
+            # A publish that dies halfway, then picks up from Spotify's own item count
+            track_ids = playlists[0]
+            server.fail_writes_after = len(track_ids) // 200
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                api.create_spotify_playlist("Interrupted", "", track_ids)
+            playlist_id = list(server.created)[-1]
+            written = len(server.created[playlist_id])
+            server.fail_writes_after = None
+            adds_before = server.add_requests
+            api.resume_spotify_playlist(playlist_id, track_ids)
+            intact = server.created[playlist_id] == [f"spotify:track:{t}" for t in track_ids]
+            print(f"resume: failed after {written}/{len(track_ids)} tracks, resumed with "
+                  f"{server.add_requests - adds_before} add calls, playlist intact: {intact}")
+        finally:
+            api.close()
+
+
+LEGACY_PLAYLIST_STATS = """
+    SELECT p.playlist_name, p.total_tracks,
+        CASE WHEN p.total_tracks > 0 THEN ROUND(p.total_popularity / p.total_tracks, 1) ELSE 0 END as avg_popularity,
+        (SELECT GROUP_CONCAT(DISTINCT g.name ORDER BY g.name SEPARATOR ', ')
+         FROM custom_playlist_tracks cpt
+         JOIN artist_genres ag ON cpt.track_id = ag.track_id
+         JOIN genres g ON g.id = ag.genre_id
+         WHERE cpt.playlist_id = p.id) as all_genres,
+        p.created_at
+    FROM custom_playlists p ORDER BY p.created_at DESC, p.id DESC LIMIT %s
+"""
+
+
+def bench_analytics(args):
+    """Dashboard queries on a seeded MySQL database: correlated GROUP_CONCAT vs playlist_genre_summary"""
+    os.environ["DB_NAME"] = args.database  # read when the pool is created
+    import db_pool
+    from nn_index import TrackIndex
+
+    rng = random.Random(11)
+    with tempfile.TemporaryDirectory() as tmp:
+        api = SpotifyAPI(sp=spotipy.Spotify(auth="unused"), track_index=TrackIndex(os.path.join(tmp, "index.npz")))
+        with db_pool.transaction() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM custom_playlists")
+            existing = cursor.fetchone()[0]
+        if existing < args.playlists:
+            start = time.perf_counter()
+            tracks = [{
+                "id": spotify_id("track", i), "track_name": f"Track {i}", "artist": f"Artist {i % 2000}",
+                "album": f"Album {i // 12}", "release_date": str(1970 + i % 55),
+                "artist_genres": rng.sample(GENRE_POOL, 3), "popularity": rng.randrange(100)
+            } for i in range(args.tracks)]
+            with contextlib.redirect_stdout(io.StringIO()):
+                for i in range(0, len(tracks), 500):
+                    api.store_tracks_batch(tracks[i:i + 500])
+                pending = []
+                for p in range(existing, args.playlists):
+                    picks = rng.sample(tracks, args.tracks_per_playlist)
+                    pending.append(({"playlist_name": f"Playlist {p}", "description": "bench", "tracks": [{
+                        "track_id": t["id"], "track_name": t["track_name"], "artist": t["artist"],
+                        "album": t["album"], "position": position
+                    } for position, t in enumerate(picks, 1)]}, "bench"))
+                    if len(pending) == 500:
+                        api.store_custom_playlists(pending)
+                        pending = []
+                api.store_custom_playlists(pending)
+            print(f"Seeded {args.playlists - existing} playlists in {time.perf_counter() - start:.1f}s")
+        api.close()
+
+    def timed(fn, repeat=args.repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result = fn()
+        return (time.perf_counter() - start) * 1000 / repeat, result
+
+    def legacy():
+        with db_pool.transaction() as cursor:
+            cursor.execute(LEGACY_PLAYLIST_STATS, (args.limit,))
+            return cursor.fetchall()
+
+    legacy_ms, legacy_rows = timed(legacy)
+    summary_ms, summary_rows = timed(lambda: api.get_user_playlist_stats(limit=args.limit))
+    detail_ms, _ = timed(lambda: api.get_enhanced_playlist_analysis(args.playlists // 2))
+    same = [row[3] or "" for row in legacy_rows] == [row["all_genres"] for row in summary_rows]
+    print(f"{args.playlists} playlists x {args.tracks_per_playlist} tracks, top {args.limit}:")
+    print(f"  correlated GROUP_CONCAT + sort: {legacy_ms:8.1f}ms")
+    print(f"  GetUserPlaylistStats (summary): {summary_ms:8.1f}ms  same genres: {same}")
+    print(f"  GetEnhancedPlaylistAnalysis:    {detail_ms:8.1f}ms")
+
+
+# The reads and writes link.py issues, in a form valid on both the pre-tuning and the migrated schema
+SCHEMA_QUERIES = [
+    ("load tracks by id", """
+        SELECT id, track_name, artist, album, release_date, popularity
+        FROM tracks WHERE id IN ({ids})"""),
+    ("playlist tracks in order", """
+        SELECT track_id, track_name, artist, album, position
+        FROM custom_playlist_tracks WHERE playlist_id = %s ORDER BY position"""),
+    ("playlists holding tracks", """
+        SELECT DISTINCT playlist_id FROM custom_playlist_tracks WHERE track_id IN ({ids})"""),
+    ("recent track requests", """
+        SELECT COUNT(*), MAX(requested_at) FROM track_history
+        WHERE track_id = %s AND requested_at >= NOW() - INTERVAL 30 DAY"""),
+]
+
+
+def bench_schema(args):
+    """Query plans and latencies on the pre-tuning schema vs after migrate.py, on the same seeded data"""
+    os.environ["DB_NAME"] = args.database  # read when the pool is created
+    import db_pool
+    from migrate import migrate
+
+    rng = random.Random(23)
+    with db_pool.transaction() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = DATABASE()")
+        if cursor.fetchone()[0]:
+            print(f"❌ {args.database} is not empty; the schema bench builds its own schema")
+            return
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        migrate(target=1)
+
+    start = time.perf_counter()
+    track_ids = [spotify_id("track", i) for i in range(args.tracks)]
+    with db_pool.transaction() as cursor:
+        cursor.executemany("INSERT INTO genres (name) VALUES (%s)", [(g,) for g in GENRE_POOL])
+        for i in range(0, args.tracks, 1000):
+            cursor.executemany(
+                "INSERT INTO tracks (id, track_name, artist, album, release_date, popularity) VALUES (%s, %s, %s, %s, %s, %s)",
+                [(t, f"Track {n}", f"Artist {n % 2000}", f"Album {n // 12}",
+                  f"{1970 + n % 55}-01-01", rng.randrange(100)) for n, t in enumerate(track_ids[i:i + 1000], i)])
+            cursor.executemany(
+                "INSERT INTO artist_genres (track_id, genre_id) VALUES (%s, %s)",
+                [(t, g) for t in track_ids[i:i + 1000] for g in rng.sample(range(1, len(GENRE_POOL) + 1), 3)])
+            cursor.executemany(
+                "INSERT INTO track_history (track_id, requested_at) VALUES (%s, NOW() - INTERVAL %s HOUR)",
+                [(rng.choice(track_ids), rng.randrange(24 * 90)) for _ in range(4000)])
+        cursor.executemany(
+            "INSERT INTO custom_playlists (playlist_name, description, mood_description) VALUES (%s, 'bench', 'bench')",
+            [(f"Playlist {p}",) for p in range(args.playlists)])
+        for p in range(1, args.playlists + 1):
+            cursor.executemany(
+                "INSERT INTO custom_playlist_tracks (playlist_id, track_id, track_name, artist, album, position) "
+                "VALUES (%s, %s, %s, %s, %s, %s)",
+                [(p, t, "Track", "Artist", "Album", position)
+                 for position, t in enumerate(rng.sample(track_ids, args.tracks_per_playlist), 1)])
+    print(f"Seeded {args.tracks} tracks, {args.tracks * 4} history rows, {args.playlists} playlists "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    def params(name):
+        if name == "load tracks by id":
+            return rng.sample(track_ids, 500)
+        if name == "playlists holding tracks":
+            return rng.sample(track_ids, 50)
+        if name == "playlist tracks in order":
+            return [rng.randrange(1, args.playlists + 1)]
+        return [rng.choice(track_ids)]
+
+    def measure(label):
+        results = {}
+        with db_pool.transaction() as cursor:
+            for table in ("tracks", "artist_genres", "track_history", "custom_playlist_tracks"):
+                cursor.execute(f"ANALYZE TABLE {table}")
+                cursor.fetchall()
+            print(f"\n{label}:")
+            for name, sql in SCHEMA_QUERIES:
+                sample = params(name)
+                sql = sql.format(ids=", ".join(["%s"] * len(sample)))
+                cursor.execute("EXPLAIN " + sql, sample)
+                columns = [col[0] for col in cursor.description]
+                plan = dict(zip(columns, cursor.fetchall()[0]))
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    cursor.execute(sql, params(name))
+                    cursor.fetchall()
+                ms = (time.perf_counter() - start) * 1000 / args.repeat
+                results[name] = ms
+                print(f"  {name:<26} {ms:7.2f}ms  type={plan['type']} key={plan['key']} "
+                      f"rows={plan['rows']} {plan['Extra'] or ''}")
+
+            upserts = [(t, f"Track {t}", "Artist", "Album", "1999-01-01", 50) for t in rng.sample(track_ids, 500)]
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                cursor.executemany("""
+                    INSERT INTO tracks (id, track_name, artist, album, release_date, popularity)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE track_name = VALUES(track_name), popularity = VALUES(popularity)
+                """, upserts)
+            results["upsert 500 tracks"] = (time.perf_counter() - start) * 1000 / args.repeat
+            print(f"  {'upsert 500 tracks':<26} {results['upsert 500 tracks']:7.2f}ms")
+
+            cursor.execute("""
+                SELECT table_name, data_length + index_length FROM information_schema.tables
+                WHERE table_schema = DATABASE() AND table_name IN ('tracks', 'artist_genres', 'track_history', 'custom_playlist_tracks')
+                ORDER BY table_name
+            """)
+            print("  size: " + ", ".join(f"{table} {size / 1e6:.1f}MB" for table, size in cursor.fetchall()))
+        return results
+
+    before = measure("pre-tuning schema (0001)")
+    with contextlib.redirect_stdout(io.StringIO()):
+        migrate()
+    after = measure("migrated schema")
+    print("\nspeedup after migration:")
+    for name in before:
+        print(f"  {name:<26} {before[name] / after[name]:5.1f}x")
+
+
+RAW_TOP_TRACKS = """
+    SELECT track_id, COUNT(*) AS requests FROM track_history
+    WHERE requested_at >= CURRENT_DATE - INTERVAL 6 DAY  -- the same days as the rollup query
+    GROUP BY track_id ORDER BY requests DESC, track_id LIMIT 10
+"""
+
+
+def bench_history(args):
+    """Ingest cost per TRACK_HISTORY_MODE and "most requested this week" from raw history vs the rollup"""
+    os.environ["DB_NAME"] = args.database  # read when the pool is created
+    import db_pool
+
+    rng = random.Random(24)
+    tracks = [{
+        "id": spotify_id("track", i), "track_name": f"Track {i}", "artist": f"Artist {i % 500}",
+        "album": f"Album {i // 12}", "release_date": "2001-05-04",
+        "artist_genres": rng.sample(GENRE_POOL, 2), "popularity": rng.randrange(100)
+    } for i in range(args.tracks)]
+    print(f"{args.batches} ingests of {args.batch_size} tracks drawn from {args.tracks}:")
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("full", "rollup", "off"):
+            api = SpotifyAPI(sp=spotipy.Spotify(auth="unused"), history_mode=mode,
+                             track_index=TrackIndex(os.path.join(tmp, f"{mode}.npz")))
+            batches = [rng.sample(tracks, args.batch_size) for _ in range(args.batches)]
+            with db_pool.transaction() as cursor:
+                cursor.execute("SELECT COUNT(*) FROM track_history")
+                history_before = cursor.fetchone()[0]
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                for batch in batches:
+                    api.store_tracks_batch(batch)
+            elapsed = (time.perf_counter() - start) * 1000 / args.batches
+            with db_pool.transaction() as cursor:
+                cursor.execute("SELECT COUNT(*) FROM track_history")
+                history_rows = cursor.fetchone()[0] - history_before
+            api.close()
+            print(f"  {mode:>6}: {elapsed:7.1f}ms per ingest, {history_rows} history rows written")
+
+    def timed(fn):
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            result = fn()
+        return (time.perf_counter() - start) * 1000 / args.repeat, result
+
+    def raw():
+        with db_pool.transaction() as cursor:
+            cursor.execute(RAW_TOP_TRACKS)
+            return cursor.fetchall()
+
+    raw_ms, _ = timed(raw)
+    rollup_ms, _ = timed(lambda: api.get_top_requested_tracks(days=7, limit=10))
+    with db_pool.transaction() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM track_history")
+        history = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*) FROM track_request_daily")
+        daily = cursor.fetchone()[0]
+    print(f"Top 10 this week ({history} history rows, {daily} rollup rows):")
+    print(f"  GROUP BY track_history:          {raw_ms:8.1f}ms")
+    print(f"  get_top_requested_tracks:        {rollup_ms:8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    fetch = sub.add_parser("fetch", help="serial vs concurrent page and artist-batch fetching")
+    fetch.add_argument("--workers", type=lambda v: [int(w) for w in v.split(",")], default=[1, 4, 8])
+    fetch.add_argument("--latency", type=float, default=0.05, help="seconds per mock request")
+    fetch.add_argument("--playlists", type=int, default=200)
+    fetch.add_argument("--tracks", type=int, default=2000)
+    fetch.add_argument("--artists", type=int, default=400)
+    fetch.set_defaults(func=bench_fetch)
+
+    ratelimit = sub.add_parser("ratelimit", help="scheduler behaviour against a server that returns 429s")
+    ratelimit.add_argument("--server-limit", type=int, default=20, help="mock requests per second")
+    ratelimit.add_argument("--rates", type=lambda v: [float(r) for r in v.split(",")], default=[1000, 40, 18])
+    ratelimit.add_argument("--workers", type=int, default=8)
+    ratelimit.add_argument("--latency", type=float, default=0.01)
+    ratelimit.add_argument("--tracks", type=int, default=3000)
+    ratelimit.add_argument("--artists", type=int, default=1500)
+    ratelimit.set_defaults(func=bench_ratelimit)
+
+    genres = sub.add_parser("genres", help="artist_genres rows written per re-ingest, before vs after")
+    genres.add_argument("--tracks", type=int, default=10000)
+    genres.add_argument("--genres-per-track", type=int, default=3)
+    genres.add_argument("--churn", type=float, default=0.02, help="share of tracks whose genres changed")
+    genres.set_defaults(func=bench_genres)
+
+    match = sub.add_parser("match", help="nested-loop vs indexed matching of LLM selections to candidates")
+    match.add_argument("--candidates", type=int, default=10000)
+    match.add_argument("--selections", type=int, default=500)
+    match.set_defaults(func=bench_match)
+
+    llm = sub.add_parser("llm", help="sequential vs concurrent multi-mood generation on the offline backend")
+    llm.add_argument("--moods", type=int, default=16)
+    llm.add_argument("--concurrency", type=lambda v: [int(c) for c in v.split(",")], default=[1, 4, 8])
+    llm.add_argument("--latency", type=float, default=0.5, help="seconds to first token")
+    llm.add_argument("--tps", type=float, default=0, help="output tokens per second (0 = instant)")
+    llm.add_argument("--truncate", type=float, default=0, help="share of replies cut short")
+    llm.add_argument("--malformed", type=float, default=0, help="share of replies without JSON")
+    llm.add_argument("--tracks", type=int, default=5000)
+    llm.set_defaults(func=bench_llm)
+
+    curate = sub.add_parser("curate", help="local curator vs first-N fallback")
+    curate.add_argument("--tracks", type=int, default=10000)
+    curate.add_argument("--max-tracks", type=int, default=20)
+    curate.set_defaults(func=bench_curate)
+
+    features = sub.add_parser("features", help="batched audio-feature fetching and mood scoring")
+    features.add_argument("--tracks", type=int, default=2000)
+    features.add_argument("--latency", type=float, default=0.02)
+    features.add_argument("--deprecated", action="store_true", help="mock answers 403 like Spotify does for new apps")
+    features.set_defaults(func=bench_features)
+
+    nn = sub.add_parser("nn", help="track index build, query latency and recall")
+    nn.add_argument("--tracks", type=int, default=50000)
+    nn.add_argument("--queries", type=int, default=200)
+    nn.add_argument("--k", type=int, default=50)
+    nn.set_defaults(func=bench_nn)
+
+    publish = sub.add_parser("publish", help="chunked, ordered and resumable playlist publishing")
+    publish.add_argument("--playlists", type=int, default=20)
+    publish.add_argument("--tracks", type=int, default=1000)
+    publish.add_argument("--concurrency", type=lambda v: [int(c) for c in v.split(",")], default=[1, 4])
+    publish.add_argument("--latency", type=float, default=0.02)
+    publish.set_defaults(func=bench_publish)
+
+    analytics = sub.add_parser("analytics", help="analytics dashboard queries on a seeded MySQL database")
+    analytics.add_argument("--database", required=True, help="scratch database already holding db.sql's schema")
+    analytics.add_argument("--playlists", type=int, default=5000)
+    analytics.add_argument("--tracks", type=int, default=20000)
+    analytics.add_argument("--tracks-per-playlist", type=int, default=20)
+    analytics.add_argument("--limit", type=int, default=10)
+    analytics.add_argument("--repeat", type=int, default=5)
+    analytics.set_defaults(func=bench_analytics)
+
+    history = sub.add_parser("history", help="track history modes and rollup vs raw trend queries (MySQL)")
+    history.add_argument("--database", required=True, help="scratch database already holding db.sql's schema")
+    history.add_argument("--tracks", type=int, default=20000)
+    history.add_argument("--batches", type=int, default=40)
+    history.add_argument("--batch-size", type=int, default=500)
+    history.add_argument("--repeat", type=int, default=5)
+    history.set_defaults(func=bench_history)
+
+    schema = sub.add_parser("schema", help="query plans and latencies before and after the schema migrations")
+    schema.add_argument("--database", required=True, help="empty scratch database")
+    schema.add_argument("--tracks", type=int, default=50000)
+    schema.add_argument("--playlists", type=int, default=2000)
+    schema.add_argument("--tracks-per-playlist", type=int, default=50)
+    schema.add_argument("--repeat", type=int, default=20)
+    schema.set_defaults(func=bench_schema)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
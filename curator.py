@@ -0,0 +1,178 @@
+import os
+import numpy as np
+from audio_features import FeatureStore
+from genre_index import GenreIndex
+from ranking import OBSCURE_WORDS, POPULAR_WORDS, STOPWORDS, TOKEN_RE, era_bonus, release_year
+
+# Most tracks one artist may contribute to a playlist
+CURATOR_MAX_PER_ARTIST = int(os.getenv('CURATOR_MAX_PER_ARTIST', '2'))
+# Score given up for each earlier pick sharing a track's primary genre
+GENRE_REPEAT_PENALTY = 0.15
+# Weight of audio-feature closeness (0..1) relative to the genre score
+FEATURE_WEIGHT = 1.5
+# Best-scoring tracks considered for the diverse pick, per requested track
+SHORTLIST_FACTOR = 10
+
+# Mood words -> genre phrases that usually fit them
+MOOD_LEXICON = {
+    "chill": ["lo fi", "chill", "ambient", "downtempo", "acoustic", "jazz", "soul", "bossa nova", "trip hop"],
+    "relax": ["lo fi", "ambient", "acoustic", "jazz", "soul", "bossa nova", "new age"],
+    "calm": ["ambient", "classical", "piano", "acoustic", "new age"],
+    "study": ["lo fi", "ambient", "classical", "instrumental", "piano", "post rock"],
+    "focus": ["lo fi", "ambient", "classical", "instrumental", "minimal", "post rock"],
+    "coding": ["lo fi", "electronic", "synthwave", "ambient", "techno", "instrumental"],
+    "sleep": ["ambient", "classical", "piano", "new age", "drone"],
+    "workout": ["edm", "house", "hip hop", "rap", "metal", "techno", "trap", "drum and bass", "dance"],
+    "gym": ["edm", "hip hop", "rap", "metal", "trap", "drum and bass"],
+    "running": ["edm", "house", "dance", "drum and bass", "pop", "techno"],
+    "energetic": ["edm", "dance", "punk", "rock", "drum and bass", "house"],
+    "party": ["dance", "pop", "house", "edm", "hip hop", "reggaeton", "disco", "funk"],
+    "dance": ["dance", "house", "disco", "edm", "funk", "techno"],
+    "happy": ["pop", "funk", "disco", "reggae", "soul", "indie pop"],
+    "upbeat": ["pop", "funk", "disco", "dance", "indie pop"],
+    "sad": ["singer songwriter", "folk", "indie", "emo", "acoustic", "slowcore"],
+    "melancholy": ["singer songwriter", "folk", "indie", "shoegaze", "slowcore"],
+    "romantic": ["r b", "soul", "jazz", "ballad", "bossa nova", "neo soul"],
+    "love": ["r b", "soul", "ballad", "neo soul"],
+    "angry": ["metal", "punk", "hardcore", "grunge"],
+    "road": ["rock", "classic rock", "indie", "country", "americana"],
+    "summer": ["pop", "reggae", "reggaeton", "tropical", "house", "surf"],
+    "rainy": ["lo fi", "jazz", "indie", "acoustic", "trip hop"],
+    "morning": ["acoustic", "indie folk", "folk", "pop", "soul"],
+    "night": ["synthwave", "r b", "trip hop", "jazz", "deep house"],
+    "dinner": ["jazz", "soul", "bossa nova", "lounge"],
+    "throwback": ["classic rock", "disco", "funk", "soul", "new wave"],
+}
+
+def phrase(text):
+    """Space-joined lowercase words, for whole-word substring matching"""
+    return " " + " ".join(TOKEN_RE.findall((text or "").lower())) + " "
+
+class LocalCurator:
+    """Builds playlists from the mood text alone, without an LLM.
+
+    Tracks are scored on genres named by the mood or implied by MOOD_LEXICON,
+    audio features (when the records carry them), era hints, popularity
+    words and a popularity prior. The pick is greedy
+    over a shortlist with a per-artist cap and a penalty on repeated primary
+    genres, then ordered so neighbouring tracks share genres and era. All
+    steps are deterministic.
+    """
+
+    def __init__(self, tracks, genre_index=None, max_per_artist=CURATOR_MAX_PER_ARTIST):
+        self.tracks = tracks
+        self.max_per_artist = max_per_artist
+        self.genre_index = genre_index if genre_index is not None else GenreIndex(tracks)
+        self.genre_phrases = {genre: phrase(genre) for genre in self.genre_index.genres}
+        genre_counts = np.unpackbits(self.genre_index.bits.view(np.uint8), axis=1).sum(axis=1)
+        self.genre_norms = np.sqrt(np.maximum(genre_counts, 1)).astype(np.float32)
+        self.popularity = np.array([t.get('popularity') or 0 for t in tracks], dtype=np.float32) / 100
+        self.years = np.array([release_year(t.get('release_date')) or 0 for t in tracks], dtype=np.int32)
+        has_features = any(t.get('audio_features') for t in tracks)
+        self.features = FeatureStore.from_tracks(tracks) if has_features else None
+
+    def _genres_matching(self, phrases):
+        return [genre for genre, text in self.genre_phrases.items() if any(p in text for p in phrases)]
+
+    def score(self, mood_description):
+        """Relevance of every track to the mood, higher is better"""
+        if not self.tracks:
+            return np.zeros(0, dtype=np.float32)
+        words = [w for w in TOKEN_RE.findall((mood_description or "").lower()) if w not in STOPWORDS]
+        # Single words and word pairs, so "hip hop" or "lo-fi" match as a whole
+        direct = self._genres_matching({phrase(w) for w in words} |
+                                       {phrase(f"{a} {b}") for a, b in zip(words, words[1:])})
+        # "relaxing" -> "relax" -> ambient, jazz, ...
+        implied = self._genres_matching({phrase(genre) for w in words for key, genres in MOOD_LEXICON.items()
+                                         if w.startswith(key) for genre in genres})
+
+        scores = (2.0 * self.genre_index.match_count(direct)
+                  + 1.0 * self.genre_index.match_count(implied)) / self.genre_norms
+        scores = scores.astype(np.float32) + era_bonus(mood_description, self.years)
+        if self.features is not None:
+            scores += FEATURE_WEIGHT * self.features.score(mood_description)
+
+        word_set = set(words)
+        if word_set & POPULAR_WORDS:
+            scores += self.popularity
+        if word_set & OBSCURE_WORDS:
+            scores += 1 - self.popularity
+        # Without an LLM judging quality, lean a little towards well-known tracks
+        return scores + 0.1 * self.popularity
+
+    def select(self, mood_description, n):
+        """Rows of n diverse, high-scoring tracks (in pick order)"""
+        scores = self.score(mood_description)
+        order = np.lexsort((np.arange(len(scores)), -scores))
+        shortlist = [int(row) for row in order[:max(n * SHORTLIST_FACTOR, 200)]]
+
+        picked = []
+        artist_counts = {}
+        genre_counts = {}
+        for _ in range(n):
+            best = None
+            best_value = None
+            for row in shortlist:
+                track = self.tracks[row]
+                if artist_counts.get(track.get('artist'), 0) >= self.max_per_artist:
+                    continue
+                value = scores[row] - GENRE_REPEAT_PENALTY * genre_counts.get(self._primary_genre(row), 0)
+                if best_value is None or value > best_value:
+                    best, best_value = row, value
+            if best is None:
+                break
+            picked.append(best)
+            shortlist.remove(best)
+            artist = self.tracks[best].get('artist')
+            artist_counts[artist] = artist_counts.get(artist, 0) + 1
+            genre = self._primary_genre(best)
+            genre_counts[genre] = genre_counts.get(genre, 0) + 1
+
+        # Too few artists to honour the cap: top up with the best of the rest
+        if len(picked) < n:
+            picked.extend(shortlist[:n - len(picked)])
+        return picked
+
+    def order(self, rows):
+        """Chain the picks so each track flows from the previous one"""
+        if not rows:
+            return []
+        remaining = list(rows)
+        ordered = [remaining.pop(0)]
+        while remaining:
+            previous = ordered[-1]
+            best = max(remaining, key=lambda row: (self._similarity(previous, row), -remaining.index(row)))
+            ordered.append(best)
+            remaining.remove(best)
+        return ordered
+
+    def curate(self, mood_description, playlist_name=None, max_tracks=10):
+        """A playlist dict in the same shape LLMHandler returns"""
+        rows = self.order(self.select(mood_description, max_tracks))
+        return {
+            "playlist_name": playlist_name or f"{mood_description.title()} Mix",
+            "description": f"A {mood_description} playlist curated for you",
+            "tracks": [{
+                "track_name": self.tracks[row].get('track_name', 'Unknown'),
+                "artist": self.tracks[row].get('artist', 'Unknown Artist'),
+                "album": self.tracks[row].get('album', 'Unknown Album'),
+                "position": position,
+                "track_id": self.tracks[row].get('id')
+            } for position, row in enumerate(rows, 1)]
+        }
+
+    def _primary_genre(self, row):
+        genres = self.tracks[row].get('artist_genres') or []
+        return genres[0] if genres else ''
+
+    def _similarity(self, a, b):
+        genres_a = set(self.tracks[a].get('artist_genres') or [])
+        genres_b = set(self.tracks[b].get('artist_genres') or [])
+        union = genres_a | genres_b
+        similarity = len(genres_a & genres_b) / len(union) if union else 0.0
+        if self.years[a] and self.years[b]:
+            similarity += 0.5 * max(0.0, 1 - abs(int(self.years[a]) - int(self.years[b])) / 30)
+        similarity += 0.3 * (1 - abs(float(self.popularity[a]) - float(self.popularity[b])))
+        if self.tracks[a].get('artist') == self.tracks[b].get('artist'):
+            similarity -= 1.0  # never back-to-back when avoidable
+        return similarity
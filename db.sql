@@ -3,28 +3,100 @@ CREATE DATABASE spotify_tracks;
 USE spotify_tracks;
 
 -- 1. Base Tables
+-- Spotify IDs are 22 case-sensitive base62 characters: CHAR(22) ASCII with a binary collation
 CREATE TABLE tracks (
-    id VARCHAR(255) PRIMARY KEY,
+    id CHAR(22) CHARACTER SET ascii COLLATE ascii_bin PRIMARY KEY,
     track_name VARCHAR(255) NOT NULL,
     artist VARCHAR(255) NOT NULL,
     album VARCHAR(255) NOT NULL,
-    release_date VARCHAR(10),
+    release_date DATE,
+    release_date_precision ENUM('year', 'month', 'day'),  -- what Spotify actually gave; NULL = unknown
     popularity INT DEFAULT 0,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
 );
 
-CREATE TABLE artist_genres (
+-- Artist-level genre cache, refreshed once fetched_at is older than the TTL
+CREATE TABLE artists (
+    id CHAR(22) CHARACTER SET ascii COLLATE ascii_bin PRIMARY KEY,
+    genres JSON NOT NULL,
+    fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Spotify audio features, fetched 100 tracks per /audio-features call
+CREATE TABLE track_features (
+    track_id CHAR(22) CHARACTER SET ascii COLLATE ascii_bin PRIMARY KEY,
+    energy FLOAT,
+    valence FLOAT,
+    tempo FLOAT,
+    danceability FLOAT,
+    acousticness FLOAT,
+    instrumentalness FLOAT,
+    fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Interned genre names; tracks reference them by integer ID
+CREATE TABLE genres (
     id INT AUTO_INCREMENT PRIMARY KEY,
-    track_id VARCHAR(255),
-    genre VARCHAR(100),
-    FOREIGN KEY (track_id) REFERENCES tracks(id) ON DELETE CASCADE
+    name VARCHAR(100) COLLATE utf8mb4_bin NOT NULL UNIQUE
 );
 
+CREATE TABLE artist_genres (
+    track_id CHAR(22) CHARACTER SET ascii COLLATE ascii_bin,
+    genre_id INT NOT NULL,
+    PRIMARY KEY (track_id, genre_id),
+    FOREIGN KEY (track_id) REFERENCES tracks(id) ON DELETE CASCADE,
+    FOREIGN KEY (genre_id) REFERENCES genres(id)
+);
+
+-- One row per track per ingest (TRACK_HISTORY_MODE=full), in monthly partitions that
+-- MaintainTrackHistory adds and expires. Partitioned tables cannot have foreign keys.
 CREATE TABLE track_history (
-    id INT AUTO_INCREMENT PRIMARY KEY,
-    track_id VARCHAR(255),
-    requested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    id BIGINT AUTO_INCREMENT,
+    track_id CHAR(22) CHARACTER SET ascii COLLATE ascii_bin,
+    requested_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, requested_at),  -- the partitioning column must be part of every unique key
+    INDEX idx_history_track_time (track_id, requested_at)
+)
+PARTITION BY RANGE (UNIX_TIMESTAMP(requested_at)) (
+    PARTITION pmax VALUES LESS THAN MAXVALUE
+);
+
+-- Requests per track and day, for trend queries (TRACK_HISTORY_MODE=full or rollup)
+CREATE TABLE track_request_daily (
+    day DATE,
+    track_id CHAR(22) CHARACTER SET ascii COLLATE ascii_bin,
+    request_count INT NOT NULL,
+    PRIMARY KEY (day, track_id),                        -- "most requested since" scans a day range
+    INDEX idx_daily_track_day (track_id, day)           -- one track's trend
+);
+
+-- Retention the daily event applies, one row; SpotifyAPI.maintain_track_history writes
+-- TRACK_HISTORY_RETENTION_DAYS / TRACK_ROLLUP_RETENTION_DAYS here
+CREATE TABLE track_history_settings (
+    id TINYINT PRIMARY KEY DEFAULT 1,
+    retention_days INT NOT NULL,
+    months_ahead INT NOT NULL,
+    rollup_retention_days INT NOT NULL,
+    CHECK (id = 1)
+);
+
+INSERT INTO track_history_settings (id, retention_days, months_ahead, rollup_retention_days) VALUES (1, 90, 2, 730);
+
+-- Source playlists: last synced snapshot and track membership in playlist order
+CREATE TABLE playlist_snapshots (
+    playlist_id CHAR(22) CHARACTER SET ascii COLLATE ascii_bin PRIMARY KEY,
+    snapshot_id VARCHAR(255) NOT NULL,
+    synced_tracks INT DEFAULT 0,
+    is_complete BOOLEAN DEFAULT FALSE,
+    synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+CREATE TABLE playlist_source_tracks (
+    playlist_id CHAR(22) CHARACTER SET ascii COLLATE ascii_bin,
+    position INT,
+    track_id CHAR(22) CHARACTER SET ascii COLLATE ascii_bin NOT NULL,
+    PRIMARY KEY (playlist_id, position),
     FOREIGN KEY (track_id) REFERENCES tracks(id) ON DELETE CASCADE
 );
 
@@ -42,61 +114,188 @@ CREATE TABLE custom_playlists (
 CREATE TABLE custom_playlist_tracks (
     id INT AUTO_INCREMENT PRIMARY KEY,
     playlist_id INT,
-    track_id VARCHAR(255),
+    track_id CHAR(22) CHARACTER SET ascii COLLATE ascii_bin,
     track_name VARCHAR(255) NOT NULL,
     artist VARCHAR(255) NOT NULL,
     album VARCHAR(255) NOT NULL,
     position INT,
+    popularity INT DEFAULT 0,        -- Track popularity when added; total_popularity is the sum of these
+    INDEX idx_cpt_playlist_position (playlist_id, position),  -- ordered reads and deletes by position
+    INDEX idx_cpt_track_playlist (track_id, playlist_id),     -- playlists holding a track
     FOREIGN KEY (playlist_id) REFERENCES custom_playlists(id) ON DELETE CASCADE,
     FOREIGN KEY (track_id) REFERENCES tracks(id) ON DELETE SET NULL
 );
 
+-- Genres of each custom playlist with how many of its tracks carry them, kept current by
+-- the application on track adds/removes and artist_genres changes (read by the analytics)
+CREATE TABLE playlist_genre_summary (
+    playlist_id INT,
+    genre_id INT,
+    track_count INT NOT NULL,
+    PRIMARY KEY (playlist_id, genre_id),
+    FOREIGN KEY (playlist_id) REFERENCES custom_playlists(id) ON DELETE CASCADE,
+    FOREIGN KEY (genre_id) REFERENCES genres(id)
+);
+
+-- Progress of publishing a custom playlist to Spotify, so an interrupted publish resumes
+CREATE TABLE spotify_publish_jobs (
+    custom_playlist_id INT PRIMARY KEY,
+    spotify_playlist_id CHAR(22) CHARACTER SET ascii COLLATE ascii_bin NOT NULL,
+    total_tracks INT DEFAULT 0,
+    published_tracks INT DEFAULT 0,
+    is_complete BOOLEAN DEFAULT FALSE,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (custom_playlist_id) REFERENCES custom_playlists(id) ON DELETE CASCADE
+);
+
+-- Parsed LLM playlists keyed by a hash of the generation inputs (LLM_CACHE_BACKEND=mysql)
+CREATE TABLE llm_playlist_cache (
+    cache_key CHAR(64) PRIMARY KEY,
+    playlist JSON NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_llm_cache_used (last_used_at)
+);
+
+-- Applied versions of migrations/ (see migrate.py); this file is the schema after all of them
+CREATE TABLE schema_migrations (
+    version INT PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+INSERT INTO schema_migrations (version, name) VALUES
+    (0, 'baseline'),
+    (1, 'genre_ids_and_summaries'),
+    (2, 'tune_ids_dates_indexes'),
+    (3, 'partition_track_history');
+
 -- 3. Indexes
-CREATE INDEX idx_track_name ON tracks(track_name);
-CREATE INDEX idx_genre ON artist_genres(genre);
+-- artist_genres' primary key (track_id, genre_id) serves the per-track lookups
+CREATE INDEX idx_genre ON artist_genres(genre_id);
 CREATE INDEX idx_cp_created ON custom_playlists(created_at);
 
--- 4. Triggers (The Magic Engine)
+-- 4. Stats maintenance
+-- The application keeps total_tracks / total_popularity exact with one aggregate
+-- write per batch (no per-row triggers). This recomputes them set-based, for one
+-- playlist or all of them (NULL), e.g. after manual edits or when a check finds drift.
 DELIMITER //
+CREATE PROCEDURE RecomputePlaylistStats(IN p_playlist_id INT)
+BEGIN
+    UPDATE custom_playlists p
+    LEFT JOIN (
+        SELECT playlist_id, COUNT(*) AS track_count, SUM(popularity) AS popularity_sum
+        FROM custom_playlist_tracks
+        WHERE p_playlist_id IS NULL OR playlist_id = p_playlist_id
+        GROUP BY playlist_id
+    ) s ON s.playlist_id = p.id
+    SET p.total_tracks = IFNULL(s.track_count, 0),
+        p.total_popularity = IFNULL(s.popularity_sum, 0)
+    WHERE p_playlist_id IS NULL OR p.id = p_playlist_id;
+END //
 
--- Updates stats automatically when tracks are added
-CREATE TRIGGER update_playlist_stats_insert 
-AFTER INSERT ON custom_playlist_tracks 
-FOR EACH ROW 
+-- Rebuilds playlist_genre_summary from the base tables (one playlist, or all with NULL)
+CREATE PROCEDURE RebuildPlaylistGenreSummary(IN p_playlist_id INT)
 BEGIN
-    DECLARE track_pop INT;
-    SELECT IFNULL(popularity, 0) INTO track_pop FROM tracks WHERE id = NEW.track_id;
-    
-    UPDATE custom_playlists 
-    SET total_tracks = total_tracks + 1,
-        total_popularity = total_popularity + track_pop
-    WHERE id = NEW.playlist_id;
+    DELETE FROM playlist_genre_summary WHERE p_playlist_id IS NULL OR playlist_id = p_playlist_id;
+    INSERT INTO playlist_genre_summary (playlist_id, genre_id, track_count)
+    SELECT cpt.playlist_id, ag.genre_id, COUNT(*)
+    FROM custom_playlist_tracks cpt
+    JOIN artist_genres ag ON ag.track_id = cpt.track_id
+    WHERE p_playlist_id IS NULL OR cpt.playlist_id = p_playlist_id
+    GROUP BY cpt.playlist_id, ag.genre_id;
 END //
+DELIMITER ;
 
--- Updates stats automatically when tracks are deleted
-CREATE TRIGGER update_playlist_stats_delete
-AFTER DELETE ON custom_playlist_tracks
-FOR EACH ROW
+-- 5. History retention
+-- Splits pmax into monthly partitions from p_from's month through p_to's month
+-- (months already covered by an existing partition are skipped)
+DELIMITER //
+CREATE PROCEDURE AddTrackHistoryPartitions(IN p_from DATE, IN p_to DATE)
 BEGIN
-    DECLARE track_pop INT;
-    SELECT IFNULL(popularity, 0) INTO track_pop FROM tracks WHERE id = OLD.track_id;
-    
-    UPDATE custom_playlists 
-    SET total_tracks = GREATEST(0, total_tracks - 1),
-        total_popularity = GREATEST(0, total_popularity - track_pop)
-    WHERE id = OLD.playlist_id;
+    DECLARE v_month DATE DEFAULT DATE_FORMAT(p_from, '%Y-%m-01');
+    DECLARE v_last_month DATE DEFAULT DATE_FORMAT(p_to, '%Y-%m-01');
+    DECLARE v_highest BIGINT;
+    DECLARE v_bound BIGINT;
+
+    SELECT MAX(CAST(PARTITION_DESCRIPTION AS UNSIGNED)) INTO v_highest
+    FROM information_schema.partitions
+    WHERE table_schema = DATABASE() AND table_name = 'track_history' AND PARTITION_DESCRIPTION <> 'MAXVALUE';
+
+    WHILE v_month <= v_last_month DO
+        SET v_bound = UNIX_TIMESTAMP(v_month + INTERVAL 1 MONTH);
+        IF v_highest IS NULL OR v_bound > v_highest THEN
+            SET @ddl = CONCAT('ALTER TABLE track_history REORGANIZE PARTITION pmax INTO (',
+                              'PARTITION p', DATE_FORMAT(v_month, '%Y%m'), ' VALUES LESS THAN (', v_bound, '), ',
+                              'PARTITION pmax VALUES LESS THAN MAXVALUE)');
+            PREPARE stmt FROM @ddl;
+            EXECUTE stmt;
+            DEALLOCATE PREPARE stmt;
+            SET v_highest = v_bound;
+        END IF;
+        SET v_month = v_month + INTERVAL 1 MONTH;
+    END WHILE;
+END //
+
+-- Adds partitions up to p_months_ahead months from now, then drops partitions whose rows
+-- are all older than p_retention_days (retention is per whole month) and daily rollups
+-- older than p_rollup_retention_days
+CREATE PROCEDURE MaintainTrackHistory(IN p_retention_days INT, IN p_months_ahead INT, IN p_rollup_retention_days INT)
+BEGIN
+    DECLARE v_partition VARCHAR(64);
+
+    CALL AddTrackHistoryPartitions(CURRENT_DATE, CURRENT_DATE + INTERVAL p_months_ahead MONTH);
+
+    expire: LOOP
+        SET v_partition = NULL;
+        SELECT PARTITION_NAME INTO v_partition
+        FROM information_schema.partitions
+        WHERE table_schema = DATABASE() AND table_name = 'track_history' AND PARTITION_DESCRIPTION <> 'MAXVALUE'
+          AND CAST(PARTITION_DESCRIPTION AS UNSIGNED) <= UNIX_TIMESTAMP(CURRENT_TIMESTAMP - INTERVAL p_retention_days DAY)
+        ORDER BY PARTITION_ORDINAL_POSITION
+        LIMIT 1;
+        IF v_partition IS NULL THEN
+            LEAVE expire;
+        END IF;
+        SET @ddl = CONCAT('ALTER TABLE track_history DROP PARTITION ', v_partition);
+        PREPARE stmt FROM @ddl;
+        EXECUTE stmt;
+        DEALLOCATE PREPARE stmt;
+    END LOOP;
+
+    DELETE FROM track_request_daily WHERE day < CURRENT_DATE - INTERVAL p_rollup_retention_days DAY;
+END //
+
+-- MaintainTrackHistory with the retention stored in track_history_settings
+CREATE PROCEDURE MaintainConfiguredTrackHistory()
+BEGIN
+    DECLARE v_retention_days INT;
+    DECLARE v_months_ahead INT;
+    DECLARE v_rollup_retention_days INT;
+
+    SELECT retention_days, months_ahead, rollup_retention_days
+    INTO v_retention_days, v_months_ahead, v_rollup_retention_days
+    FROM track_history_settings WHERE id = 1;
+
+    CALL MaintainTrackHistory(v_retention_days, v_months_ahead, v_rollup_retention_days);
 END //
 DELIMITER ;
 
--- 5. View & Procedures
+CALL MaintainConfiguredTrackHistory();
+
+-- Needs event_scheduler=ON (the MySQL 8 default); SpotifyAPI.maintain_track_history runs the same on demand
+CREATE EVENT track_history_maintenance
+ON SCHEDULE EVERY 1 DAY
+DO CALL MaintainConfiguredTrackHistory();
+
+-- 6. View & Procedures
 CREATE VIEW fast_analytics_view AS
 SELECT 
     p.id, p.playlist_name, p.description, p.mood_description, p.total_tracks,
     CASE WHEN p.total_tracks > 0 THEN ROUND(p.total_popularity / p.total_tracks, 1) ELSE 0 END as avg_popularity,
-    (SELECT GROUP_CONCAT(DISTINCT ag.genre ORDER BY ag.genre SEPARATOR ', ')
-     FROM custom_playlist_tracks cpt
-     JOIN artist_genres ag ON cpt.track_id = ag.track_id
-     WHERE cpt.playlist_id = p.id) as all_genres,
+    (SELECT IFNULL(GROUP_CONCAT(g.name ORDER BY g.name SEPARATOR ', '), '')
+     FROM playlist_genre_summary s
+     JOIN genres g ON g.id = s.genre_id
+     WHERE s.playlist_id = p.id) as all_genres,
     p.created_at
 FROM custom_playlists p;
 
@@ -106,9 +305,12 @@ BEGIN
     SELECT * FROM fast_analytics_view WHERE id = p_playlist_id;
 END //
 
+-- Picks the newest playlists from the base table (idx_cp_created) before building any genre lists
 CREATE PROCEDURE GetUserPlaylistStats(IN p_limit INT)
 BEGIN
-    SELECT playlist_name, total_tracks, avg_popularity, all_genres, created_at
-    FROM fast_analytics_view ORDER BY created_at DESC LIMIT p_limit;
+    SELECT v.playlist_name, v.total_tracks, v.avg_popularity, v.all_genres, v.created_at
+    FROM (SELECT id FROM custom_playlists ORDER BY created_at DESC, id DESC LIMIT p_limit) newest
+    JOIN fast_analytics_view v ON v.id = newest.id
+    ORDER BY v.created_at DESC, v.id DESC;
 END //
 DELIMITER ;
\ No newline at end of file
@@ -0,0 +1,100 @@
+from contextlib import contextmanager
+import os
+import threading
+import time
+from mysql.connector import errors, pooling
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# mysql.connector caps a pool at 32 connections
+DB_POOL_SIZE = min(32, int(os.getenv('DB_POOL_SIZE', '8')))
+# Seconds to wait for a free connection before giving up
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+# Times run_transaction tries a unit of work that keeps hitting deadlocks or lock wait timeouts
+DB_TRANSACTION_ATTEMPTS = int(os.getenv('DB_TRANSACTION_ATTEMPTS', '3'))
+# ER_LOCK_DEADLOCK, ER_LOCK_WAIT_TIMEOUT: the transaction was rolled back and can run again as is
+RETRYABLE_ERRNOS = (1213, 1205)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """The process-wide connection pool, created on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = pooling.MySQLConnectionPool(
+                pool_name="spotify_tracks",
+                pool_size=DB_POOL_SIZE,
+                pool_reset_session=True,
+                host=os.getenv('DB_HOST'),
+                user=os.getenv("DB_USER"),
+                password=os.getenv("DB_PASSWORD"),
+                database=os.getenv("DB_NAME")
+            )
+        return _pool
+
+@contextmanager
+def connection():
+    """Borrow a healthy pooled connection, returned to the pool on exit"""
+    pool = get_pool()
+    deadline = time.monotonic() + DB_POOL_TIMEOUT
+    while True:
+        try:
+            conn = pool.get_connection()
+            break
+        except errors.PoolError:
+            # Pool exhausted: wait for another operation to hand one back
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.05)
+
+    try:
+        # Health check: transparently replace connections the server has dropped
+        conn.ping(reconnect=True, attempts=2, delay=0)
+        yield conn
+    finally:
+        conn.close()
+
+@contextmanager
+def optional_connection(enabled=True):
+    """Like connection(), but yields None when the caller opted out of MySQL"""
+    if not enabled:
+        yield None
+        return
+    with connection() as conn:
+        yield conn
+
+@contextmanager
+def transaction(conn=None, isolation_level=None):
+    """Cursor for one unit of work: commits on success, rolls back on error"""
+    if conn is None:
+        with connection() as conn:
+            with transaction(conn, isolation_level) as cursor:
+                yield cursor
+        return
+
+    if isolation_level:
+        conn.start_transaction(isolation_level=isolation_level)
+    cursor = conn.cursor()
+    try:
+        yield cursor
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def run_transaction(work, conn=None, isolation_level=None, attempts=DB_TRANSACTION_ATTEMPTS):
+    """work(cursor) in one transaction, run again from the start after a deadlock or lock wait timeout"""
+    for attempt in range(1, attempts + 1):
+        try:
+            with transaction(conn, isolation_level) as cursor:
+                return work(cursor)
+        except errors.DatabaseError as e:
+            if e.errno not in RETRYABLE_ERRNOS or attempt == attempts:
+                raise
+            print(f"⚠️ Transaction retry {attempt}/{attempts - 1} after MySQL error {e.errno}")
+            time.sleep(0.05 * attempt)
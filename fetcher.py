@@ -0,0 +1,62 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Max Spotify requests in flight at once (per SpotifyAPI instance)
+DEFAULT_MAX_WORKERS = int(os.getenv('SPOTIFY_MAX_WORKERS', '8'))
+
+class ConcurrentFetcher:
+    """Fan out independent Spotify calls over a thread pool, keeping results in order"""
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max(1, max_workers or DEFAULT_MAX_WORKERS)
+        self._executor = None
+
+    @property
+    def executor(self):
+        # Created on first use so serial callers never spawn threads
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix="spotify-fetch")
+        return self._executor
+
+    @staticmethod
+    def page_offsets(total, page_size, start=0):
+        """Offsets of every remaining page once the total is known from the first page"""
+        return list(range(start, total, page_size))
+
+    def map(self, fn, items):
+        """Run fn over all items concurrently and return results in input order"""
+        items = list(items)
+        if self.max_workers == 1 or len(items) <= 1:
+            return [fn(item) for item in items]
+        return list(self.executor.map(fn, items))
+
+    def imap(self, fn, items, window=None):
+        """Lazily run fn over items with at most `window` calls in flight, yielding in input order"""
+        window = max(1, window or self.max_workers)
+        if self.max_workers == 1:
+            for item in items:
+                yield fn(item)
+            return
+
+        in_flight = deque()
+        try:
+            for item in items:
+                in_flight.append(self.executor.submit(fn, item))
+                if len(in_flight) >= window:
+                    yield in_flight.popleft().result()
+            while in_flight:
+                yield in_flight.popleft().result()
+        finally:
+            # Consumer stopped early: don't keep fetching pages nobody will read
+            for future in in_flight:
+                future.cancel()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
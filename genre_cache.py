@@ -0,0 +1,117 @@
+from collections import OrderedDict
+import json
+import os
+import sys
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ARTIST_CACHE_SIZE = int(os.getenv('ARTIST_CACHE_SIZE', '50000'))
+# Genres rarely change; refetch an artist after a week by default
+ARTIST_CACHE_TTL = int(os.getenv('ARTIST_CACHE_TTL', str(7 * 24 * 3600)))
+
+class ArtistGenreCache:
+    """In-process LRU of artist ID -> genres, backed by the `artists` table"""
+
+    def __init__(self, max_size=ARTIST_CACHE_SIZE, ttl=ARTIST_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # artist_id -> (genres, fetched_at epoch seconds)
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def get_many(self, artist_ids, db=None):
+        """Return ({artist_id: genres} for fresh entries, [artist IDs that must be fetched])"""
+        now = time.time()
+        found = {}
+        pending = []
+        with self._lock:
+            for artist_id in artist_ids:
+                entry = self._entries.get(artist_id)
+                if entry and now - entry[1] < self.ttl:
+                    self._entries.move_to_end(artist_id)
+                    found[artist_id] = entry[0]
+                else:
+                    pending.append(artist_id)
+            self.memory_hits += len(found)
+
+        if pending and db is not None:
+            loaded = self._load(pending, db)
+            found.update(loaded)
+            with self._lock:
+                self.db_hits += len(loaded)
+
+        missing = [artist_id for artist_id in pending if artist_id not in found]
+        with self._lock:
+            self.misses += len(missing)
+        return found, missing
+
+    def put_many(self, artist_genres_map, db=None):
+        """Remember freshly fetched genres in memory and (optionally) in MySQL"""
+        if not artist_genres_map:
+            return
+        now = time.time()
+        with self._lock:
+            for artist_id, genres in artist_genres_map.items():
+                self._remember(artist_id, genres, now)
+
+        if db is not None:
+            try:
+                cursor = db.cursor()
+                cursor.executemany("""
+                    INSERT INTO artists (id, genres, fetched_at) VALUES (%s, %s, NOW())
+                    ON DUPLICATE KEY UPDATE genres = VALUES(genres), fetched_at = VALUES(fetched_at)
+                """, [(artist_id, json.dumps(genres)) for artist_id, genres in artist_genres_map.items()])
+                db.commit()
+                cursor.close()
+            except Exception as e:
+                print(f"Warning: Error storing artist genres: {e}")
+                db.rollback()
+
+    def _load(self, artist_ids, db):
+        """Read non-stale rows from the `artists` table into memory"""
+        loaded = {}
+        try:
+            cursor = db.cursor()
+            format_strings = ','.join(['%s'] * len(artist_ids))
+            cursor.execute(f"""
+                SELECT id, genres, UNIX_TIMESTAMP(fetched_at) FROM artists
+                WHERE id IN ({format_strings}) AND fetched_at >= NOW() - INTERVAL %s SECOND
+            """, list(artist_ids) + [self.ttl])
+            rows = cursor.fetchall()
+            cursor.close()
+        except Exception as e:
+            print(f"Warning: Error reading artist genre cache: {e}")
+            return loaded
+
+        with self._lock:
+            for artist_id, genres, fetched_at in rows:
+                loaded[artist_id] = [sys.intern(g) for g in json.loads(genres)]
+                self._remember(artist_id, loaded[artist_id], float(fetched_at))
+        return loaded
+
+    def _remember(self, artist_id, genres, fetched_at):
+        self._entries[artist_id] = (genres, fetched_at)
+        self._entries.move_to_end(artist_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        """Hit/miss counters since process start"""
+        with self._lock:
+            lookups = self.memory_hits + self.db_hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'db_hits': self.db_hits,
+                'hits': self.memory_hits + self.db_hits,
+                'misses': self.misses,
+                'hit_rate': (self.memory_hits + self.db_hits) / lookups if lookups else 0.0,
+                'size': len(self._entries)
+            }
+
+# One cache per process, shared by every SpotifyAPI instance
+artist_genre_cache = ArtistGenreCache()
@@ -0,0 +1,97 @@
+import sys
+import threading
+import numpy as np
+
+class GenreDictionary:
+    """Interned genre name <-> integer ID, mirrored in the `genres` table"""
+
+    def __init__(self):
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, names, db):
+        """Map genre names to their `genres.id`, inserting names we have never seen"""
+        names = set(names)
+        with self._lock:
+            missing = [name for name in names if name not in self._ids]
+
+        if missing:
+            cursor = db.cursor()
+            found = self._select(cursor, missing)
+            new_names = [name for name in missing if name not in found]
+            if new_names:
+                cursor.executemany("INSERT IGNORE INTO genres (name) VALUES (%s)", [(name,) for name in new_names])
+                found.update(self._select(cursor, new_names))
+            # The dictionary is append-only, commit right away so IDs stay valid if the caller rolls back
+            db.commit()
+            cursor.close()
+            with self._lock:
+                self._ids.update(found)
+
+        with self._lock:
+            return {name: self._ids[name] for name in names}
+
+    @staticmethod
+    def _select(cursor, names):
+        format_strings = ','.join(['%s'] * len(names))
+        cursor.execute(f"SELECT name, id FROM genres WHERE name IN ({format_strings})", list(names))
+        return dict(cursor.fetchall())
+
+class GenreIndex:
+    """Per-track genre bitsets for vectorized "any of these genres" filtering.
+
+    Each genre gets a bit column; tracks are rows of packed uint64 words, so
+    matching N tracks against a query of any size is a single AND + any().
+    """
+
+    def __init__(self, tracks):
+        self.columns = {}
+        row_ids = []
+        column_ids = []
+        n_tracks = 0
+        for row, track in enumerate(tracks):
+            n_tracks += 1
+            for genre in track.get('artist_genres', []):
+                row_ids.append(row)
+                column_ids.append(self.columns.setdefault(sys.intern(genre), len(self.columns)))
+
+        self.genres = list(self.columns)
+        n_words = max(1, (len(self.columns) + 63) // 64)
+        self.bits = np.zeros((n_tracks, n_words), dtype=np.uint64)
+        column_ids = np.asarray(column_ids, dtype=np.int64)
+        np.bitwise_or.at(self.bits, (np.asarray(row_ids, dtype=np.int64), column_ids // 64),
+                         np.left_shift(np.uint64(1), (column_ids % 64).astype(np.uint64)))
+
+    def __len__(self):
+        return self.bits.shape[0]
+
+    def query_mask(self, genres):
+        """Packed bitset of the given genres; unknown genres are ignored"""
+        mask = np.zeros(self.bits.shape[1], dtype=np.uint64)
+        for genre in genres:
+            column = self.columns.get(genre)
+            if column is not None:
+                mask[column // 64] |= np.uint64(1) << np.uint64(column % 64)
+        return mask
+
+    def match_any(self, genres):
+        """Boolean array: tracks having at least one of `genres`"""
+        return np.any(self.bits & self.query_mask(genres), axis=1)
+
+    def match_all(self, genres):
+        """Boolean array: tracks having every one of `genres`"""
+        mask = self.query_mask(genres)
+        return np.all((self.bits & mask) == mask, axis=1)
+
+    def match_count(self, genres):
+        """Number of `genres` each track has, for ranking partial matches"""
+        overlap = self.bits & self.query_mask(genres)
+        return np.unpackbits(overlap.view(np.uint8), axis=1).sum(axis=1)
+
+    def genre_counts(self):
+        """Number of tracks per genre"""
+        per_bit = np.unpackbits(self.bits.view(np.uint8), axis=1, bitorder='little').sum(axis=0)
+        return {genre: int(per_bit[column]) for genre, column in self.columns.items()}
+
+# One dictionary per process, shared by every SpotifyAPI instance
+genre_dictionary = GenreDictionary()
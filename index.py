@@ -1,8 +1,10 @@
-from link import SpotifyAPI
-from llm_handler import LLMHandler
+from link import SpotifyAPI, CUSTOM_PLAYLIST_PAGE_SIZE
+from llm_handler import llm_registry
+from curator import LocalCurator
 import json
 from rich.console import Console
 from rich.table import Table
+from rich.live import Live
 from rich.panel import Panel
 from rich import print as rprint
 import os
@@ -28,7 +30,24 @@ def display_playlists(playlists):
     console.print("\n📋 Your Playlists:")
     console.print(table)
 
-def display_custom_playlist(playlist_data):
+def playlist_tracks_table():
+    """Empty table for custom playlist tracks"""
+    table = Table(show_header=True, header_style="bold green")
+    table.add_column("#", style="dim", width=4)
+    table.add_column("Track Name", width=35)
+    table.add_column("Artist", width=25)
+    table.add_column("Album", width=30)
+    return table
+
+def add_track_row(table, track):
+    table.add_row(
+        str(track['position']),
+        track['track_name'],
+        track['artist'],
+        track.get('album', '')
+    )
+
+def display_custom_playlist(playlist_data, show_tracks=True):
     """Display the custom generated playlist in a formatted table"""
     console = Console()
     
@@ -36,41 +55,46 @@ def display_custom_playlist(playlist_data):
     console.print(f"\n🎵 [bold cyan]Custom Playlist: {playlist_data['playlist_name']}[/bold cyan]")
     console.print(f"📝 [italic]{playlist_data['description']}[/italic]")
     
-    # Create tracks table
-    table = Table(show_header=True, header_style="bold green")
-    table.add_column("#", style="dim", width=4)
-    table.add_column("Track Name", width=35)
-    table.add_column("Artist", width=25)
-    table.add_column("Album", width=30)
+    if not show_tracks:
+        return
     
+    # Create tracks table
+    table = playlist_tracks_table()
     for track in playlist_data['tracks']:
-        table.add_row(
-            str(track['position']),
-            track['track_name'],
-            track['artist'],
-            track['album']
-        )
+        add_track_row(table, track)
     
     console.print("\n🎶 Playlist Tracks:")
     console.print(table)
 
+def generate_custom_playlist(llm_handler, **kwargs):
+    """Generate a playlist, filling in the tracks table as the AI streams them back"""
+    console = Console()
+    table = playlist_tracks_table()
+    
+    console.print("\n🎶 Playlist Tracks:")
+    with Live(table, console=console, refresh_per_second=8):
+        playlist_data = llm_handler.analyze_tracks_and_create_playlist(
+            stream=True,
+            on_track=lambda track: add_track_row(table, track),
+            **kwargs
+        )
+        # The fallback generator does not stream; show its tracks all at once
+        if table.row_count == 0:
+            for track in playlist_data['tracks']:
+                add_track_row(table, track)
+    return playlist_data
+
 def test_gemini_connection():
-    """Test if Gemini API is working"""
+    """Check the shared AI handler; the probe only runs when no recent healthy status is cached"""
     console = Console()
-    try:
-        console.print("\n🔗 Testing AI connection...", style="bold blue")
-        llm_handler = LLMHandler()
-        test_result = llm_handler.test_connection()
-        
-        if "✅" in test_result:
-            console.print(f"📡 {test_result}", style="bold green")
-            return True, llm_handler
-        else:
-            console.print(f"⚠️ {test_result}", style="bold yellow")
-            return False, None
-    except Exception as e:
-        console.print(f"❌ AI Connection Failed: {e}", style="bold red")
-        return False, None
+    console.print("\n🔗 Checking AI connection...", style="bold blue")
+    ai_working, message, llm_handler = llm_registry.status()
+    
+    if ai_working:
+        console.print(f"📡 {message}", style="bold green")
+    else:
+        console.print(f"⚠️ {message}", style="bold yellow")
+    return ai_working, llm_handler
 
 def get_user_input(prompt, default=None, input_type=str):
     """Get user input with validation and default values"""
@@ -101,9 +125,8 @@ def show_enhanced_playlist_analytics():
     console = Console()
     try:
         spotify = SpotifyAPI()
-        custom_playlists = spotify.get_custom_playlists()
         
-        if not custom_playlists:
+        if not spotify.count_custom_playlists():
             console.print("\n📭 No custom playlists found for analytics.", style="bold yellow")
             return
         
@@ -131,6 +154,13 @@ def show_enhanced_playlist_analytics():
                 )
             
             console.print(table)
+
+            # Trends read the daily rollup, never the raw history
+            top_tracks = spotify.get_top_requested_tracks(days=7, limit=10)
+            if top_tracks:
+                console.print("\n🔥 [bold cyan]Most Requested Tracks This Week[/bold cyan]")
+                for i, track in enumerate(top_tracks, 1):
+                    console.print(f"{i:2d}. {track['track_name']} - {track['artist']} ({track['requests']} requests)")
             
             # Option for detailed analysis
             console.print("\n🔍 Enter a playlist ID for detailed analysis, or press Enter to continue: ")
@@ -171,6 +201,8 @@ def main():
     
     try:
         spotify = SpotifyAPI()
+        # Applies the configured history retention, which the daily MySQL event then keeps using
+        spotify.maintain_track_history()
         
         # Fetch and display user's playlists
         console.print("\n🎵 Fetching your playlists...", style="bold blue")
@@ -200,7 +232,7 @@ def main():
         
         # Get number of tracks to analyze
         console.print("\n📊 [bold]Track Analysis[/bold]")
-        max_tracks = min(selected_playlist['tracks_total'], 100)  # Limit to 100 for performance
+        max_tracks = selected_playlist['tracks_total']
         limit = get_user_input(
             f"How many tracks to analyze (1-{max_tracks})",
             default=min(20, max_tracks),
@@ -213,7 +245,8 @@ def main():
         
         # Fetch and store tracks from playlist
         console.print(f"\n📥 Fetching {limit} tracks from the playlist...", style="bold blue")
-        tracks_data = spotify.get_playlist_tracks(selected_playlist['id'], limit=limit)
+        tracks_data = spotify.get_playlist_tracks(selected_playlist['id'], limit=limit,
+                                                  snapshot_id=selected_playlist.get('snapshot_id'))
         
         if not tracks_data:
             console.print("❌ Failed to fetch tracks from the playlist!", style="bold red")
@@ -221,6 +254,11 @@ def main():
             
         console.print(f"✅ Successfully fetched and stored {len(tracks_data)} tracks!", style="bold green")
         
+        # Energy, tempo, ... for local curation (silently skipped where Spotify no longer serves them)
+        features = spotify.enrich_audio_features(tracks_data)
+        if features.has_features().any():
+            console.print(f"🎚️ Audio features available for {int(features.has_features().sum())} tracks", style="green")
+        
         # Show sample of fetched tracks
         console.print("\n📝 Sample of fetched tracks:", style="bold blue")
         sample_table = Table(show_header=True, header_style="bold yellow")
@@ -251,17 +289,22 @@ def main():
             "Enter a name for your custom playlist",
             default=f"{mood_description.title()} Mix"
         )
-        
+
+        # "More like this": widen the pool with similar tracks from every playlist ingested so far
+        similar_count = get_user_input(
+            "Add how many similar tracks from your other synced playlists? (0 to skip)",
+            default=0,
+            input_type=int
+        )
+        if similar_count > 0:
+            tracks_data = spotify.expand_candidates(tracks_data, mood_description, k=similar_count)
+
         # Test Gemini connection
         ai_working, llm_handler = test_gemini_connection()
         
         if not ai_working:
             console.print("\n⚠️ [bold yellow]AI features unavailable. Using fallback mode...[/bold yellow]")
-            console.print("💡 The playlist will be created with basic matching.", style="yellow")
-            
-            # Create fallback playlist
-            from llm_handler import LLMHandler  # Import here to avoid circular issues
-            llm_handler = LLMHandler()
+            console.print("💡 The playlist will be curated locally from genres, era and popularity.", style="yellow")
             console.print("\n🎨 Generating your custom playlist (fallback mode)...", style="bold blue")
             
         else:
@@ -269,23 +312,35 @@ def main():
         
         # Generate custom playlist
         try:
-            custom_playlist = llm_handler.analyze_tracks_and_create_playlist(
-                tracks_data=tracks_data,
-                mood_description=mood_description,
-                playlist_name=playlist_name,
-                max_tracks=min(10, len(tracks_data))
-            )
+            if ai_working:
+                custom_playlist = generate_custom_playlist(
+                    llm_handler,
+                    tracks_data=tracks_data,
+                    mood_description=mood_description,
+                    playlist_name=playlist_name,
+                    max_tracks=min(10, len(tracks_data))
+                )
+            else:
+                custom_playlist = LocalCurator(tracks_data).curate(mood_description, playlist_name, min(10, len(tracks_data)))
             
             # Store custom playlist in database
             console.print("\n💾 Saving custom playlist to database...", style="bold blue")
-            spotify.store_custom_playlist(custom_playlist, mood_description)
+            custom_playlist_id = spotify.store_custom_playlist(custom_playlist, mood_description)
             
-            # Display the custom playlist
-            display_custom_playlist(custom_playlist)
+            # Display the custom playlist (AI tracks were already shown as they arrived)
+            display_custom_playlist(custom_playlist, show_tracks=not ai_working)
             
             # Success message
             console.print(f"\n🎉 [bold green]Custom playlist '{custom_playlist['playlist_name']}' created successfully![/bold green]")
             
+            publish_choice = input("\n📤 Publish it to your Spotify account? (y/n, default: n): ").strip().lower()
+            if publish_choice in ['y', 'yes'] and custom_playlist_id is not None:
+                spotify_playlist_id = spotify.publish_custom_playlist(custom_playlist_id)
+                if spotify_playlist_id:
+                    console.print(f"✅ Published to Spotify: https://open.spotify.com/playlist/{spotify_playlist_id}", style="bold green")
+                else:
+                    console.print("❌ Publishing failed, run it again to resume where it stopped.", style="bold red")
+            
             # Additional options
             console.print("\n🔧 [bold]Next Steps:[/bold]")
             console.print("   • Run the program again to create more playlists")
@@ -313,58 +368,73 @@ def show_custom_playlists():
     console = Console()
     try:
         spotify = SpotifyAPI()
-        custom_playlists = spotify.get_custom_playlists()
+        total = spotify.count_custom_playlists()
         
-        if not custom_playlists:
+        if not total:
             console.print("\n📭 No custom playlists found in database.", style="bold yellow")
             return
         
-        console.print("\n📂 [bold]Previously Created Custom Playlists:[/bold]")
-        table = Table(show_header=True, header_style="bold cyan")
-        table.add_column("ID", style="dim", width=4)
-        table.add_column("Playlist Name", width=25)
-        table.add_column("Description", width=40)
-        table.add_column("Created", width=15)
-        
-        for playlist in custom_playlists:
-            created = playlist['created_at'].strftime('%Y-%m-%d') if playlist['created_at'] else 'Unknown'
-            table.add_row(
-                str(playlist['id']),
-                playlist['playlist_name'],
-                playlist['description'][:37] + '...' if len(playlist['description']) > 40 else playlist['description'],
-                created
-            )
-        
-        console.print(table)
-        
-        # Option to view tracks of a specific playlist
-        if custom_playlists:
-            console.print("\n🔍 Enter a playlist ID to view its tracks, or press Enter to continue: ")
+        pages = (total + CUSTOM_PLAYLIST_PAGE_SIZE - 1) // CUSTOM_PLAYLIST_PAGE_SIZE
+        page = 1
+        while True:
+            custom_playlists = spotify.get_custom_playlists(limit=CUSTOM_PLAYLIST_PAGE_SIZE,
+                                                            offset=(page - 1) * CUSTOM_PLAYLIST_PAGE_SIZE)
+            
+            console.print(f"\n📂 [bold]Previously Created Custom Playlists[/bold] (page {page} of {pages}):")
+            table = Table(show_header=True, header_style="bold cyan")
+            table.add_column("ID", style="dim", width=4)
+            table.add_column("Playlist Name", width=25)
+            table.add_column("Tracks", width=6)
+            table.add_column("Description", width=40)
+            table.add_column("Created", width=15)
+            
+            for playlist in custom_playlists:
+                created = playlist['created_at'].strftime('%Y-%m-%d') if playlist['created_at'] else 'Unknown'
+                table.add_row(
+                    str(playlist['id']),
+                    playlist['playlist_name'],
+                    str(playlist['total_tracks']),
+                    playlist['description'][:37] + '...' if len(playlist['description']) > 40 else playlist['description'],
+                    created
+                )
+            
+            console.print(table)
+            
+            # Option to page through or view tracks of a specific playlist
+            console.print("\n🔍 Enter a playlist ID to view its tracks, n/p for the next/previous page, or press Enter to continue: ")
             try:
-                playlist_id = input("Playlist ID: ").strip()
-                if playlist_id:
-                    playlist_id = int(playlist_id)
-                    tracks = spotify.get_custom_playlist_tracks(playlist_id)
-                    if tracks:
-                        console.print(f"\n🎵 Tracks in playlist #{playlist_id}:")
-                        track_table = Table(show_header=True, header_style="bold green")
-                        track_table.add_column("#", style="dim", width=4)
-                        track_table.add_column("Track Name", width=30)
-                        track_table.add_column("Artist", width=20)
-                        track_table.add_column("Album", width=25)
-                        
-                        for track in tracks:
-                            track_table.add_row(
-                                str(track['position']),
-                                track['track_name'],
-                                track['artist'],
-                                track['album']
-                            )
-                        console.print(track_table)
+                choice = input("Playlist ID: ").strip().lower()
+                if not choice:
+                    break
+                if choice in ('n', 'p'):
+                    page = min(pages, page + 1) if choice == 'n' else max(1, page - 1)
+                    continue
+                playlist_id = int(choice)
+                tracks = spotify.get_custom_playlist_tracks(playlist_id)
+                if tracks:
+                    console.print(f"\n🎵 Tracks in playlist #{playlist_id}:")
+                    track_table = Table(show_header=True, header_style="bold green")
+                    track_table.add_column("#", style="dim", width=4)
+                    track_table.add_column("Track Name", width=30)
+                    track_table.add_column("Artist", width=20)
+                    track_table.add_column("Album", width=25)
+                    
+                    for track in tracks:
+                        track_table.add_row(
+                            str(track['position']),
+                            track['track_name'],
+                            track['artist'],
+                            track['album']
+                        )
+                    console.print(track_table)
+                else:
+                    console.print(f"📭 No tracks found for playlist #{playlist_id}.", style="bold yellow")
+                break
             except ValueError:
                 console.print("❌ Invalid playlist ID!", style="bold red")
             except Exception as e:
                 console.print(f"❌ Error viewing playlist: {e}", style="bold red")
+                break
                 
     except Exception as e:
         console.print(f"❌ Error loading custom playlists: {e}", style="bold red")
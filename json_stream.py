@@ -0,0 +1,128 @@
+import json
+
+class PlaylistStreamParser:
+    """Incremental parser for the playlist JSON the model streams back.
+
+    feed() accepts arbitrary text chunks and returns the entries of the
+    "tracks" array that completed in that chunk: objects as soon as their
+    closing brace arrives, handles once the following "," or "]" does.
+    Anything before the first "{" (such as a ```json fence) is ignored, and
+    a stream that stops early keeps every entry that was complete.
+    """
+
+    def __init__(self):
+        self.fields = {}
+        self.tracks = []
+        self.complete = False  # True once the top-level object has closed
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._expect_key = False
+        self._key = None
+        self._in_tracks = False
+        self._element_start = None
+
+    @property
+    def playlist_name(self):
+        return self.fields.get('playlist_name')
+
+    @property
+    def description(self):
+        return self.fields.get('description')
+
+    def feed(self, chunk):
+        """Consume a chunk of text, returning the track entries it completed"""
+        if self.complete or not chunk:
+            return []
+        start = self._pos
+        self._buffer += chunk
+        text = self._buffer
+        completed = []
+
+        for i in range(start, len(text)):
+            char = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._on_string(text[self._string_start:i + 1])
+                continue
+
+            if self._depth == 0:
+                # Skip preamble until the top-level object opens
+                if char == '{':
+                    self._depth = 1
+                    self._expect_key = True
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char in '{[':
+                if char == '[' and self._depth == 1 and self._key == 'tracks':
+                    self._in_tracks = True
+                    self._element_start = i + 1
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._in_tracks and self._depth == 2 and char == '}':
+                    # An object entry just closed
+                    self._emit(text[self._element_start:i + 1], completed)
+                    self._element_start = None
+                elif self._in_tracks and self._depth == 1 and char == ']':
+                    self._emit(text[self._element_start:i], completed)
+                    self._in_tracks = False
+                elif self._depth == 0:
+                    self.complete = True
+                    self._pos = i + 1
+                    return completed
+            elif char == ',':
+                if self._depth == 1:
+                    self._expect_key = True
+                    self._key = None
+                elif self._in_tracks and self._depth == 2:
+                    self._emit(text[self._element_start:i], completed)
+                    self._element_start = i + 1
+
+        self._pos = len(text)
+        return completed
+
+    def result(self):
+        """Everything parsed so far as a playlist dict"""
+        return {
+            'playlist_name': self.playlist_name,
+            'description': self.description,
+            'tracks': list(self.tracks)
+        }
+
+    def _on_string(self, raw):
+        if self._depth != 1:
+            return
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            return
+        if self._expect_key:
+            self._key = value
+            self._expect_key = False
+        elif self._key is not None:
+            self.fields[self._key] = value
+
+    def _emit(self, raw, completed):
+        if self._element_start is None:
+            return
+        raw = raw.strip()
+        if not raw:
+            return
+        try:
+            entry = json.loads(raw)
+        except ValueError:
+            return
+        self.tracks.append(entry)
+        completed.append(entry)
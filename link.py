@@ -1,15 +1,82 @@
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
-import mysql.connector
 from datetime import datetime, date
 import json
 import os
+import sys
+import threading
+from collections import Counter
 from dotenv import load_dotenv
+import db_pool
+from audio_features import AUDIO_FEATURES_BATCH_SIZE, FEATURE_COLUMNS, FeatureStore, load_features, save_features
+from fetcher import ConcurrentFetcher
+from genre_cache import artist_genre_cache
+from genre_index import genre_dictionary
+from nn_index import default_track_index
+from scheduler import spotify_scheduler, BACKGROUND, INTERACTIVE
 
 load_dotenv()
 
+# Spotify caps playlist pages at 100 items, /me/playlists at 50 and /artists at 50 IDs per call
+PLAYLIST_PAGE_SIZE = 100
+USER_PLAYLIST_PAGE_SIZE = 50
+ARTIST_BATCH_SIZE = 50
+# Tracks buffered in memory before each MySQL write during streaming ingestion
+STORE_CHUNK_SIZE = 500
+# Only request the fields we actually use, keeps large pages small
+PLAYLIST_TRACK_FIELDS = "items(track(id,name,popularity,artists(id,name),album(name,release_date))),next,total"
+
+# Row-constructor pairs per DELETE statement when removing stale genres
+GENRE_DELETE_BATCH_SIZE = 500
+# Ids per IN (...) lookup when reading track records back from the local catalog
+TRACK_LOAD_BATCH_SIZE = 1000
+# Spotify accepts at most 100 items per add-items call
+PUBLISH_CHUNK_SIZE = 100
+# Playlists published at once by export_custom_playlists (chunks of one playlist always go in order)
+PUBLISH_CONCURRENCY = int(os.getenv('SPOTIFY_PUBLISH_CONCURRENCY', '4'))
+# Custom playlists per page on the View Playlists pages
+CUSTOM_PLAYLIST_PAGE_SIZE = int(os.getenv('CUSTOM_PLAYLIST_PAGE_SIZE', '20'))
+# What each ingest records about requested tracks: raw track_history rows plus daily
+# counts (full), only the daily counts in track_request_daily (rollup), or nothing (off)
+TRACK_HISTORY_MODES = ('full', 'rollup', 'off')
+TRACK_HISTORY_MODE = os.getenv('TRACK_HISTORY_MODE', 'full')
+# Stored in track_history_settings by maintain_track_history, where the daily MySQL event reads them
+TRACK_HISTORY_RETENTION_DAYS = int(os.getenv('TRACK_HISTORY_RETENTION_DAYS', '90'))
+TRACK_HISTORY_MONTHS_AHEAD = 2
+TRACK_ROLLUP_RETENTION_DAYS = int(os.getenv('TRACK_ROLLUP_RETENTION_DAYS', '730'))
+
+RELEASE_DATE_PRECISIONS = {4: 'year', 7: 'month', 10: 'day'}
+
+# The process-wide track index is checked against MySQL once, by the first SpotifyAPI using it
+_default_index_checked = False
+_default_index_check_lock = threading.Lock()
+
+def parse_release_date(release_date):
+    """(DATE string, precision) for a Spotify release date ("1997", "1997-06" or "1997-06-16")"""
+    release_date = str(release_date or '')
+    precision = RELEASE_DATE_PRECISIONS.get(len(release_date))
+    # Spotify uses "0000" for unknown dates
+    if precision is None or release_date[:4] < '1000':
+        return None, None
+    return (release_date + '-01-01')[:10], precision
+
+def format_release_date(release_date, precision):
+    """Back to Spotify's form, so stored tracks look the same as freshly fetched ones"""
+    if release_date is None:
+        return None
+    if precision == 'year':
+        return f"{release_date.year:04d}"
+    if precision == 'month':
+        return f"{release_date.year:04d}-{release_date.month:02d}"
+    return release_date.isoformat()
+
+def diff_genre_rows(existing, incoming):
+    """Return (rows to insert, rows to delete) turning `existing` (track_id, genre_id) rows into `incoming`"""
+    return sorted(incoming - existing), sorted(existing - incoming)
+
 class SpotifyAPI:
-    def __init__(self):
+    def __init__(self, sp=None, max_workers=None, genre_cache=None, scheduler=None, priority=INTERACTIVE,
+                 track_index=None, history_mode=TRACK_HISTORY_MODE):
         # Scopes for reading library and modifying playlists
         scope = " ".join([
             "playlist-read-private",
@@ -21,192 +88,937 @@ class SpotifyAPI:
             "playlist-modify-private"
         ])
         
-        auth_manager = SpotifyOAuth(
-            client_id=os.getenv('SPOTIFY_CLIENT_ID'),
-            client_secret=os.getenv('SPOTIFY_CLIENT_SECRET'),
-            redirect_uri="http://127.0.0.1:8000/callback",
-            scope=scope,
-            cache_path=".spotify_cache"
-        )
-        
-        self.sp = spotipy.Spotify(auth_manager=auth_manager)
-        
-        self.db = mysql.connector.connect(
-            host=os.getenv('DB_HOST'),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
-            database=os.getenv("DB_NAME")
-        )
-        self.cursor = self.db.cursor()
+        if sp is None:
+            auth_manager = SpotifyOAuth(
+                client_id=os.getenv('SPOTIFY_CLIENT_ID'),
+                client_secret=os.getenv('SPOTIFY_CLIENT_SECRET'),
+                redirect_uri="http://127.0.0.1:8000/callback",
+                scope=scope,
+                cache_path=".spotify_cache"
+            )
+            # Retries are handled by the scheduler so 429s surface with their Retry-After
+            sp = spotipy.Spotify(auth_manager=auth_manager, retries=0, status_retries=0, status_forcelist=())
+        self.sp = sp
+        self.fetcher = ConcurrentFetcher(max_workers)
+        self.genre_cache = genre_cache or artist_genre_cache
+        self.scheduler = scheduler or spotify_scheduler
+        self.priority = priority
+        # Nearest-neighbour index over every stored track, kept current by store_tracks_batch
+        if track_index is None:
+            self.track_index = default_track_index()
+            self._check_default_track_index()
+        else:
+            self.track_index = track_index
+        if history_mode not in TRACK_HISTORY_MODES:
+            raise ValueError(f"history_mode must be one of {', '.join(TRACK_HISTORY_MODES)}, not {history_mode!r}")
+        self.history_mode = history_mode
+        # Cleared on the first 403 from the deprecated /audio-features endpoint
+        self.audio_features_available = True
+        # Resolved by the first publish; the account behind a client never changes
+        self._user_id = None
+        self._user_id_lock = threading.Lock()
+        # MySQL access goes through the process-wide pool in db_pool, one cursor per operation
+
+    def _call(self, fn, *args, priority=None, **kwargs):
+        """Route a spotipy call through the shared rate-limit scheduler"""
+        return self.scheduler.call(fn, *args, priority=self.priority if priority is None else priority, **kwargs)
 
     def get_user_playlists(self):
         """Get all playlists of the current user"""
         try:
+            first = self._call(self.sp.current_user_playlists, limit=USER_PLAYLIST_PAGE_SIZE)
+            if not first:
+                return []
+
+            # The first page tells us the total, so every other page can be fetched at once
+            offsets = self.fetcher.page_offsets(first.get('total', 0), USER_PLAYLIST_PAGE_SIZE,
+                                                start=len(first['items']))
+            pages = [first] + self.fetcher.map(
+                lambda offset: self._call(self.sp.current_user_playlists, limit=USER_PLAYLIST_PAGE_SIZE, offset=offset),
+                offsets
+            )
+
             playlists = []
-            results = self.sp.current_user_playlists(limit=50)
-            while results:
+            for results in pages:
                 for item in results['items']:
                     if item:
                         playlists.append({
                             'id': item['id'],
                             'name': item['name'],
                             'tracks_total': item['tracks']['total'],
-                            'owner': item['owner']['display_name']
+                            'owner': item['owner']['display_name'],
+                            'snapshot_id': item.get('snapshot_id')
                         })
-                results = self.sp.next(results) if results['next'] else None
             return playlists
         except Exception as e:
             print(f"Error fetching playlists: {e}")
             return []
 
-    def get_playlist_tracks(self, playlist_id, limit=20):
-        """Get metadata for tracks with optimized batch processing"""
+    def get_playlist_tracks(self, playlist_id, limit=20, snapshot_id=None):
+        """Get metadata for the first `limit` tracks of a playlist (None = all).
+
+        With a `snapshot_id` (from get_user_playlists) the playlist is synced
+        incrementally and served from MySQL.
+        """
+        if snapshot_id:
+            return self.sync_playlist_tracks(playlist_id, snapshot_id, limit)
+        return list(self.iter_playlist_tracks(playlist_id, max_tracks=limit))
+
+    def sync_playlist_tracks(self, playlist_id, snapshot_id, limit=None):
+        """Serve tracks from MySQL when the snapshot is unchanged, otherwise fetch and upsert only what changed"""
+        try:
+            with db_pool.transaction() as cursor:
+                cursor.execute("""
+                    SELECT snapshot_id, synced_tracks, is_complete FROM playlist_snapshots WHERE playlist_id = %s
+                """, (playlist_id,))
+                stored = cursor.fetchone()
+
+            if stored and stored[0] == snapshot_id:
+                synced_tracks, is_complete = stored[1], stored[2]
+                # Unchanged playlist: zero API calls. Otherwise the same snapshot just hasn't been synced this far yet
+                if not (is_complete or (limit is not None and synced_tracks >= limit)):
+                    self._sync_playlist(playlist_id, snapshot_id, limit, start=synced_tracks)
+            else:
+                self._sync_playlist(playlist_id, snapshot_id, limit)
+
+            tracks_data = self._load_playlist_tracks(playlist_id, limit)
+        except Exception as e:
+            print(f"Error syncing playlist: {e}")
+            return []
+
+        # Every served track counts as requested, also when it came straight from MySQL
+        try:
+            with db_pool.transaction() as cursor:
+                self._record_track_requests(cursor, [t['id'] for t in tracks_data])
+        except Exception as e:
+            print(f"Warning: Error recording track requests: {e}")
+        return tracks_data
+
+    def _sync_playlist(self, playlist_id, snapshot_id, limit=None, start=0):
+        """Walk the playlist and diff it against stored membership.
+
+        Spotify has no diff endpoint, so pages are still read, but only tracks
+        that are new or whose genres need refreshing are enriched and upserted,
+        and only membership rows whose position changed are written. Popularity
+        of other stored tracks is left as is until they are ingested again.
+        """
+        with db_pool.transaction() as cursor:
+            cursor.execute("""
+                SELECT position, track_id FROM playlist_source_tracks WHERE playlist_id = %s
+            """, (playlist_id,))
+            membership = dict(cursor.fetchall())
+
+        position = start
+        stale_positions = []
+        for page in self._iter_playlist_pages(playlist_id, limit, start=start):
+            page_tracks = []
+            for item in page:
+                track = item.get('track') if item else None
+                if track and track.get('id'):
+                    page_tracks.append((position, track))
+                elif position in membership:
+                    stale_positions.append(position)
+                position += 1
+            if not page_tracks:
+                continue
+
+            stale_tracks = self._tracks_needing_enrichment([track for _, track in page_tracks])
+            if stale_tracks:
+                artist_genres_map = self._fetch_artist_genres(self._primary_artist_ids(stale_tracks))
+                # Requests are recorded once for everything sync_playlist_tracks serves
+                stored = self.store_tracks_batch([self._build_track_record(t, artist_genres_map) for t in stale_tracks],
+                                                 record_requests=False)
+                # Membership rows need their tracks, and the snapshot must not be recorded as synced
+                if not stored:
+                    raise RuntimeError(f"could not store tracks of playlist {playlist_id}")
+
+            changed = [(playlist_id, pos, track['id']) for pos, track in page_tracks
+                       if membership.get(pos) != track['id']]
+            if changed:
+                with db_pool.transaction() as cursor:
+                    cursor.executemany("""
+                        INSERT INTO playlist_source_tracks (playlist_id, position, track_id)
+                        VALUES (%s, %s, %s)
+                        ON DUPLICATE KEY UPDATE track_id = VALUES(track_id)
+                    """, changed)
+
+        # Reaching the end before the limit means we saw the whole playlist; drop rows past it
+        is_complete = limit is None or position < limit
+        if is_complete:
+            stale_positions.extend(pos for pos in membership if pos >= position)
+        # The snapshot is recorded last, so an interrupted sync is simply redone next time
+        with db_pool.transaction() as cursor:
+            if stale_positions:
+                format_strings = ','.join(['%s'] * len(stale_positions))
+                cursor.execute(f"""
+                    DELETE FROM playlist_source_tracks
+                    WHERE playlist_id = %s AND position IN ({format_strings})
+                """, [playlist_id] + stale_positions)
+
+            cursor.execute("""
+                INSERT INTO playlist_snapshots (playlist_id, snapshot_id, synced_tracks, is_complete)
+                VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE snapshot_id = VALUES(snapshot_id),
+                    synced_tracks = VALUES(synced_tracks), is_complete = VALUES(is_complete)
+            """, (playlist_id, snapshot_id, position, is_complete))
+
+    def _tracks_needing_enrichment(self, raw_tracks):
+        """Raw tracks to (re-)enrich and upsert: never stored, primary artist missing or stale in the
+        genre cache (e.g. its /artists batch failed, or the TTL passed), or stored without genres
+        that the artist does have"""
+        raw_tracks = list({track['id']: track for track in raw_tracks}.values())
+        format_strings = ','.join(['%s'] * len(raw_tracks))
+        with db_pool.transaction() as cursor:
+            cursor.execute(f"""
+                SELECT t.id, EXISTS(SELECT 1 FROM artist_genres ag WHERE ag.track_id = t.id)
+                FROM tracks t WHERE t.id IN ({format_strings})
+            """, [track['id'] for track in raw_tracks])
+            has_genres = dict(cursor.fetchall())
+
+        known = [track for track in raw_tracks if track['id'] in has_genres]
+        with db_pool.connection() as db:
+            cached, stale_artists = self.genre_cache.get_many(self._primary_artist_ids(known), db)
+        stale_artists = set(stale_artists)
+
+        def needs_enrichment(track):
+            if track['id'] not in has_genres:
+                return True
+            artist_id = self._primary_artist_id(track)
+            if artist_id is None:
+                return False
+            return artist_id in stale_artists or (not has_genres[track['id']] and bool(cached.get(artist_id)))
+
+        return [track for track in raw_tracks if needs_enrichment(track)]
+
+    def _load_playlist_tracks(self, playlist_id, limit=None):
+        """Rebuild track records of a synced playlist from MySQL, in playlist order"""
+        max_position = limit if limit is not None else 2 ** 31 - 1
+        with db_pool.transaction() as cursor:
+            cursor.execute("""
+                SELECT t.id, t.track_name, t.artist, t.album, t.release_date, t.release_date_precision, t.popularity
+                FROM playlist_source_tracks pst
+                JOIN tracks t ON t.id = pst.track_id
+                WHERE pst.playlist_id = %s AND pst.position < %s
+                ORDER BY pst.position
+            """, (playlist_id, max_position))
+            columns = [col[0] for col in cursor.description]
+            tracks_data = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+            cursor.execute("""
+                SELECT DISTINCT ag.track_id, g.name, g.id
+                FROM playlist_source_tracks pst
+                JOIN artist_genres ag ON ag.track_id = pst.track_id
+                JOIN genres g ON g.id = ag.genre_id
+                WHERE pst.playlist_id = %s AND pst.position < %s
+                ORDER BY g.id
+            """, (playlist_id, max_position))
+            genre_rows = cursor.fetchall()
+
+        genres_by_track = {}
+        for track_id, genre, _ in genre_rows:
+            genres_by_track.setdefault(track_id, []).append(sys.intern(genre))
+
+        for track in tracks_data:
+            track['release_date'] = format_release_date(track['release_date'], track.pop('release_date_precision'))
+            track['artist_genres'] = genres_by_track.get(track['id'], [])
+        return tracks_data
+
+    def iter_playlist_tracks(self, playlist_id, max_tracks=None, store=True, chunk_size=STORE_CHUNK_SIZE):
+        """Stream track records page by page, enriching genres and storing in bounded chunks.
+
+        Walks every page of the playlist with `offset`, so memory stays flat
+        regardless of playlist size and the first tracks are usable before
+        the last page is fetched.
+        """
+        pending = []
         try:
-            # 1. Fetch tracks from Spotify
-            results = self.sp.playlist_tracks(playlist_id, limit=limit)
-            if not results or 'items' not in results:
+            for page in self._iter_playlist_pages(playlist_id, max_tracks):
+                # Local files and unavailable items have no Spotify id and cannot be stored
+                raw_items = [item['track'] for item in page
+                             if item and item.get('track') and item['track'].get('id')]
+                if not raw_items:
+                    continue
+
+                # Batch Fetch Artist Genres for this page (1 call per 50 artists vs 1 call per track)
+                artist_genres_map = self._fetch_artist_genres(self._primary_artist_ids(raw_items), persist=store)
+
+                for track in raw_items:
+                    record = self._build_track_record(track, artist_genres_map)
+                    if store:
+                        pending.append(record)
+                        if len(pending) >= chunk_size:
+                            self.store_tracks_batch(pending)
+                            pending = []
+                    yield record
+        except Exception as e:
+            print(f"Error fetching playlist data: {e}")
+        finally:
+            # Flush the last partial chunk, even if the consumer stopped early
+            if pending:
+                self.store_tracks_batch(pending)
+
+    def _iter_playlist_pages(self, playlist_id, max_tracks=None, start=0):
+        """Yield the raw `items` of each playlist page in order, from `start` up to `max_tracks` items"""
+        def fetch_page(offset):
+            page_size = PLAYLIST_PAGE_SIZE if max_tracks is None else min(PLAYLIST_PAGE_SIZE, max_tracks - offset)
+            return self._call(self.sp.playlist_tracks, playlist_id, fields=PLAYLIST_TRACK_FIELDS,
+                              limit=page_size, offset=offset)
+
+        if max_tracks is not None and start >= max_tracks:
+            return
+        first = fetch_page(start)
+        if not first or not first.get('items'):
+            if start == 0:
                 print("No tracks found in playlist")
+            return
+        yield first['items']
+
+        total = first.get('total', len(first['items']))
+        if max_tracks is not None:
+            total = min(total, max_tracks)
+
+        # Remaining offsets are known up front; keep a bounded window of pages in flight
+        offsets = self.fetcher.page_offsets(total, PLAYLIST_PAGE_SIZE, start=start + len(first['items']))
+        for results in self.fetcher.imap(fetch_page, offsets):
+            if results and results.get('items'):
+                yield results['items']
+
+    def _fetch_artist_genres(self, artist_ids, persist=True):
+        """Map artist ID -> genres, only calling /artists for IDs missing from the cache or stale"""
+        # Separate borrows around the API calls so no pooled connection idles during network I/O
+        with db_pool.optional_connection(persist) as db:
+            artist_genres_map, missing = self.genre_cache.get_many(artist_ids, db)
+        if missing:
+            fetched = self._fetch_artist_genres_from_spotify(missing)
+            with db_pool.optional_connection(persist) as db:
+                self.genre_cache.put_many(fetched, db)
+            artist_genres_map.update(fetched)
+        return artist_genres_map
+
+    def _fetch_artist_genres_from_spotify(self, artist_ids):
+        """Map artist ID -> genres, fetching 50-artist batches concurrently"""
+        def fetch_batch(batch):
+            try:
+                return self._call(self.sp.artists, batch)['artists']
+            except Exception as e:
+                # Not cached, so these artists are retried on the next ingest
+                print(f"Warning: Error fetching artist batch after retries: {e}")
                 return []
 
-            raw_items = [item['track'] for item in results['items'] if item and item.get('track')]
-            artist_ids = set()
-            
-            # Collect all Artist IDs first
-            for track in raw_items:
-                if track.get('artists'):
-                    artist_ids.add(track['artists'][0]['id'])
-
-            # 2. Batch Fetch Artist Genres (1 call per 50 artists vs 1 call per track)
-            artist_genres_map = {}
-            if artist_ids:
-                artist_ids_list = list(artist_ids)
-                for i in range(0, len(artist_ids_list), 50):
-                    batch = artist_ids_list[i:i+50]
-                    try:
-                        artists_info = self.sp.artists(batch)
-                        for artist in artists_info['artists']:
-                            artist_genres_map[artist['id']] = artist.get('genres', [])
-                    except Exception as e:
-                        print(f"Warning: Error fetching artist batch: {e}")
-
-            # 3. Construct Track Data Objects
-            tracks_data = []
-            for track in raw_items:
-                primary_artist = track['artists'][0] if track.get('artists') else None
-                genres = artist_genres_map.get(primary_artist['id'], []) if primary_artist else []
-                
-                tracks_data.append({
-                    "id": track.get('id', ''),
-                    "track_name": track.get('name', 'Unknown'),
-                    "artist": primary_artist['name'] if primary_artist else 'Unknown',
-                    "album": track['album']['name'] if track.get('album') else 'Unknown',
-                    "release_date": track['album']['release_date'] if track.get('album') else None,
-                    "artist_genres": genres,
-                    "popularity": track.get('popularity', 0)
-                })
+        artist_ids_list = list(artist_ids)
+        batches = [artist_ids_list[i:i + ARTIST_BATCH_SIZE]
+                   for i in range(0, len(artist_ids_list), ARTIST_BATCH_SIZE)]
 
-            # 4. Batch Store in Database
-            if tracks_data:
-                self.store_tracks_batch(tracks_data)
-            
-            return tracks_data
+        artist_genres_map = {}
+        for artists in self.fetcher.map(fetch_batch, batches):
+            for artist in artists:
+                if artist:
+                    artist_genres_map[artist['id']] = artist.get('genres', [])
+        return artist_genres_map
+
+    def get_audio_features(self, track_ids, persist=True):
+        """Map track ID -> audio features, reading `track_features` first and fetching the rest 100 per call.
+
+        Spotify answers 403 on /audio-features for apps created after the
+        endpoint's deprecation; the first 403 turns fetching off for this
+        instance and only stored features are returned.
+        """
+        track_ids = list(dict.fromkeys(t for t in track_ids if t))
+        with db_pool.optional_connection(persist) as db:
+            features_map = load_features(track_ids, db) if db is not None else {}
+        missing = [t for t in track_ids if t not in features_map]
+        if not missing or not self.audio_features_available:
+            return features_map
+
+        def fetch_batch(batch):
+            if not self.audio_features_available:
+                return []
+            try:
+                return self._call(self.sp.audio_features, batch) or []
+            except spotipy.SpotifyException as e:
+                if e.http_status == 403:
+                    if self.audio_features_available:
+                        print("Warning: /audio-features is not available to this app (403); skipping audio features")
+                    self.audio_features_available = False
+                else:
+                    print(f"Warning: Error fetching audio features after retries: {e}")
+                return []
+            except Exception as e:
+                print(f"Warning: Error fetching audio features after retries: {e}")
+                return []
+
+        batches = [missing[i:i + AUDIO_FEATURES_BATCH_SIZE] for i in range(0, len(missing), AUDIO_FEATURES_BATCH_SIZE)]
+        # First batch alone, so a 403 is learned from one request rather than a concurrent burst
+        results = [fetch_batch(batches[0])]
+        if self.audio_features_available:
+            results.extend(self.fetcher.map(fetch_batch, batches[1:]))
+        fetched = {}
+        for features_list in results:
+            for features in features_list:
+                if features:
+                    fetched[features['id']] = {column: features.get(column) for column in FEATURE_COLUMNS}
+
+        if fetched:
+            with db_pool.optional_connection(persist) as db:
+                if db is not None:
+                    save_features(fetched, db)
+        features_map.update(fetched)
+        return features_map
+
+    def enrich_audio_features(self, tracks_data, persist=True):
+        """Attach 'audio_features' to each track record and return a FeatureStore aligned with them"""
+        features_map = self.get_audio_features([t['id'] for t in tracks_data], persist)
+        for track in tracks_data:
+            track['audio_features'] = features_map.get(track['id'])
+        # Ingests index tracks without features; fold them in for tracks the index already holds
+        indexed = [t for t in tracks_data if t['audio_features'] and t['id'] in self.track_index]
+        if indexed:
+            self.track_index.add(indexed)
+            self.track_index.maybe_save()
+        return FeatureStore.from_tracks(tracks_data)
 
+    def load_tracks(self, track_ids):
+        """Track records (with genres and any stored audio features) for ids from the local catalog, in id order"""
+        track_ids = list(dict.fromkeys(track_ids))
+        records = {}
+        try:
+            with db_pool.connection() as db:
+                for i in range(0, len(track_ids), TRACK_LOAD_BATCH_SIZE):
+                    batch = track_ids[i:i + TRACK_LOAD_BATCH_SIZE]
+                    format_strings = ','.join(['%s'] * len(batch))
+                    with db_pool.transaction(db) as cursor:
+                        cursor.execute(f"""
+                            SELECT id, track_name, artist, album, release_date, release_date_precision, popularity
+                            FROM tracks WHERE id IN ({format_strings})
+                        """, batch)
+                        columns = [col[0] for col in cursor.description]
+                        for row in cursor.fetchall():
+                            record = dict(zip(columns, row), artist_genres=[])
+                            record['release_date'] = format_release_date(record['release_date'],
+                                                                         record.pop('release_date_precision'))
+                            records[row[0]] = record
+
+                        cursor.execute(f"""
+                            SELECT ag.track_id, g.name FROM artist_genres ag
+                            JOIN genres g ON g.id = ag.genre_id
+                            WHERE ag.track_id IN ({format_strings})
+                            ORDER BY g.id
+                        """, batch)
+                        for track_id, genre in cursor.fetchall():
+                            records[track_id]['artist_genres'].append(sys.intern(genre))
+
+                    for track_id, features in load_features(batch, db).items():
+                        if track_id in records:
+                            records[track_id]['audio_features'] = features
         except Exception as e:
-            print(f"Error fetching playlist data: {e}")
+            print(f"Error loading tracks: {e}")
             return []
+        return [records[track_id] for track_id in track_ids if track_id in records]
+
+    def expand_candidates(self, tracks_data, mood_description=None, k=200):
+        """`tracks_data` plus up to k similar tracks from the whole local catalog.
+
+        Neighbours of the given tracks (nudged towards the mood when one is
+        given) come from the track index; their records are read from MySQL.
+        """
+        seed_ids = [t['id'] for t in tracks_data]
+        neighbours = self.track_index.similar_to(seed_ids, k, mood_description)
+        extra = self.load_tracks([track_id for track_id, _ in neighbours])
+        if extra:
+            print(f"🔎 Added {len(extra)} similar tracks from the local catalog")
+        return tracks_data + extra
 
-    def store_tracks_batch(self, tracks_data):
-        """Optimized batch storage of tracks, genres, and history"""
+    def track_index_is_current(self):
+        """Whether the track index holds as many tracks, and tracks with audio features, as MySQL"""
+        known_feature = ' OR '.join(f"f.{column} IS NOT NULL" for column in FEATURE_COLUMNS)
+        with db_pool.transaction() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM tracks")
+            stored_tracks = cursor.fetchone()[0]
+            cursor.execute(f"""
+                SELECT COUNT(*) FROM track_features f JOIN tracks t ON t.id = f.track_id WHERE {known_feature}
+            """)
+            stored_features = cursor.fetchone()[0]
+        return len(self.track_index) == stored_tracks and self.track_index.feature_count() == stored_features
+
+    def ensure_track_index(self):
+        """Rebuild the track index from MySQL when its file was missing or is behind the stored tracks"""
+        try:
+            current = self.track_index_is_current()
+        except Exception as e:
+            print(f"Warning: Error checking track index: {e}")
+            return False
+        if not current:
+            print("🔧 Track index does not match MySQL, rebuilding it...")
+            self.rebuild_track_index()
+        return True
+
+    def _check_default_track_index(self):
+        global _default_index_checked
+        with _default_index_check_lock:
+            if not _default_index_checked:
+                _default_index_checked = self.ensure_track_index()
+
+    def rebuild_track_index(self, batch_size=TRACK_LOAD_BATCH_SIZE):
+        """Re-index every track in MySQL, with its stored audio features, from scratch and save it"""
+        self.track_index.clear()
+        last_id = ''
+        total = 0
+        while True:
+            try:
+                with db_pool.transaction() as cursor:
+                    cursor.execute("SELECT id FROM tracks WHERE id > %s ORDER BY id LIMIT %s", (last_id, batch_size))
+                    track_ids = [row[0] for row in cursor.fetchall()]
+            except Exception as e:
+                print(f"Error rebuilding track index: {e}")
+                break
+            if not track_ids:
+                break
+            self.track_index.add(self.load_tracks(track_ids))
+            total += len(track_ids)
+            last_id = track_ids[-1]
+        self.track_index.save()
+        print(f"✅ Track index rebuilt with {total} tracks")
+        return total
+
+    @staticmethod
+    def _primary_artist_id(raw_track):
+        return raw_track['artists'][0].get('id') if raw_track.get('artists') else None
+
+    @staticmethod
+    def _primary_artist_ids(raw_tracks):
+        return {t['artists'][0]['id'] for t in raw_tracks if t.get('artists') and t['artists'][0].get('id')}
+
+    @staticmethod
+    def _build_track_record(track, artist_genres_map):
+        """Construct the track data object used throughout the app"""
+        primary_artist = track['artists'][0] if track.get('artists') else None
+        genres = artist_genres_map.get(primary_artist['id'], []) if primary_artist else []
+
+        return {
+            "id": track.get('id', ''),
+            "track_name": track.get('name', 'Unknown'),
+            "artist": primary_artist['name'] if primary_artist else 'Unknown',
+            "album": track['album']['name'] if track.get('album') else 'Unknown',
+            "release_date": track['album']['release_date'] if track.get('album') else None,
+            "artist_genres": genres,
+            "popularity": track.get('popularity', 0)
+        }
+
+    def store_tracks_batch(self, tracks_data, record_requests=True):
+        """Optimized batch storage of tracks, genres, and (unless record_requests is False) history.
+
+        Returns True once the batch is committed, False (after printing why) when it was not.
+        """
         try:
             track_values = []
-            genre_values = []
-            history_values = []
+            genre_values = set()
             
-            for t in tracks_data:
-                # Format date
-                r_date = t['release_date']
-                if r_date:
-                    if len(r_date) == 4: r_date += "-01-01"
-                    elif len(r_date) == 7: r_date += "-01"
-                
-                track_values.append((
-                    t['id'], t['track_name'], t['artist'], t['album'], r_date, t['popularity']
-                ))
-                
-                for g in t['artist_genres']:
-                    genre_values.append((t['id'], g))
-                
-                history_values.append((t['id'],))
-
-            # Bulk Upsert Tracks
-            self.cursor.executemany("""
-                INSERT INTO tracks (id, track_name, artist, album, release_date, popularity)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                    track_name = VALUES(track_name), artist = VALUES(artist),
-                    album = VALUES(album), popularity = VALUES(popularity)
-            """, track_values)
+            with db_pool.connection() as db:
+                # Intern genre names first (commits on its own, the dictionary is append-only)
+                genre_names = {g for t in tracks_data for g in t['artist_genres']}
+                genre_ids = genre_dictionary.resolve(genre_names, db) if genre_names else {}
+
+                for t in tracks_data:
+                    release_date, precision = parse_release_date(t['release_date'])
+                    track_values.append((
+                        t['id'], t['track_name'], t['artist'], t['album'], release_date, precision, t['popularity']
+                    ))
+                    
+                    for g in t['artist_genres']:
+                        genre_values.add((t['id'], genre_ids[g]))
+
+                # Upserts lock tracks rows in id order, so concurrent ingests of the same tracks queue up
+                track_values.sort(key=lambda row: row[0])
 
-            # Refresh Genres (Delete old for these tracks, Insert new)
-            track_ids = [t[0] for t in track_values]
-            if track_ids:
-                format_strings = ','.join(['%s'] * len(track_ids))
-                self.cursor.execute(f"DELETE FROM artist_genres WHERE track_id IN ({format_strings})", track_ids)
-                
-                if genre_values:
-                    self.cursor.executemany("INSERT INTO artist_genres (track_id, genre) VALUES (%s, %s)", genre_values)
-                
-                # Log History
-                if history_values:
-                    self.cursor.executemany("INSERT INTO track_history (track_id) VALUES (%s)", history_values)
-
-            self.db.commit()
+                def write_batch(cursor):
+                    # Bulk Upsert Tracks
+                    cursor.executemany("""
+                        INSERT INTO tracks (id, track_name, artist, album, release_date, release_date_precision, popularity)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s)
+                        ON DUPLICATE KEY UPDATE
+                            track_name = VALUES(track_name), artist = VALUES(artist), album = VALUES(album),
+                            release_date = VALUES(release_date), release_date_precision = VALUES(release_date_precision),
+                            popularity = VALUES(popularity)
+                    """, track_values)
+
+                    # Refresh Genres (only write the rows that actually changed)
+                    track_ids = list({t[0] for t in track_values})
+                    if track_ids:
+                        format_strings = ','.join(['%s'] * len(track_ids))
+                        # The diff must be against the latest rows, or a concurrent ingest of the same tracks
+                        # computes the same diff and the summaries get its delta twice. The tracks rows locked
+                        # above serialize such ingests; at READ COMMITTED this locking read then sees the
+                        # other's committed rows and locks only existing ones, with no gap locks that would
+                        # deadlock ingests inserting genres for different new tracks
+                        cursor.execute(f"""
+                            SELECT track_id, genre_id FROM artist_genres WHERE track_id IN ({format_strings}) FOR UPDATE
+                        """, track_ids)
+                        to_add, to_remove = diff_genre_rows(set(cursor.fetchall()), genre_values)
+
+                        for i in range(0, len(to_remove), GENRE_DELETE_BATCH_SIZE):
+                            batch = to_remove[i:i + GENRE_DELETE_BATCH_SIZE]
+                            pairs = ','.join(['(%s, %s)'] * len(batch))
+                            cursor.execute(f"DELETE FROM artist_genres WHERE (track_id, genre_id) IN ({pairs})",
+                                           [value for row in batch for value in row])
+
+                        if to_add:
+                            # Primary key (track_id, genre_id) makes this idempotent under concurrent ingests
+                            cursor.executemany("INSERT IGNORE INTO artist_genres (track_id, genre_id) VALUES (%s, %s)", to_add)
+
+                        if to_add or to_remove:
+                            self._apply_genre_diff_to_summaries(cursor, to_add, to_remove)
+
+                    # Log History
+                    if record_requests:
+                        self._record_track_requests(cursor, [t['id'] for t in tracks_data])
+
+                # Deadlocks with other writers (e.g. playlist edits) roll back the whole batch; run it again
+                db_pool.run_transaction(write_batch, db, isolation_level='READ COMMITTED')
+
+            # Only committed tracks enter the index
+            self.track_index.add(tracks_data)
+            self.track_index.maybe_save()
+            return True
             
         except Exception as e:
             print(f"Error storing batch tracks: {e}")
-            self.db.rollback()
+            return False
+
+    def _record_track_requests(self, cursor, track_ids):
+        """Log one request per track of an ingest, as configured by history_mode"""
+        if self.history_mode == 'off' or not track_ids:
+            return
+        if self.history_mode == 'full':
+            cursor.executemany("INSERT INTO track_history (track_id) VALUES (%s)", [(t,) for t in track_ids])
+        # Sorted keys keep concurrent ingests locking rollup rows in the same order
+        counts = sorted(Counter(track_ids).items())
+        cursor.executemany("""
+            INSERT INTO track_request_daily (day, track_id, request_count)
+            VALUES (CURRENT_DATE, %s, %s)
+            ON DUPLICATE KEY UPDATE request_count = request_count + VALUES(request_count)
+        """, counts)
+
+    def get_top_requested_tracks(self, days=7, limit=10):
+        """Most requested tracks over the last `days` days, from the daily rollup"""
+        try:
+            with db_pool.transaction() as cursor:
+                cursor.execute("""
+                    SELECT t.id, t.track_name, t.artist, r.requests
+                    FROM (
+                        SELECT track_id, SUM(request_count) AS requests
+                        FROM track_request_daily
+                        WHERE day > CURRENT_DATE - INTERVAL %s DAY
+                        GROUP BY track_id
+                        ORDER BY requests DESC, track_id
+                        LIMIT %s
+                    ) r
+                    JOIN tracks t ON t.id = r.track_id
+                    ORDER BY r.requests DESC, t.id
+                """, (days, limit))
+                columns = [col[0] for col in cursor.description]
+                return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        except Exception as e:
+            print(f"Error getting top requested tracks: {e}")
+            return []
+
+    def maintain_track_history(self, retention_days=TRACK_HISTORY_RETENTION_DAYS,
+                               rollup_retention_days=TRACK_ROLLUP_RETENTION_DAYS):
+        """Store the retention settings for the daily MySQL event, then apply them now:
+        add upcoming track_history partitions and drop expired ones"""
+        try:
+            with db_pool.transaction() as cursor:
+                cursor.execute("""
+                    INSERT INTO track_history_settings (id, retention_days, months_ahead, rollup_retention_days)
+                    VALUES (1, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE retention_days = VALUES(retention_days),
+                        months_ahead = VALUES(months_ahead), rollup_retention_days = VALUES(rollup_retention_days)
+                """, (retention_days, TRACK_HISTORY_MONTHS_AHEAD, rollup_retention_days))
+            with db_pool.transaction() as cursor:
+                cursor.callproc('MaintainConfiguredTrackHistory')
+            print(f"✅ Track history kept to {retention_days} days")
+            return True
+        except Exception as e:
+            print(f"Error maintaining track history: {e}")
+            return False
 
     def store_custom_playlist(self, playlist_data, mood_description):
         """Store custom playlist using batch processing"""
+        playlist_ids = self.store_custom_playlists([(playlist_data, mood_description)])
+        if playlist_ids:
+            print(f"✅ Custom playlist '{playlist_data['playlist_name']}' stored with ID: {playlist_ids[0]}")
+            return playlist_ids[0]
+        return None
+
+    def store_custom_playlists(self, playlists):
+        """Store many (playlist_data, mood_description) pairs in one transaction; returns their IDs.
+
+        Stats are computed here and written with each header, so a save costs
+        one popularity lookup per TRACK_LOAD_BATCH_SIZE tracks, one INSERT per
+        playlist and one multi-row INSERT for all tracks.
+        """
         try:
-            # Insert Playlist Header
-            self.cursor.execute("""
-                INSERT INTO custom_playlists (playlist_name, description, mood_description)
-                VALUES (%s, %s, %s)
-            """, (playlist_data['playlist_name'], playlist_data['description'], mood_description))
-            
-            playlist_id = self.cursor.lastrowid
-            
-            # Batch Insert Tracks (Triggers in DB will update stats automatically)
-            track_values = []
-            for track in playlist_data['tracks']:
-                track_values.append((
-                    playlist_id, track.get('track_id'), track['track_name'],
-                    track['artist'], track['album'], track['position']
-                ))
-            
-            if track_values:
-                self.cursor.executemany("""
-                    INSERT INTO custom_playlist_tracks 
-                    (playlist_id, track_id, track_name, artist, album, position)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                """, track_values)
-            
-            self.db.commit()
-            print(f"✅ Custom playlist '{playlist_data['playlist_name']}' stored with ID: {playlist_id}")
-            
+            with db_pool.transaction() as cursor:
+                popularity = self._track_popularity(cursor, {
+                    t.get('track_id') for playlist_data, _ in playlists for t in playlist_data['tracks']
+                })
+
+                playlist_ids = []
+                track_values = []
+                for playlist_data, mood_description in playlists:
+                    tracks = playlist_data['tracks']
+                    track_popularity = [popularity.get(t.get('track_id'), 0) for t in tracks]
+                    cursor.execute("""
+                        INSERT INTO custom_playlists
+                            (playlist_name, description, mood_description, total_tracks, total_popularity)
+                        VALUES (%s, %s, %s, %s, %s)
+                    """, (playlist_data['playlist_name'], playlist_data['description'], mood_description,
+                          len(tracks), sum(track_popularity)))
+                    playlist_id = cursor.lastrowid
+                    playlist_ids.append(playlist_id)
+                    track_values.extend(self._playlist_track_row(playlist_id, track, pop)
+                                        for track, pop in zip(tracks, track_popularity))
+
+                # Genres are read (and share-locked) before the tracks go in, see _adjust_genre_summary
+                self._adjust_genre_summary(cursor, [(row[0], row[1]) for row in track_values], +1)
+                self._insert_playlist_tracks(cursor, track_values)
+            return playlist_ids
         except Exception as e:
             print(f"Error storing custom playlist: {e}")
-            self.db.rollback()
+            return []
+
+    def add_custom_playlist_tracks(self, playlist_id, tracks):
+        """Append track dicts (track_id, track_name, artist, album, position) to a stored playlist"""
+        try:
+            with db_pool.transaction() as cursor:
+                popularity = self._track_popularity(cursor, {t.get('track_id') for t in tracks})
+                track_popularity = [popularity.get(t.get('track_id'), 0) for t in tracks]
+                self._adjust_genre_summary(cursor, [(playlist_id, t.get('track_id')) for t in tracks], +1)
+                self._insert_playlist_tracks(cursor, [self._playlist_track_row(playlist_id, track, pop)
+                                                      for track, pop in zip(tracks, track_popularity)])
+                # One aggregate update for the whole batch
+                cursor.execute("""
+                    UPDATE custom_playlists
+                    SET total_tracks = total_tracks + %s, total_popularity = total_popularity + %s
+                    WHERE id = %s
+                """, (len(tracks), sum(track_popularity), playlist_id))
+            return True
+        except Exception as e:
+            print(f"Error adding custom playlist tracks: {e}")
+            return False
+
+    def delete_custom_playlist_tracks(self, playlist_id, positions):
+        """Remove the tracks at `positions` from a stored playlist; returns how many were removed"""
+        positions = list(positions)
+        if not positions:
+            return 0
+        try:
+            with db_pool.transaction() as cursor:
+                format_strings = ','.join(['%s'] * len(positions))
+                where = f"playlist_id = %s AND position IN ({format_strings})"
+                # Locks the rows, so the counters subtract exactly what the DELETE removes
+                cursor.execute(f"""
+                    SELECT track_id, IFNULL(popularity, 0) FROM custom_playlist_tracks
+                    WHERE {where} FOR UPDATE
+                """, [playlist_id, *positions])
+                rows = cursor.fetchall()
+                removed, removed_popularity = len(rows), sum(pop for _, pop in rows)
+                cursor.execute(f"DELETE FROM custom_playlist_tracks WHERE {where}", [playlist_id, *positions])
+                self._adjust_genre_summary(cursor, [(playlist_id, track_id) for track_id, _ in rows], -1)
+                cursor.execute("""
+                    UPDATE custom_playlists
+                    SET total_tracks = total_tracks - %s, total_popularity = total_popularity - %s
+                    WHERE id = %s
+                """, (removed, removed_popularity, playlist_id))
+            return removed
+        except Exception as e:
+            print(f"Error deleting custom playlist tracks: {e}")
+            return 0
+
+    def delete_custom_playlists(self, playlist_ids):
+        """Delete stored playlists (their tracks and publish jobs cascade); returns how many were deleted"""
+        playlist_ids = list(playlist_ids)
+        deleted = 0
+        try:
+            with db_pool.transaction() as cursor:
+                for i in range(0, len(playlist_ids), TRACK_LOAD_BATCH_SIZE):
+                    batch = playlist_ids[i:i + TRACK_LOAD_BATCH_SIZE]
+                    format_strings = ','.join(['%s'] * len(batch))
+                    cursor.execute(f"DELETE FROM custom_playlists WHERE id IN ({format_strings})", batch)
+                    deleted += cursor.rowcount
+            return deleted
+        except Exception as e:
+            print(f"Error deleting custom playlists: {e}")
+            return 0
+
+    def check_playlist_stats(self, repair=False):
+        """Playlists whose cached counters disagree with their tracks, optionally recomputed.
+
+        Returns [{'id', 'total_tracks', 'actual_tracks', 'total_popularity', 'actual_popularity'}].
+        """
+        try:
+            with db_pool.transaction() as cursor:
+                cursor.execute("""
+                    SELECT p.id, p.total_tracks, IFNULL(s.actual_tracks, 0) AS actual_tracks,
+                           p.total_popularity, IFNULL(s.actual_popularity, 0) AS actual_popularity
+                    FROM custom_playlists p
+                    LEFT JOIN (
+                        SELECT playlist_id, COUNT(*) AS actual_tracks, SUM(popularity) AS actual_popularity
+                        FROM custom_playlist_tracks GROUP BY playlist_id
+                    ) s ON s.playlist_id = p.id
+                    WHERE p.total_tracks <> IFNULL(s.actual_tracks, 0)
+                       OR p.total_popularity <> IFNULL(s.actual_popularity, 0)
+                """)
+                columns = [col[0] for col in cursor.description]
+                drift = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                if drift and repair:
+                    cursor.callproc('RecomputePlaylistStats', [None])
+            if drift:
+                print(f"⚠️ {len(drift)} playlists with stale stats{' (recomputed)' if repair else ''}")
+            return drift
+        except Exception as e:
+            print(f"Error checking playlist stats: {e}")
+            return []
+
+    def check_playlist_genre_summary(self, repair=False):
+        """Summary rows whose track_count disagrees with the base tables, optionally rebuilt.
+
+        Returns [{'playlist_id', 'genre_id', 'expected', 'actual'}].
+        """
+        try:
+            with db_pool.transaction() as cursor:
+                cursor.execute("""
+                    WITH expected AS (
+                        SELECT cpt.playlist_id, ag.genre_id, COUNT(*) AS track_count
+                        FROM custom_playlist_tracks cpt
+                        JOIN artist_genres ag ON ag.track_id = cpt.track_id
+                        GROUP BY cpt.playlist_id, ag.genre_id
+                    )
+                    SELECT e.playlist_id, e.genre_id, e.track_count AS expected, IFNULL(s.track_count, 0) AS actual
+                    FROM expected e
+                    LEFT JOIN playlist_genre_summary s ON s.playlist_id = e.playlist_id AND s.genre_id = e.genre_id
+                    WHERE s.track_count IS NULL OR s.track_count <> e.track_count
+                    UNION ALL
+                    SELECT s.playlist_id, s.genre_id, 0, s.track_count
+                    FROM playlist_genre_summary s
+                    LEFT JOIN expected e ON e.playlist_id = s.playlist_id AND e.genre_id = s.genre_id
+                    WHERE e.playlist_id IS NULL
+                """)
+                columns = [col[0] for col in cursor.description]
+                drift = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                if drift and repair:
+                    cursor.callproc('RebuildPlaylistGenreSummary', [None])
+            if drift:
+                playlists = len({row['playlist_id'] for row in drift})
+                print(f"⚠️ {playlists} playlists with stale genre summaries{' (rebuilt)' if repair else ''}")
+            return drift
+        except Exception as e:
+            print(f"Error checking playlist genre summaries: {e}")
+            return []
+
+    @staticmethod
+    def _adjust_genre_summary(cursor, playlist_tracks, sign):
+        """Count the genres of (playlist_id, track_id) rows into (sign=+1) or out of (-1) playlist_genre_summary.
+
+        The genres stay share-locked until commit: an ingest changing them waits, then sees these
+        playlist rows in _apply_genre_diff_to_summaries; one that got there first is waited for,
+        and its new genres are counted here. Callers adding tracks run this before inserting them.
+        """
+        track_ids = sorted({track_id for _, track_id in playlist_tracks if track_id})
+        genres_by_track = {}
+        for i in range(0, len(track_ids), TRACK_LOAD_BATCH_SIZE):
+            batch = track_ids[i:i + TRACK_LOAD_BATCH_SIZE]
+            format_strings = ','.join(['%s'] * len(batch))
+            cursor.execute(f"""
+                SELECT track_id, genre_id FROM artist_genres WHERE track_id IN ({format_strings}) FOR SHARE
+            """, batch)
+            for track_id, genre_id in cursor.fetchall():
+                genres_by_track.setdefault(track_id, []).append(genre_id)
+
+        deltas = Counter()
+        for playlist_id, track_id in playlist_tracks:
+            for genre_id in genres_by_track.get(track_id, ()):
+                deltas[(playlist_id, genre_id)] += sign
+        SpotifyAPI._write_genre_summary_deltas(cursor, deltas)
+
+    @staticmethod
+    def _apply_genre_diff_to_summaries(cursor, to_add, to_remove):
+        """Carry changed artist_genres rows into the summaries of every playlist holding those tracks"""
+        track_ids = sorted({track_id for track_id, _ in to_add} | {track_id for track_id, _ in to_remove})
+        playlists_by_track = {}
+        for i in range(0, len(track_ids), TRACK_LOAD_BATCH_SIZE):
+            batch = track_ids[i:i + TRACK_LOAD_BATCH_SIZE]
+            format_strings = ','.join(['%s'] * len(batch))
+            # Locking read: playlists committed since this transaction's snapshot count too, and
+            # none can gain or lose these tracks before the deltas are written
+            cursor.execute(f"""
+                SELECT track_id, playlist_id, COUNT(*) FROM custom_playlist_tracks
+                WHERE track_id IN ({format_strings}) GROUP BY track_id, playlist_id FOR SHARE
+            """, batch)
+            for track_id, playlist_id, occurrences in cursor.fetchall():
+                playlists_by_track.setdefault(track_id, []).append((playlist_id, occurrences))
+        if not playlists_by_track:
+            return
+
+        deltas = Counter()
+        for rows, sign in ((to_add, +1), (to_remove, -1)):
+            for track_id, genre_id in rows:
+                for playlist_id, occurrences in playlists_by_track.get(track_id, ()):
+                    deltas[(playlist_id, genre_id)] += sign * occurrences
+        SpotifyAPI._write_genre_summary_deltas(cursor, deltas)
+
+    @staticmethod
+    def _write_genre_summary_deltas(cursor, deltas):
+        deltas = [(playlist_id, genre_id, delta) for (playlist_id, genre_id), delta in deltas.items() if delta]
+        if not deltas:
+            return
+        cursor.executemany("""
+            INSERT INTO playlist_genre_summary (playlist_id, genre_id, track_count) VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE track_count = track_count + VALUES(track_count)
+        """, deltas)
+        if any(delta < 0 for _, _, delta in deltas):
+            # Genres no track of the playlist carries any more
+            playlist_ids = list({playlist_id for playlist_id, _, delta in deltas if delta < 0})
+            format_strings = ','.join(['%s'] * len(playlist_ids))
+            cursor.execute(f"""
+                DELETE FROM playlist_genre_summary WHERE playlist_id IN ({format_strings}) AND track_count <= 0
+            """, playlist_ids)
+
+    @staticmethod
+    def _track_popularity(cursor, track_ids):
+        """{track_id: popularity} for the stored tracks among `track_ids`"""
+        track_ids = [track_id for track_id in track_ids if track_id]
+        popularity = {}
+        for i in range(0, len(track_ids), TRACK_LOAD_BATCH_SIZE):
+            batch = track_ids[i:i + TRACK_LOAD_BATCH_SIZE]
+            format_strings = ','.join(['%s'] * len(batch))
+            cursor.execute(f"SELECT id, IFNULL(popularity, 0) FROM tracks WHERE id IN ({format_strings})", batch)
+            popularity.update(cursor.fetchall())
+        return popularity
+
+    @staticmethod
+    def _playlist_track_row(playlist_id, track, popularity):
+        return (playlist_id, track.get('track_id'), track['track_name'], track['artist'],
+                track['album'], track['position'], popularity)
+
+    @staticmethod
+    def _insert_playlist_tracks(cursor, track_values):
+        if track_values:
+            # A plain multi-row INSERT: no triggers, counters are maintained by the caller
+            cursor.executemany("""
+                INSERT INTO custom_playlist_tracks
+                (playlist_id, track_id, track_name, artist, album, position, popularity)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, track_values)
 
     def get_enhanced_playlist_analysis(self, playlist_id):
         """Get analytics using the Optimized View via Stored Procedure"""
         try:
-            self.cursor.callproc('GetEnhancedPlaylistAnalysis', [playlist_id])
-            for result in self.cursor.stored_results():
-                row = result.fetchone()
-                if row:
-                    return dict(zip(result.column_names, row))
+            with db_pool.transaction() as cursor:
+                cursor.callproc('GetEnhancedPlaylistAnalysis', [playlist_id])
+                for result in cursor.stored_results():
+                    row = result.fetchone()
+                    if row:
+                        return dict(zip(result.column_names, row))
             return None
         except Exception as e:
             print(f"Error in enhanced analysis: {e}")
@@ -215,64 +1027,211 @@ class SpotifyAPI:
     def get_user_playlist_stats(self, limit=5):
         """Get list of playlists with stats via Stored Procedure"""
         try:
-            self.cursor.callproc('GetUserPlaylistStats', [limit])
-            for result in self.cursor.stored_results():
-                columns = result.column_names
-                return [dict(zip(columns, row)) for row in result.fetchall()]
+            with db_pool.transaction() as cursor:
+                cursor.callproc('GetUserPlaylistStats', [limit])
+                for result in cursor.stored_results():
+                    columns = result.column_names
+                    return [dict(zip(columns, row)) for row in result.fetchall()]
             return []
         except Exception as e:
             print(f"Error getting playlist stats: {e}")
             return []
 
-    def get_custom_playlists(self):
-        """Standard retrieval of playlists"""
+    def get_custom_playlists(self, limit=None, offset=0):
+        """Playlists newest first; `limit`/`offset` select one page (all of them when limit is None)"""
         try:
-            self.cursor.execute("""
-                SELECT id, playlist_name, description, mood_description, created_at 
-                FROM custom_playlists ORDER BY created_at DESC
-            """)
-            columns = [col[0] for col in self.cursor.description]
-            return [dict(zip(columns, row)) for row in self.cursor.fetchall()]
+            with db_pool.transaction() as cursor:
+                # id breaks created_at ties so pages never overlap or skip rows
+                query = """
+                    SELECT id, playlist_name, description, mood_description, total_tracks, created_at
+                    FROM custom_playlists ORDER BY created_at DESC, id DESC
+                """
+                if limit is None:
+                    cursor.execute(query)
+                else:
+                    cursor.execute(query + " LIMIT %s OFFSET %s", (limit, offset))
+                columns = [col[0] for col in cursor.description]
+                return [dict(zip(columns, row)) for row in cursor.fetchall()]
         except Exception as e:
             print(f"Error fetching custom playlists: {e}")
             return []
 
+    def count_custom_playlists(self):
+        """Number of stored custom playlists, for paging"""
+        try:
+            with db_pool.transaction() as cursor:
+                cursor.execute("SELECT COUNT(*) FROM custom_playlists")
+                return cursor.fetchone()[0]
+        except Exception as e:
+            print(f"Error counting custom playlists: {e}")
+            return 0
+
     def get_custom_playlist_tracks(self, playlist_id):
         """Standard retrieval of playlist tracks"""
+        return self.get_custom_playlist_tracks_bulk([playlist_id]).get(playlist_id, [])
+
+    def get_custom_playlist_tracks_bulk(self, playlist_ids):
+        """{playlist_id: tracks in position order} for many playlists in one query per batch of ids"""
+        playlist_ids = list(dict.fromkeys(playlist_ids))
+        tracks_by_playlist = {playlist_id: [] for playlist_id in playlist_ids}
         try:
-            self.cursor.execute("""
-                SELECT track_name, artist, album, position 
-                FROM custom_playlist_tracks 
-                WHERE playlist_id = %s ORDER BY position
-            """, (playlist_id,))
-            columns = [col[0] for col in self.cursor.description]
-            return [dict(zip(columns, row)) for row in self.cursor.fetchall()]
+            with db_pool.transaction() as cursor:
+                for i in range(0, len(playlist_ids), TRACK_LOAD_BATCH_SIZE):
+                    batch = playlist_ids[i:i + TRACK_LOAD_BATCH_SIZE]
+                    format_strings = ','.join(['%s'] * len(batch))
+                    # Served in order by idx_cpt_playlist_position
+                    cursor.execute(f"""
+                        SELECT playlist_id, track_name, artist, album, position
+                        FROM custom_playlist_tracks
+                        WHERE playlist_id IN ({format_strings}) ORDER BY playlist_id, position
+                    """, batch)
+                    columns = [col[0] for col in cursor.description][1:]
+                    for row in cursor.fetchall():
+                        tracks_by_playlist[row[0]].append(dict(zip(columns, row[1:])))
+            return tracks_by_playlist
         except Exception as e:
             print(f"Error fetching custom playlist tracks: {e}")
-            return []
+            return {}
+
+    def current_user_id(self):
+        """Spotify user id of the authenticated account, fetched once per client"""
+        with self._user_id_lock:
+            if self._user_id is None:
+                self._user_id = self._call(self.sp.current_user)['id']
+            return self._user_id
+
+    def create_spotify_playlist(self, playlist_name, description, track_ids, custom_playlist_id=None,
+                                priority=None):
+        """Create playlist on Spotify and add the tracks in order, PUBLISH_CHUNK_SIZE per call.
 
-    def create_spotify_playlist(self, playlist_name, description, track_ids):
-        """Create playlist on Spotify"""
+        With a `custom_playlist_id` progress is recorded in spotify_publish_jobs,
+        so calling publish_custom_playlist again after a failure resumes the
+        same Spotify playlist instead of creating a new one.
+        """
         try:
-            user_id = self.sp.current_user()['id']
-            playlist = self.sp.user_playlist_create(
-                user=user_id,
+            playlist = self._call(
+                self.sp.user_playlist_create,
+                user=self.current_user_id(),
                 name=playlist_name,
                 description=description,
-                public=True
+                public=True,
+                priority=priority
             )
-            
             valid_ids = [tid for tid in track_ids if tid]
-            if valid_ids:
-                self.sp.playlist_add_items(playlist['id'], valid_ids)
-            
+            if custom_playlist_id is not None:
+                self._save_publish_job(custom_playlist_id, playlist['id'], len(valid_ids), 0)
+            self._add_playlist_items(playlist['id'], valid_ids, 0, custom_playlist_id, priority)
             return playlist
         except Exception as e:
             print(f"Error creating Spotify playlist: {e}")
             return None
 
+    def resume_spotify_playlist(self, spotify_playlist_id, track_ids, custom_playlist_id=None, priority=None):
+        """Add whatever part of `track_ids` an earlier, interrupted publish did not get to.
+
+        Spotify's own item count is the source of truth: a chunk can land even
+        when recording its progress failed.
+        """
+        try:
+            playlist = self._call(self.sp.playlist, spotify_playlist_id,
+                                  fields="id,name,external_urls,tracks.total", priority=priority)
+            self._add_playlist_items(spotify_playlist_id, [tid for tid in track_ids if tid],
+                                     playlist['tracks']['total'], custom_playlist_id, priority)
+            return playlist
+        except Exception as e:
+            print(f"Error resuming Spotify playlist: {e}")
+            return None
+
+    def _add_playlist_items(self, spotify_playlist_id, track_ids, start, custom_playlist_id=None, priority=None):
+        # Chunks of one playlist go strictly one after another so the order is kept
+        for offset in range(start, len(track_ids), PUBLISH_CHUNK_SIZE):
+            chunk = track_ids[offset:offset + PUBLISH_CHUNK_SIZE]
+            self._call(self.sp.playlist_add_items, spotify_playlist_id, chunk, priority=priority)
+            if custom_playlist_id is not None:
+                self._save_publish_job(custom_playlist_id, spotify_playlist_id, len(track_ids), offset + len(chunk))
+        if custom_playlist_id is not None and start >= len(track_ids):
+            self._save_publish_job(custom_playlist_id, spotify_playlist_id, len(track_ids), len(track_ids))
+
+    @staticmethod
+    def _save_publish_job(custom_playlist_id, spotify_playlist_id, total_tracks, published_tracks):
+        with db_pool.transaction() as cursor:
+            cursor.execute("""
+                INSERT INTO spotify_publish_jobs
+                    (custom_playlist_id, spotify_playlist_id, total_tracks, published_tracks, is_complete)
+                VALUES (%s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE spotify_playlist_id = VALUES(spotify_playlist_id),
+                    total_tracks = VALUES(total_tracks), published_tracks = VALUES(published_tracks),
+                    is_complete = VALUES(is_complete)
+            """, (custom_playlist_id, spotify_playlist_id, total_tracks, published_tracks,
+                  published_tracks >= total_tracks))
+
+    def publish_custom_playlist(self, custom_playlist_id, priority=None):
+        """Publish a stored custom playlist to Spotify, resuming an earlier attempt. Returns the Spotify playlist id"""
+        try:
+            with db_pool.transaction() as cursor:
+                cursor.execute("""
+                    SELECT cp.playlist_name, cp.description, j.spotify_playlist_id, j.is_complete
+                    FROM custom_playlists cp
+                    LEFT JOIN spotify_publish_jobs j ON j.custom_playlist_id = cp.id
+                    WHERE cp.id = %s
+                """, (custom_playlist_id,))
+                row = cursor.fetchone()
+                if row is None:
+                    print(f"Error publishing custom playlist: no playlist with ID {custom_playlist_id}")
+                    return None
+                playlist_name, description, spotify_playlist_id, is_complete = row
+                if is_complete:
+                    return spotify_playlist_id
+
+                cursor.execute("""
+                    SELECT track_id FROM custom_playlist_tracks
+                    WHERE playlist_id = %s ORDER BY position
+                """, (custom_playlist_id,))
+                track_ids = [track_id for (track_id,) in cursor.fetchall()]
+        except Exception as e:
+            print(f"Error publishing custom playlist: {e}")
+            return None
+
+        if spotify_playlist_id:
+            playlist = self.resume_spotify_playlist(spotify_playlist_id, track_ids, custom_playlist_id, priority)
+        else:
+            playlist = self.create_spotify_playlist(playlist_name, description or "", track_ids,
+                                                    custom_playlist_id, priority)
+        return playlist['id'] if playlist else None
+
+    def export_custom_playlists(self, custom_playlist_ids=None, concurrency=PUBLISH_CONCURRENCY):
+        """Publish many stored custom playlists (default: every one not yet fully published).
+
+        Up to `concurrency` playlists are written at once at background
+        priority, so interactive calls keep their place in the rate limit.
+        Returns {custom_playlist_id: Spotify playlist id, or None on failure}.
+        """
+        if custom_playlist_ids is None:
+            try:
+                with db_pool.transaction() as cursor:
+                    cursor.execute("""
+                        SELECT cp.id FROM custom_playlists cp
+                        LEFT JOIN spotify_publish_jobs j ON j.custom_playlist_id = cp.id
+                        WHERE j.is_complete IS NULL OR j.is_complete = FALSE
+                        ORDER BY cp.created_at, cp.id
+                    """)
+                    custom_playlist_ids = [playlist_id for (playlist_id,) in cursor.fetchall()]
+            except Exception as e:
+                print(f"Error listing custom playlists to export: {e}")
+                return {}
+
+        results = dict(zip(custom_playlist_ids, self.fetcher.imap(
+            lambda playlist_id: self.publish_custom_playlist(playlist_id, priority=BACKGROUND),
+            custom_playlist_ids, window=concurrency
+        )))
+        published = sum(1 for spotify_id in results.values() if spotify_id)
+        print(f"✅ Published {published}/{len(results)} custom playlists to Spotify")
+        return results
+
     def close(self):
-        """Close database connection"""
-        if self.db.is_connected():
-            self.cursor.close()
-            self.db.close()
\ No newline at end of file
+        """Stop fetch workers and save the track index (pooled DB connections stay open for the rest of the process)"""
+        self.fetcher.close()
+        try:
+            self.track_index.flush()
+        except Exception as e:
+            print(f"Warning: Error saving track index: {e}")
\ No newline at end of file
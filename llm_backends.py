@@ -0,0 +1,176 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Iterator
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'gemini')  # gemini | offline
+GEMINI_MODELS = ('models/gemini-2.5-pro', 'models/gemini-2.5-flash', 'models/gemini-2.0-flash')
+
+# Offline backend knobs, so load tests can be shaped from the environment
+OFFLINE_LLM_LATENCY = float(os.getenv('OFFLINE_LLM_LATENCY', '0'))  # seconds to first token
+OFFLINE_LLM_TOKENS_PER_SECOND = float(os.getenv('OFFLINE_LLM_TOKENS_PER_SECOND', '0'))  # 0 = instant
+OFFLINE_LLM_TRUNCATE = float(os.getenv('OFFLINE_LLM_TRUNCATE', '0'))  # share of replies cut short
+OFFLINE_LLM_MALFORMED = float(os.getenv('OFFLINE_LLM_MALFORMED', '0'))  # share of replies without JSON
+
+HANDLE_RE = re.compile(r"^(\d+)\|", re.MULTILINE)
+MAX_TRACKS_RE = re.compile(r"Maximum Tracks: (\d+)")
+
+class LLMBackend(ABC):
+    """What LLMHandler needs from a model: text for a prompt, whole or streamed.
+
+    `config` is a plain dict (temperature, top_p, top_k, max_output_tokens);
+    each backend maps it onto its own client.
+    """
+
+    name = ''
+
+    @abstractmethod
+    def generate(self, prompt: str, config: Dict) -> str:
+        """Whole response text for `prompt`"""
+
+    def stream(self, prompt: str, config: Dict) -> Iterator[str]:
+        yield self.generate(prompt, config)
+
+    async def generate_async(self, prompt: str, config: Dict) -> str:
+        return await asyncio.to_thread(self.generate, prompt, config)
+
+    def ping(self) -> bool:
+        """Cheap liveness probe that spends no generation tokens; raises when unreachable"""
+        return True
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini through google-generativeai, trying each model in GEMINI_MODELS"""
+
+    def __init__(self, api_key: str = None, model_names=GEMINI_MODELS):
+        # Imported here so the offline backend works without google-generativeai installed
+        import google.generativeai as genai
+        self._genai = genai
+
+        if api_key is None:
+            api_key = os.getenv('GEMINI_API_KEY')
+            if not api_key:
+                raise ValueError("Gemini API key not provided. Set GEMINI_API_KEY environment variable or pass as argument.")
+
+        genai.configure(api_key=api_key)
+
+        self.model = None
+        for model_name in model_names:
+            try:
+                self.model = genai.GenerativeModel(model_name)
+                break
+            except Exception:
+                continue
+        if self.model is None:
+            raise ValueError(f"None of the Gemini models {model_names} are available")
+        self.name = self.model.model_name
+
+    def _config(self, config):
+        return self._genai.types.GenerationConfig(**config)
+
+    def generate(self, prompt, config):
+        return self.model.generate_content(prompt, generation_config=self._config(config)).text
+
+    def stream(self, prompt, config):
+        response = self.model.generate_content(prompt, generation_config=self._config(config), stream=True)
+        for chunk in response:
+            # Chunks without text (e.g. a final MAX_TOKENS marker) raise on .text
+            try:
+                text = chunk.text
+            except ValueError:
+                continue
+            if text:
+                yield text
+
+    async def generate_async(self, prompt, config):
+        response = await self.model.generate_content_async(prompt, generation_config=self._config(config))
+        return response.text
+
+    def ping(self):
+        # Model metadata lookup: authenticates and reaches the API without generating
+        self._genai.get_model(self.name)
+        return True
+
+class OfflineBackend(LLMBackend):
+    """Deterministic stand-in for a hosted model, for tests and load tests without a network.
+
+    Answers playlist prompts with handles picked from the prompt's own track
+    table. The reply is a function of (prompt, seed), and so are the
+    simulated failures: `truncate_rate` of replies stop partway and
+    `malformed_rate` contain no JSON at all. Timing follows `latency`
+    (time to first token) and `tokens_per_second` (0 for instant), with a
+    token counted as 4 characters.
+    """
+
+    CHARS_PER_TOKEN = 4
+
+    def __init__(self, latency=OFFLINE_LLM_LATENCY, tokens_per_second=OFFLINE_LLM_TOKENS_PER_SECOND,
+                 truncate_rate=OFFLINE_LLM_TRUNCATE, malformed_rate=OFFLINE_LLM_MALFORMED, seed=0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.truncate_rate = truncate_rate
+        self.malformed_rate = malformed_rate
+        self.seed = seed
+        self.name = f"offline-{seed}"
+
+    def reply(self, prompt: str) -> str:
+        """The full text this backend answers `prompt` with"""
+        rng = random.Random(hashlib.sha256(f"{self.seed}:{prompt}".encode()).hexdigest())
+        if rng.random() < self.malformed_rate:
+            return "Sure! Here are some tracks I think you will love: the first one, then the third."
+
+        handles = [int(h) for h in HANDLE_RE.findall(prompt)]
+        match = MAX_TRACKS_RE.search(prompt)
+        max_tracks = int(match.group(1)) if match else 10
+        # Mostly the top of the (pre-ranked) table, shuffled into a listening order
+        picks = rng.sample(handles[:max_tracks * 2], min(max_tracks, len(handles)))
+        text = json.dumps({
+            "playlist_name": "Offline Mix",
+            "description": "Generated locally by the offline backend",
+            "tracks": picks
+        })
+        if rng.random() < self.truncate_rate:
+            text = text[:rng.randrange(len(text) // 2, len(text))]
+        return text
+
+    def _chunks(self, text):
+        size = self.CHARS_PER_TOKEN
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    def _chunk_delay(self, chunk):
+        if not self.tokens_per_second:
+            return 0
+        return len(chunk) / self.CHARS_PER_TOKEN / self.tokens_per_second
+
+    def generate(self, prompt, config):
+        text = self.reply(prompt)
+        time.sleep(self.latency + sum(self._chunk_delay(c) for c in self._chunks(text)))
+        return text
+
+    def stream(self, prompt, config):
+        text = self.reply(prompt)
+        time.sleep(self.latency)
+        for chunk in self._chunks(text):
+            time.sleep(self._chunk_delay(chunk))
+            yield chunk
+
+    async def generate_async(self, prompt, config):
+        text = self.reply(prompt)
+        await asyncio.sleep(self.latency + sum(self._chunk_delay(c) for c in self._chunks(text)))
+        return text
+
+def create_backend(name: str = None, api_key: str = None) -> LLMBackend:
+    """Build the backend selected by `name` or the LLM_BACKEND environment variable"""
+    name = (name or LLM_BACKEND).lower()
+    if name == 'offline':
+        return OfflineBackend()
+    if name == 'gemini':
+        return GeminiBackend(api_key)
+    raise ValueError(f"Unknown LLM backend '{name}' (expected 'gemini' or 'offline')")
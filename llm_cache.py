@@ -0,0 +1,185 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import db_pool
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LLM_CACHE_BACKEND = os.getenv('LLM_CACHE_BACKEND', 'memory')  # memory | sqlite | mysql | none
+LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', str(24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '1000'))
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', '.llm_cache.sqlite')
+
+def make_cache_key(tracks_data, mood_description, playlist_name, max_tracks, model_name='', prompt_version='',
+                   max_candidates=None):
+    """Content hash of the normalized generation inputs"""
+    track_keys = sorted(
+        t.get('id') or f"{t.get('track_name', '')}|{t.get('artist', '')}".lower()
+        for t in tracks_data
+    )
+    payload = json.dumps({
+        'tracks': track_keys,
+        'mood': " ".join((mood_description or "").lower().split()),
+        'name': (playlist_name or "").strip(),
+        'max_tracks': int(max_tracks),
+        # The candidate budget decides which tracks the prompt offers
+        'max_candidates': max_candidates,
+        'model': model_name,
+        'prompt_version': prompt_version
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class MemoryCacheBackend:
+    """Process-local LRU with TTL"""
+
+    def __init__(self, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (json text, stored_at)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[1] >= self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+class SQLiteCacheBackend:
+    """On-disk cache that survives restarts, shared by processes on the same machine"""
+
+    def __init__(self, path=LLM_CACHE_PATH, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_playlist_cache (
+                cache_key TEXT PRIMARY KEY,
+                playlist TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT playlist FROM llm_playlist_cache WHERE cache_key = ? AND created_at > ?",
+                (key, now - self.ttl)
+            ).fetchone()
+            if row:
+                self._conn.execute("UPDATE llm_playlist_cache SET last_used_at = ? WHERE cache_key = ?", (now, key))
+                self._conn.commit()
+            return row[0] if row else None
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("""
+                INSERT OR REPLACE INTO llm_playlist_cache (cache_key, playlist, created_at, last_used_at)
+                VALUES (?, ?, ?, ?)
+            """, (key, value, now, now))
+            self._conn.execute("DELETE FROM llm_playlist_cache WHERE created_at <= ?", (now - self.ttl,))
+            self._conn.execute("""
+                DELETE FROM llm_playlist_cache WHERE cache_key IN (
+                    SELECT cache_key FROM llm_playlist_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            self._conn.commit()
+
+class MySQLCacheBackend:
+    """Cache in the `llm_playlist_cache` table, shared by every app instance"""
+
+    def __init__(self, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def get(self, key):
+        with db_pool.transaction() as cursor:
+            cursor.execute("""
+                SELECT playlist FROM llm_playlist_cache
+                WHERE cache_key = %s AND created_at > NOW() - INTERVAL %s SECOND
+            """, (key, self.ttl))
+            row = cursor.fetchone()
+            if row:
+                cursor.execute("UPDATE llm_playlist_cache SET last_used_at = NOW() WHERE cache_key = %s", (key,))
+            return row[0] if row else None
+
+    def set(self, key, value):
+        with db_pool.transaction() as cursor:
+            cursor.execute("""
+                INSERT INTO llm_playlist_cache (cache_key, playlist) VALUES (%s, %s)
+                ON DUPLICATE KEY UPDATE playlist = VALUES(playlist), created_at = NOW(), last_used_at = NOW()
+            """, (key, value))
+            cursor.execute("DELETE FROM llm_playlist_cache WHERE created_at <= NOW() - INTERVAL %s SECOND", (self.ttl,))
+            cursor.execute("SELECT COUNT(*) FROM llm_playlist_cache")
+            overflow = cursor.fetchone()[0] - self.max_entries
+            if overflow > 0:
+                cursor.execute("DELETE FROM llm_playlist_cache ORDER BY last_used_at LIMIT %s", (overflow,))
+
+class PlaylistCache:
+    """Parsed playlist dicts keyed by make_cache_key(); hits skip generation and parsing"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            print(f"Warning: LLM cache read failed: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Stored as JSON so every hit hands out an independent copy
+        return json.loads(value)
+
+    def set(self, key, playlist_data):
+        try:
+            self.backend.set(key, json.dumps(playlist_data))
+        except Exception as e:
+            print(f"Warning: LLM cache write failed: {e}")
+
+def create_playlist_cache(backend=LLM_CACHE_BACKEND):
+    """Build the cache selected by LLM_CACHE_BACKEND (None when caching is disabled)"""
+    if backend == 'none':
+        return None
+    if backend == 'sqlite':
+        return PlaylistCache(SQLiteCacheBackend())
+    if backend == 'mysql':
+        return PlaylistCache(MySQLCacheBackend())
+    return PlaylistCache(MemoryCacheBackend())
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def default_playlist_cache():
+    """The process-wide cache, shared by every LLMHandler"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = create_playlist_cache()
+        return _default_cache
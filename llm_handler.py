@@ -1,288 +1,415 @@
-import google.generativeai as genai
-import json
+import asyncio
 import os
-import re
-from typing import List, Dict, Any
+import threading
+import time
+from typing import List, Dict, Any, Callable, Iterable, Optional, Sequence
+from json_stream import PlaylistStreamParser
+from track_matcher import TrackMatcher
+from ranking import CandidateRanker
+from curator import LocalCurator
+from llm_cache import default_playlist_cache, make_cache_key
+from llm_backends import LLMBackend, create_backend
+
+# Tracks sent to the model per request; larger pools are pre-ranked locally first
+MAX_PROMPT_CANDIDATES = int(os.getenv('LLM_MAX_CANDIDATES', '150'))
+# Generations in flight at once for batch requests
+LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', '4'))
+# Seconds a successful health check is trusted; failures are re-probed on the next call
+LLM_HEALTH_TTL = int(os.getenv('LLM_HEALTH_TTL', '300'))
+# Bump whenever the prompt or response format changes so cached playlists are not reused
+PROMPT_VERSION = "3"
+
+GENERATION_CONFIG = {
+    'temperature': 0.7,
+    'top_p': 0.8,
+    'top_k': 40,
+    # The reply is a list of handles; headroom is left for thinking models
+    'max_output_tokens': 2048,
+}
+
+def compact_track_line(handle: int, track: Dict) -> str:
+    """One `id|track|artist|genres|popularity|year` row, with the separator stripped from values"""
+    def clean(value):
+        return " ".join(str(value).replace("|", "/").split())
+    
+    genres = ";".join(clean(g) for g in (track.get('artist_genres') or [])[:3])
+    year = str(track.get('release_date') or '')[:4]
+    return "|".join([str(handle), clean(track.get('track_name', 'Unknown')),
+                     clean(track.get('artist', 'Unknown Artist')), genres,
+                     str(track.get('popularity') or 0), year])
+
+class CandidatePool:
+    """Candidate tracks prepared once and shared by every playlist generated from them.
+
+    Each track keeps its pool row as handle (row + 1), so its prompt line is
+    rendered once and the ranker is built at most once, however many moods
+    are generated.
+    """
+    
+    def __init__(self, tracks_data: List[Dict]):
+        self.tracks = tracks_data
+        self.lines = [compact_track_line(row, track) for row, track in enumerate(tracks_data, 1)]
+        self._ranker = None
+        self._curator = None
+    
+    @property
+    def ranker(self) -> CandidateRanker:
+        if self._ranker is None:
+            self._ranker = CandidateRanker(self.tracks)
+        return self._ranker
+    
+    @property
+    def curator(self) -> LocalCurator:
+        if self._curator is None:
+            # Reuse the ranker's genre bitsets when they already exist
+            genre_index = self._ranker.genre_index if self._ranker is not None else None
+            self._curator = LocalCurator(self.tracks, genre_index)
+        return self._curator
+    
+    def select(self, mood_description: str, k: int, max_candidates: int = MAX_PROMPT_CANDIDATES) -> List[int]:
+        """Rows offered to the model: everything for small pools, the locally pre-ranked best otherwise"""
+        if len(self.tracks) <= max_candidates:
+            return list(range(len(self.tracks)))
+        rows = self.ranker.top_k(mood_description, max(max_candidates, k))
+        print(f"🔎 Pre-ranked {len(self.tracks)} tracks down to {len(rows)} candidates")
+        return rows
+    
+    def table(self, rows: Sequence[int]) -> str:
+        return "\n".join(self.lines[row] for row in rows)
 
 class LLMHandler:
-    def __init__(self, api_key: str = None):
-        """Initialize Gemini API handler"""
-        if api_key is None:
-            api_key = os.getenv('GEMINI_API_KEY')
-            if not api_key:
-                raise ValueError("Gemini API key not provided. Set GEMINI_API_KEY environment variable or pass as argument.")
-        
-        genai.configure(api_key=api_key)
-        
-        # Use the updated model name
-        try:
-            self.model = genai.GenerativeModel('models/gemini-2.5-pro')
-        except:
-            try:
-                self.model = genai.GenerativeModel('models/gemini-2.5-flash')
-            except:
-                self.model = genai.GenerativeModel('models/gemini-2.0-flash')
+    def __init__(self, api_key: str = None, cache=None, backend: LLMBackend = None):
+        """Initialize the LLM handler on `backend` (default: the one selected by LLM_BACKEND)"""
+        self.backend = backend if backend is not None else create_backend(api_key=api_key)
+        self.cache = cache if cache is not None else default_playlist_cache()
     
-    def analyze_tracks_and_create_playlist(self, tracks_data: List[Dict], mood_description: str, playlist_name: str, max_tracks: int = 10) -> Dict[str, Any]:
-        """Analyze tracks and create a custom playlist based on mood description"""
-        
-        # Prepare track information for the prompt
-        tracks_info = []
-        for track in tracks_data:
-            track_info = {
-                'track_name': track.get('track_name', 'Unknown'),
-                'artist': track.get('artist', 'Unknown Artist'),
-                'album': track.get('album', 'Unknown Album'),
-                'genres': track.get('artist_genres', []),
-                'popularity': track.get('popularity', 0),
-                'release_date': track.get('release_date', 'Unknown')
-            }
-            tracks_info.append(track_info)
-        
-        # Create the prompt for Gemini
-        prompt = self._create_playlist_prompt(tracks_info, mood_description, playlist_name, max_tracks)
+    def analyze_tracks_and_create_playlist(self, tracks_data, mood_description: str, playlist_name: str, max_tracks: int = 10, max_candidates: int = MAX_PROMPT_CANDIDATES, regenerate: bool = False, stream: bool = False, on_track: Optional[Callable[[Dict], None]] = None) -> Dict[str, Any]:
+        """Analyze tracks and create a custom playlist based on mood description.
+
+        `tracks_data` is a list of track dicts or a prepared CandidatePool.
+        Identical requests are served from the playlist cache; pass
+        `regenerate=True` to force a fresh generation. With `stream=True` the
+        response is parsed as it arrives, and `on_track(track)` is called for
+        every track as soon as it is resolved.
+        """
+        pool = tracks_data if isinstance(tracks_data, CandidatePool) else CandidatePool(tracks_data)
+        cache_key, cached, prompt = self._prepare_request(pool, mood_description, playlist_name, max_tracks, max_candidates, regenerate)
+        if cached is not None:
+            if on_track is not None:
+                for track in cached['tracks']:
+                    on_track(track)
+            return cached
         
         try:
-            # Add safety settings to avoid blocks
-            generation_config = genai.types.GenerationConfig(
-                temperature=0.7,
-                top_p=0.8,
-                top_k=40,
-                max_output_tokens=2048,  # Increased token limit
-            )
-            
-            response = self.model.generate_content(
-                prompt,
-                generation_config=generation_config
-            )
-            
-            print(f"🔍 Raw LLM response received: {len(response.text)} characters")
-            playlist_data = self._parse_llm_response(response.text, tracks_data, max_tracks)
-            
-            return playlist_data
+            started = time.perf_counter()
+            if stream:
+                chunks = self.backend.stream(prompt, GENERATION_CONFIG)
+            else:
+                chunks = [self.backend.generate(prompt, GENERATION_CONFIG)]
+            return self._finish_request(chunks, pool, mood_description, playlist_name, max_tracks, cache_key, on_track, started)
             
         except Exception as e:
             print(f"❌ LLM Error: {e}")
+            llm_registry.invalidate()
             # Fallback to simple playlist creation
-            return self._create_fallback_playlist(tracks_data, mood_description, playlist_name, max_tracks)
+            return self._create_fallback_playlist(pool, mood_description, playlist_name, max_tracks)
+    
+    async def analyze_tracks_and_create_playlist_async(self, tracks_data, mood_description: str, playlist_name: str, max_tracks: int = 10, max_candidates: int = MAX_PROMPT_CANDIDATES, regenerate: bool = False) -> Dict[str, Any]:
+        """Async counterpart of analyze_tracks_and_create_playlist (without streaming)"""
+        pool = tracks_data if isinstance(tracks_data, CandidatePool) else CandidatePool(tracks_data)
+        cache_key, cached, prompt = self._prepare_request(pool, mood_description, playlist_name, max_tracks, max_candidates, regenerate)
+        if cached is not None:
+            return cached
+        
+        try:
+            started = time.perf_counter()
+            text = await self.backend.generate_async(prompt, GENERATION_CONFIG)
+            return self._finish_request([text], pool, mood_description, playlist_name, max_tracks, cache_key, None, started)
+        except Exception as e:
+            print(f"❌ LLM Error: {e}")
+            llm_registry.invalidate()
+            return self._create_fallback_playlist(pool, mood_description, playlist_name, max_tracks)
     
-    def _create_playlist_prompt(self, tracks_info: List[Dict], mood_description: str, playlist_name: str, max_tracks: int) -> str:
-        """Create the prompt for playlist generation"""
+    async def generate_playlists_async(self, tracks_data, requests: Sequence[Dict], concurrency: int = LLM_CONCURRENCY, max_candidates: int = MAX_PROMPT_CANDIDATES, regenerate: bool = False):
+        """Generate many playlists from one track pool, yielding (index, playlist) as each completes.
+
+        `requests` are dicts with `mood_description`, and optionally
+        `playlist_name` and `max_tracks`. The pool (prompt lines and ranker)
+        is prepared once, and at most `concurrency` generations run at a time.
+        """
+        pool = tracks_data if isinstance(tracks_data, CandidatePool) else CandidatePool(tracks_data)
+        semaphore = asyncio.Semaphore(max(1, concurrency))
         
-        tracks_json = json.dumps(tracks_info, indent=2)
+        async def run(index, request):
+            async with semaphore:
+                playlist = await self.analyze_tracks_and_create_playlist_async(
+                    pool,
+                    request['mood_description'],
+                    request.get('playlist_name') or f"{request['mood_description'].title()} Mix",
+                    request.get('max_tracks', 10),
+                    max_candidates,
+                    regenerate
+                )
+                return index, playlist
         
-        prompt = f"""
-        TASK: Create a music playlist based on user's mood description and available tracks.
+        tasks = [asyncio.ensure_future(run(index, request)) for index, request in enumerate(requests)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    def generate_playlists(self, tracks_data, requests: Sequence[Dict], concurrency: int = LLM_CONCURRENCY, max_candidates: int = MAX_PROMPT_CANDIDATES, regenerate: bool = False, on_result: Optional[Callable[[int, Dict], None]] = None) -> List[Dict[str, Any]]:
+        """Blocking batch generation; playlists come back in request order.
 
-        USER REQUEST:
-        - Mood/Theme: "{mood_description}"
-        - Playlist Name: "{playlist_name}"
-        - Maximum Tracks: {max_tracks}
+        `on_result(index, playlist)` is called as each one completes.
+        """
+        async def collect():
+            results = [None] * len(requests)
+            async for index, playlist in self.generate_playlists_async(tracks_data, requests, concurrency, max_candidates, regenerate):
+                results[index] = playlist
+                if on_result is not None:
+                    on_result(index, playlist)
+            return results
+        
+        return asyncio.run(collect())
+    
+    def _prepare_request(self, pool: CandidatePool, mood_description: str, playlist_name: str, max_tracks: int, max_candidates: int, regenerate: bool):
+        """Cache lookup and prompt for one request: (cache_key, cached playlist or None, prompt)"""
+        cache_key = None
+        if self.cache is not None:
+            cache_key = make_cache_key(pool.tracks, mood_description, playlist_name, max_tracks,
+                                       self.backend.name, PROMPT_VERSION, max_candidates)
+            if not regenerate:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    print("⚡ Serving playlist from cache")
+                    return cache_key, cached, None
+        
+        # Pre-rank large pools locally so prompt size no longer grows with the pool
+        rows = pool.select(mood_description, max_tracks, max_candidates)
+        prompt = self._create_playlist_prompt(pool.table(rows), mood_description, playlist_name, max_tracks)
+        return cache_key, None, prompt
+    
+    def _finish_request(self, chunks: Iterable[str], pool: CandidatePool, mood_description: str, playlist_name: str, max_tracks: int, cache_key, on_track, started: float) -> Dict[str, Any]:
+        """Parse a response, fill in missing fields and cache complete results"""
+        playlist_data, complete = self._parse_llm_response(chunks, pool.tracks, max_tracks, on_track, started)
+        playlist_data['playlist_name'] = playlist_data['playlist_name'] or playlist_name or f"{mood_description.title()} Mix"
+        playlist_data['description'] = playlist_data['description'] or f"A {mood_description} playlist curated for you"
+        
+        # Only complete generations are cached, never truncated ones or the fallback
+        if cache_key is not None and complete:
+            self.cache.set(cache_key, playlist_data)
+        
+        return playlist_data
+    
+    def _create_playlist_prompt(self, tracks_table: str, mood_description: str, playlist_name: str, max_tracks: int) -> str:
+        """Create the prompt for playlist generation.
+
+        Tracks are listed one per line behind a short integer handle, and the
+        model answers with handles only; `_parse_llm_response` maps them back.
+        The track table comes first so requests over the same pool share a
+        prompt prefix.
+        """
+        
+        prompt = f"""TASK: Create a music playlist based on user's mood description and available tracks.
 
-        AVAILABLE TRACKS DATA:
-        {tracks_json}
+AVAILABLE TRACKS (id|track|artist|genres|popularity|year):
+{tracks_table}
 
-        INSTRUCTIONS:
-        1. Select exactly {max_tracks} tracks that best match the mood description
-        2. Consider: genres, artist style, popularity, and emotional tone giving more weight to whats asked
-        3. Make a comparison between tracks and what the user wants to finalise on a track
-        4. Create a logical listening order
-        5. Return ONLY valid JSON with this exact structure - NO EXTRA TEXT:
+USER REQUEST:
+- Mood/Theme: "{mood_description}"
+- Playlist Name: "{playlist_name}"
+- Maximum Tracks: {max_tracks}
 
-        {{
-            "playlist_name": "creative name based on mood",
-            "description": "catchy 1-2 sentence Spotify-style description",
-            "tracks": [
-                {{
-                    "track_name": "exact track name from available list",
-                    "artist": "exact artist name from available list", 
-                    "album": "exact album name from available list",
-                    "position": 1
-                }},
-                ... more tracks ...
-            ]
-        }}
+INSTRUCTIONS:
+1. Select exactly {max_tracks} tracks that best match the mood description
+2. Consider: genres, artist style, popularity, and emotional tone giving more weight to whats asked
+3. Create a logical listening order
+4. Return ONLY valid JSON with this exact structure - NO EXTRA TEXT:
+{{"playlist_name": "creative name based on mood", "description": "catchy 1-2 sentence Spotify-style description", "tracks": [12, 3, 47]}}
 
-        CRITICAL RULES:
-        - Use ONLY tracks from the available list above
-        - Use EXACT track names, artist names, and album names as provided
-        - Return COMPLETE JSON only - make sure all brackets are closed
-        - Ensure proper JSON syntax with double quotes
-        - Order tracks for optimal listening experience
-        - MAXIMUM {max_tracks} TRACKS ONLY
-        - Make sure the JSON is complete and valid
-        """
+CRITICAL RULES:
+- "tracks" lists the ids of the chosen tracks in listening order, nothing else
+- Use ONLY ids from the available list above, each at most once
+- MAXIMUM {max_tracks} TRACKS ONLY
+"""
 
         return prompt
     
-    def _parse_llm_response(self, response_text: str, original_tracks: List[Dict], max_tracks: int) -> Dict[str, Any]:
-        """Parse the LLM response and extract playlist data with robust error handling"""
+    def _parse_llm_response(self, chunks: Iterable[str], original_tracks: List[Dict], max_tracks: int, on_track: Optional[Callable[[Dict], None]] = None, started: float = None):
+        """Parse the LLM response chunk by chunk into playlist data.
+
+        Returns (playlist_data, complete). Tracks are resolved and handed to
+        `on_track` as soon as their entry closes, so a response that is cut
+        off still keeps every complete track; `complete` is then False.
+        """
+        print("🔄 Parsing LLM response...")
+        started = started or time.perf_counter()
+        parser = PlaylistStreamParser()
+        matcher = TrackMatcher(original_tracks)  # indexed only if the model answers with names
+        tracks = []
+        seen = set()
+        
         try:
-            print("🔄 Parsing LLM response...")
-            
-            # Clean the response text
-            cleaned_text = response_text.strip()
-            
-            # Remove markdown code blocks if present
-            if '```json' in cleaned_text:
-                cleaned_text = cleaned_text.split('```json')[1].split('```')[0].strip()
-            elif '```' in cleaned_text:
-                cleaned_text = cleaned_text.split('```')[1].strip()
-            
-            # Find JSON object
-            start_idx = cleaned_text.find('{')
-            end_idx = cleaned_text.rfind('}') + 1
-            
-            if start_idx == -1 or end_idx == 0:
-                raise ValueError("No JSON object found in response")
-            
-            json_text = cleaned_text[start_idx:end_idx]
-            
-            # Fix common JSON issues
-            json_text = self._fix_json_issues(json_text, max_tracks)
-            
-            playlist_data = json.loads(json_text)
-            
-            # Validate the structure
-            required_keys = ['playlist_name', 'description', 'tracks']
-            if not all(key in playlist_data for key in required_keys):
-                raise ValueError("Missing required keys in LLM response")
-            
-            if not isinstance(playlist_data['tracks'], list):
-                raise ValueError("Tracks should be a list")
-            
-            # Match tracks with original data to get IDs
-            self._match_tracks_with_ids(playlist_data['tracks'], original_tracks)
-            
-            print(f"✅ Successfully parsed playlist with {len(playlist_data['tracks'])} tracks")
-            return playlist_data
-            
-        except json.JSONDecodeError as e:
-            print(f"❌ JSON parsing failed: {e}")
-            print(f"📝 Problematic JSON text: {json_text if 'json_text' in locals() else 'N/A'}")
-            raise ValueError(f"Failed to parse LLM response as JSON: {str(e)}")
+            for chunk in chunks:
+                for entry in parser.feed(chunk):
+                    track = self._collect_track(entry, original_tracks, tracks, seen, matcher)
+                    if track is None:
+                        continue
+                    if len(tracks) == 1:
+                        print(f"⏱️ First track after {time.perf_counter() - started:.2f}s")
+                    if on_track is not None:
+                        on_track(track)
+                    if len(tracks) >= max_tracks:
+                        break
+                if parser.complete or len(tracks) >= max_tracks:
+                    break
         except Exception as e:
-            print(f"❌ General parsing error: {e}")
-            raise ValueError(f"Invalid response format: {str(e)}")
-    
-    def _fix_json_issues(self, json_text: str, max_tracks: int) -> str:
-        """Fix common JSON issues in LLM responses"""
+            if not tracks:
+                raise
+            print(f"⚠️ Response stream interrupted: {e}")
         
-        # Fix 1: Add missing closing brackets
-        open_braces = json_text.count('{')
-        close_braces = json_text.count('}')
-        open_brackets = json_text.count('[')
-        close_brackets = json_text.count(']')
+        if not tracks:
+            raise ValueError("No usable tracks found in LLM response")
         
-        # Add missing closing braces
-        if open_braces > close_braces:
-            json_text += '}' * (open_braces - close_braces)
+        complete = parser.complete or len(tracks) >= max_tracks
+        if not complete:
+            print(f"⚠️ Response was truncated, keeping the {len(tracks)} complete tracks")
+        else:
+            print(f"✅ Successfully parsed playlist with {len(tracks)} tracks")
         
-        # Add missing closing brackets
-        if open_brackets > close_brackets:
-            json_text += ']' * (open_brackets - close_brackets)
-        
-        # Fix 2: Remove trailing commas
-        json_text = re.sub(r',\s*}', '}', json_text)
-        json_text = re.sub(r',\s*]', ']', json_text)
-        
-        # Fix 3: Ensure tracks array is properly closed
-        if '"tracks": [' in json_text and ']' not in json_text.split('"tracks": [')[-1]:
-            # Count how many tracks we have
-            track_count = json_text.count('"track_name"')
-            # If we have some tracks but array isn't closed, close it
-            if track_count > 0:
-                # Find the last complete track
-                last_track_end = max(
-                    json_text.rfind('}'),
-                    json_text.rfind('",')
-                )
-                if last_track_end != -1:
-                    json_text = json_text[:last_track_end + 1] + ']'
-        
-        # Fix 4: If JSON is still broken, create a simple valid one
-        try:
-            json.loads(json_text)
-        except:
-            print("⚠️ JSON auto-repair failed, creating fallback structure")
-            # Extract what we can and create minimal valid JSON
-            json_text = self._create_minimal_json(json_text, max_tracks)
-        
-        return json_text
+        playlist_data = parser.result()
+        playlist_data['tracks'] = tracks
+        return playlist_data, complete
     
-    def _create_minimal_json(self, broken_json: str, max_tracks: int) -> str:
-        """Create minimal valid JSON from broken response"""
-        try:
-            # Extract playlist name
-            name_match = re.search(r'"playlist_name":\s*"([^"]*)"', broken_json)
-            playlist_name = name_match.group(1) if name_match else "Custom Playlist"
-            
-            # Extract description
-            desc_match = re.search(r'"description":\s*"([^"]*)"', broken_json)
-            description = desc_match.group(1) if desc_match else "A curated playlist for you"
-            
-            # Extract tracks
-            tracks = []
-            track_pattern = r'"track_name":\s*"([^"]*)",\s*"artist":\s*"([^"]*)",\s*"album":\s*"([^"]*)"'
-            for match in re.finditer(track_pattern, broken_json):
-                if len(tracks) < max_tracks:
-                    tracks.append({
-                        "track_name": match.group(1),
-                        "artist": match.group(2),
-                        "album": match.group(3),
-                        "position": len(tracks) + 1
-                    })
-            
-            # Create valid JSON
-            minimal_json = {
-                "playlist_name": playlist_name,
-                "description": description,
-                "tracks": tracks
+    def _collect_track(self, entry, original_tracks: List[Dict], tracks: List[Dict], seen: set, matcher: TrackMatcher = None) -> Optional[Dict]:
+        """Resolve one entry of the model's "tracks" array and append it to `tracks`.
+
+        Entries are 1-based handles into `original_tracks`; objects with
+        "track_name"/"artist" are matched by name instead. Unknown and repeated
+        entries are dropped (None is returned).
+        """
+        if isinstance(entry, dict):
+            if not entry.get('track_name'):
+                return None
+            entry.setdefault('artist', 'Unknown Artist')
+            self._match_tracks_with_ids([entry], original_tracks, matcher)
+            track = entry
+            key = track.get('track_id') or (track['track_name'], track['artist'])
+        else:
+            try:
+                handle = int(entry)
+            except (TypeError, ValueError):
+                return None
+            if not 1 <= handle <= len(original_tracks):
+                return None
+            original = original_tracks[handle - 1]
+            track = {
+                "track_name": original.get('track_name', 'Unknown'),
+                "artist": original.get('artist', 'Unknown Artist'),
+                "album": original.get('album', 'Unknown Album'),
+                "track_id": original.get('id')
             }
-            
-            return json.dumps(minimal_json)
-        except:
-            # Ultimate fallback
-            return '{"playlist_name": "My Playlist", "description": "A great music collection", "tracks": []}'
+            key = track['track_id'] or handle
+        
+        if key in seen:
+            return None
+        seen.add(key)
+        track['position'] = len(tracks) + 1
+        tracks.append(track)
+        return track
     
-    def _match_tracks_with_ids(self, selected_tracks: List[Dict], original_tracks: List[Dict]):
-        """Match selected tracks with their original track IDs"""
+    def _match_tracks_with_ids(self, selected_tracks: List[Dict], original_tracks: List[Dict], matcher: TrackMatcher = None):
+        """Match selected tracks with their original track IDs (exact, then fuzzy).
+
+        Matched tracks take the original names, so paraphrases are not stored.
+        """
+        matcher = matcher or TrackMatcher(original_tracks)
         for selected_track in selected_tracks:
-            selected_track['track_id'] = None  # Initialize
-            for original_track in original_tracks:
-                if (selected_track['track_name'].lower() == original_track.get('track_name', '').lower() and
-                    selected_track['artist'].lower() == original_track.get('artist', '').lower()):
-                    selected_track['track_id'] = original_track.get('id')
-                    break
+            original = matcher.match_track(selected_track.get('track_name', ''), selected_track.get('artist', ''))
+            selected_track['track_id'] = original.get('id') if original else None
+            if original:
+                selected_track['track_name'] = original.get('track_name', selected_track.get('track_name'))
+                selected_track['artist'] = original.get('artist', selected_track.get('artist'))
+                selected_track['album'] = original.get('album', selected_track.get('album'))
     
-    def _create_fallback_playlist(self, tracks_data: List[Dict], mood_description: str, playlist_name: str, max_tracks: int) -> Dict[str, Any]:
-        """Create a playlist without AI when Gemini fails"""
-        print("🔄 Using fallback playlist generator...")
-        
-        # Simple selection - take first N tracks
-        selected_tracks = tracks_data[:max_tracks]
-        
-        playlist_data = {
-            "playlist_name": playlist_name or f"{mood_description.title()} Mix",
-            "description": f"A {mood_description} playlist curated for you",
-            "tracks": []
-        }
-        
-        for i, track in enumerate(selected_tracks, 1):
-            playlist_data["tracks"].append({
-                "track_name": track.get('track_name', 'Unknown'),
-                "artist": track.get('artist', 'Unknown Artist'),
-                "album": track.get('album', 'Unknown Album'),
-                "position": i,
-                "track_id": track.get('id')
-            })
-        
-        return playlist_data
+    def _create_fallback_playlist(self, pool: CandidatePool, mood_description: str, playlist_name: str, max_tracks: int) -> Dict[str, Any]:
+        """Create a playlist without AI when the LLM fails, using the local curator"""
+        print("🔄 Using local curator...")
+        return pool.curator.curate(mood_description, playlist_name, max_tracks)
+
+    def health_check(self):
+        """Liveness probe without a generation round-trip: (ok, message)"""
+        try:
+            self.backend.ping()
+            return True, f"✅ LLM backend {self.backend.name} reachable"
+        except Exception as e:
+            return False, f"❌ LLM backend error: {e}"
 
     def test_connection(self):
-        """Test if Gemini API is working"""
+        """Test if the LLM backend is working (spends a small generation)"""
         try:
-            response = self.model.generate_content("Just say \"connecting..,\" and nothing else.")
-            return f"✅ Gemini API connected: {response.text}"
+            text = self.backend.generate("Just say \"connecting..,\" and nothing else.", GENERATION_CONFIG)
+            return f"✅ LLM backend {self.backend.name} connected: {text}"
         except Exception as e:
-            return f"❌ Gemini API error: {e}"
\ No newline at end of file
+            return f"❌ LLM backend error: {e}"
+
+class LLMRegistry:
+    """Process-wide LLMHandler, created on first use, with a cached health status.
+
+    A healthy status is reused for `ttl` seconds. A failed probe (or a failed
+    handler construction, e.g. a missing API key) is not cached, so the next
+    caller tries again.
+    """
+
+    def __init__(self, ttl=LLM_HEALTH_TTL):
+        self.ttl = ttl
+        self._handler = None
+        self._healthy_until = 0.0
+        self._message = None
+        # Bumped by every stored probe result and invalidate(), so a probe that finishes late never wins
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def handler(self) -> Optional[LLMHandler]:
+        """The shared handler, or None when it cannot be built"""
+        with self._lock:
+            return self._get_handler()
+
+    def _get_handler(self):
+        if self._handler is None:
+            try:
+                self._handler = LLMHandler()
+            except Exception as e:
+                self._message = f"❌ AI Connection Failed: {e}"
+                return None
+        return self._handler
+
+    def status(self, force: bool = False):
+        """(ok, message, handler); probes the backend only when no fresh healthy status is cached"""
+        with self._lock:
+            handler = self._get_handler()
+            if handler is None:
+                return False, self._message, None
+            if not force and time.monotonic() < self._healthy_until:
+                return True, self._message, handler
+            generation = self._generation
+
+        # Outside the lock: a slow or hanging backend must not block other status() / handler() callers
+        ok, message = handler.health_check()
+        with self._lock:
+            if self._generation == generation:
+                self._generation += 1
+                self._message = message
+                self._healthy_until = time.monotonic() + self.ttl if ok else 0.0
+        return ok, message, handler
+
+    def invalidate(self):
+        """Forget the cached health, e.g. after a generation failed"""
+        with self._lock:
+            self._generation += 1
+            self._healthy_until = 0.0
+
+llm_registry = LLMRegistry()
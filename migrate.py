@@ -0,0 +1,205 @@
+"""Apply the numbered SQL files in migrations/ to the configured database.
+
+    python migrate.py            # apply every pending migration
+    python migrate.py --status   # list applied and pending migrations
+    python migrate.py --to 0     # apply up to (and including) version 0
+
+A fresh install loads db.sql, which already records every migration as
+applied. Databases created before migrations existed are adopted only when
+their tables, columns and triggers match a known schema exactly: the original
+db.sql (0000) or the one used before schema tuning (0001). Anything else is
+refused with the differences listed, and nothing is recorded.
+"""
+import argparse
+import os
+import re
+import db_pool
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+MIGRATION_RE = re.compile(r"^(\d{4})_(\w+)\.sql$")
+DELIMITER_RE = re.compile(r"^\s*DELIMITER\s+(\S+)\s*$", re.IGNORECASE)
+
+ORIGINAL_TABLES = {
+    'tracks': {'id', 'track_name', 'artist', 'album', 'release_date', 'popularity', 'created_at', 'updated_at'},
+    'artist_genres': {'id', 'track_id', 'genre'},
+    'track_history': {'id', 'track_id', 'requested_at'},
+    'custom_playlists': {'id', 'playlist_name', 'description', 'mood_description',
+                         'total_tracks', 'total_popularity', 'created_at'},
+    'custom_playlist_tracks': {'id', 'playlist_id', 'track_id', 'track_name', 'artist', 'album', 'position'},
+}
+
+PRE_TUNING_TABLES = {
+    **ORIGINAL_TABLES,
+    'artist_genres': {'track_id', 'genre_id'},
+    'custom_playlist_tracks': ORIGINAL_TABLES['custom_playlist_tracks'] | {'popularity'},
+    'artists': {'id', 'genres', 'fetched_at'},
+    'track_features': {'track_id', 'energy', 'valence', 'tempo', 'danceability',
+                       'acousticness', 'instrumentalness', 'fetched_at'},
+    'genres': {'id', 'name'},
+    'playlist_snapshots': {'playlist_id', 'snapshot_id', 'synced_tracks', 'is_complete', 'synced_at'},
+    'playlist_source_tracks': {'playlist_id', 'position', 'track_id'},
+    'playlist_genre_summary': {'playlist_id', 'genre_id', 'track_count'},
+    'spotify_publish_jobs': {'custom_playlist_id', 'spotify_playlist_id', 'total_tracks',
+                             'published_tracks', 'is_complete', 'updated_at'},
+    'llm_playlist_cache': {'cache_key', 'playlist', 'created_at', 'last_used_at'},
+}
+
+# Schemas that existed before schema_migrations did: (version, tables -> columns, triggers).
+# The original stats triggers must be gone by 0001, or stats would be counted twice.
+KNOWN_SCHEMAS = [
+    (0, ORIGINAL_TABLES, {'update_playlist_stats_insert', 'update_playlist_stats_delete'}),
+    (1, PRE_TUNING_TABLES, set()),
+]
+
+def available_migrations(directory=MIGRATIONS_DIR):
+    """[(version, name, path)] of the migration files, in version order"""
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = MIGRATION_RE.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+    return migrations
+
+def split_statements(sql):
+    """Statements of a SQL script, honouring mysql-client style DELIMITER lines for procedure bodies"""
+    statements = []
+    delimiter = ';'
+    current = []
+    for line in sql.splitlines():
+        match = DELIMITER_RE.match(line)
+        if match:
+            delimiter = match.group(1)
+            continue
+        if not current and (not line.strip() or line.strip().startswith('--')):
+            continue
+        current.append(line)
+        if line.rstrip().endswith(delimiter):
+            statement = "\n".join(current).rstrip()[:-len(delimiter)].strip()
+            if statement:
+                statements.append(statement)
+            current = []
+    if "\n".join(current).strip():
+        statements.append("\n".join(current).strip())
+    return statements
+
+def current_schema(cursor):
+    """({table: columns}, triggers) of the connected database, views and schema_migrations excluded"""
+    cursor.execute("""
+        SELECT c.table_name, c.column_name
+        FROM information_schema.columns c
+        JOIN information_schema.tables t
+          ON t.table_schema = c.table_schema AND t.table_name = c.table_name
+        WHERE c.table_schema = DATABASE()
+          AND t.table_type = 'BASE TABLE'
+          AND c.table_name <> 'schema_migrations'
+    """)
+    tables = {}
+    for table, column in cursor.fetchall():
+        tables.setdefault(table, set()).add(column)
+    cursor.execute("SELECT trigger_name FROM information_schema.triggers WHERE trigger_schema = DATABASE()")
+    triggers = {name for (name,) in cursor.fetchall()}
+    return tables, triggers
+
+def schema_differences(tables, triggers, known_tables, known_triggers):
+    """Human-readable differences between a database's schema and a known one"""
+    differences = []
+    for table in sorted(known_tables.keys() - tables.keys()):
+        differences.append(f"missing table {table}")
+    for table in sorted(tables.keys() - known_tables.keys()):
+        differences.append(f"unexpected table {table}")
+    for table in sorted(tables.keys() & known_tables.keys()):
+        missing = known_tables[table] - tables[table]
+        extra = tables[table] - known_tables[table]
+        if missing:
+            differences.append(f"{table}: missing columns {', '.join(sorted(missing))}")
+        if extra:
+            differences.append(f"{table}: unexpected columns {', '.join(sorted(extra))}")
+    for trigger in sorted(known_triggers - triggers):
+        differences.append(f"missing trigger {trigger}")
+    for trigger in sorted(triggers - known_triggers):
+        differences.append(f"unexpected trigger {trigger}")
+    return differences
+
+def adopted_version(tables, triggers):
+    """Known version an unversioned database matches exactly; None when it has no tables yet"""
+    if not tables:
+        return None
+    closest = None
+    for version, known_tables, known_triggers in KNOWN_SCHEMAS:
+        differences = schema_differences(tables, triggers, known_tables, known_triggers)
+        if not differences:
+            return version
+        if closest is None or len(differences) < len(closest[1]):
+            closest = (version, differences)
+    version, differences = closest
+    raise RuntimeError(
+        f"schema does not match any known version, refusing to adopt it "
+        f"(closest is {version:04d}: {'; '.join(differences)})"
+    )
+
+def applied_versions(cursor):
+    """Versions recorded in schema_migrations, creating the table (and adopting a known schema) on first run"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("SELECT version FROM schema_migrations")
+    versions = {version for (version,) in cursor.fetchall()}
+    if not versions:
+        adopted = adopted_version(*current_schema(cursor))
+        if adopted is not None:
+            # Created before migrations existed: everything up to the matched schema is applied
+            rows = [(version, name) for version, name, _ in available_migrations() if version <= adopted]
+            cursor.executemany("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", rows)
+            versions = {version for version, _ in rows}
+            print(f"📌 Adopted existing schema as {adopted:04d}")
+    return versions
+
+def migrate(target=None, status_only=False):
+    """Apply pending migrations up to `target` (default: all); returns the versions applied"""
+    applied = []
+    with db_pool.connection() as db:
+        with db_pool.transaction(db) as cursor:
+            done = applied_versions(cursor)
+
+        for version, name, path in available_migrations():
+            if target is not None and version > target:
+                break
+            if version in done:
+                if status_only:
+                    print(f"✅ {version:04d} {name}")
+                continue
+            if status_only:
+                print(f"⏳ {version:04d} {name} (pending)")
+                continue
+
+            print(f"🔧 Applying {version:04d} {name}...")
+            with open(path) as f:
+                statements = split_statements(f.read())
+            # DDL commits implicitly in MySQL, so a migration is recorded only once all of it ran
+            with db_pool.transaction(db) as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+                cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+            applied.append(version)
+
+    if not status_only:
+        print(f"✅ Schema up to date ({len(applied)} migrations applied)")
+    return applied
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--status", action="store_true", help="list migrations without applying any")
+    parser.add_argument("--to", type=int, default=None, help="highest version to apply")
+    args = parser.parse_args()
+    try:
+        migrate(args.to, status_only=args.status)
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
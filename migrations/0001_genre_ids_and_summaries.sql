@@ -0,0 +1,165 @@
+-- The original schema brought up to what the application expects before schema tuning:
+--   * caches: artists (genres per artist), track_features, llm_playlist_cache
+--   * incremental playlist sync: playlist_snapshots, playlist_source_tracks
+--   * interned genres: artist_genres(track_id, genre VARCHAR) becomes (track_id, genre_id)
+--   * no per-row stats triggers: custom_playlist_tracks.popularity plus set-based recomputes
+--   * playlist_genre_summary behind the analytics view, spotify_publish_jobs for resumable publishing
+
+-- 1. New tables
+CREATE TABLE artists (
+    id VARCHAR(255) PRIMARY KEY,
+    genres JSON NOT NULL,
+    fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE track_features (
+    track_id VARCHAR(255) PRIMARY KEY,
+    energy FLOAT,
+    valence FLOAT,
+    tempo FLOAT,
+    danceability FLOAT,
+    acousticness FLOAT,
+    instrumentalness FLOAT,
+    fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE genres (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(100) COLLATE utf8mb4_bin NOT NULL UNIQUE
+);
+
+CREATE TABLE playlist_snapshots (
+    playlist_id VARCHAR(255) PRIMARY KEY,
+    snapshot_id VARCHAR(255) NOT NULL,
+    synced_tracks INT DEFAULT 0,
+    is_complete BOOLEAN DEFAULT FALSE,
+    synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+CREATE TABLE playlist_source_tracks (
+    playlist_id VARCHAR(255),
+    position INT,
+    track_id VARCHAR(255) NOT NULL,
+    PRIMARY KEY (playlist_id, position),
+    FOREIGN KEY (track_id) REFERENCES tracks(id) ON DELETE CASCADE
+);
+
+CREATE TABLE playlist_genre_summary (
+    playlist_id INT,
+    genre_id INT,
+    track_count INT NOT NULL,
+    PRIMARY KEY (playlist_id, genre_id),
+    FOREIGN KEY (playlist_id) REFERENCES custom_playlists(id) ON DELETE CASCADE,
+    FOREIGN KEY (genre_id) REFERENCES genres(id)
+);
+
+CREATE TABLE spotify_publish_jobs (
+    custom_playlist_id INT PRIMARY KEY,
+    spotify_playlist_id VARCHAR(255) NOT NULL,
+    total_tracks INT DEFAULT 0,
+    published_tracks INT DEFAULT 0,
+    is_complete BOOLEAN DEFAULT FALSE,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (custom_playlist_id) REFERENCES custom_playlists(id) ON DELETE CASCADE
+);
+
+CREATE TABLE llm_playlist_cache (
+    cache_key CHAR(64) PRIMARY KEY,
+    playlist JSON NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_llm_cache_used (last_used_at)
+);
+
+-- 2. Genre names become ids; duplicate (track, genre) rows of the old table collapse into one
+INSERT INTO genres (name)
+SELECT DISTINCT genre COLLATE utf8mb4_bin FROM artist_genres WHERE genre IS NOT NULL AND genre <> '';
+
+CREATE TABLE artist_genres_by_id (
+    track_id VARCHAR(255),
+    genre_id INT NOT NULL,
+    PRIMARY KEY (track_id, genre_id),
+    FOREIGN KEY (track_id) REFERENCES tracks(id) ON DELETE CASCADE,
+    FOREIGN KEY (genre_id) REFERENCES genres(id)
+);
+
+INSERT IGNORE INTO artist_genres_by_id (track_id, genre_id)
+SELECT ag.track_id, g.id
+FROM artist_genres ag
+JOIN genres g ON g.name = ag.genre COLLATE utf8mb4_bin
+WHERE ag.track_id IS NOT NULL;
+
+DROP TABLE artist_genres;
+
+RENAME TABLE artist_genres_by_id TO artist_genres;
+
+CREATE INDEX idx_genre ON artist_genres(genre_id);
+
+-- 3. Stats without triggers: each playlist track remembers the popularity it counts with
+DROP TRIGGER IF EXISTS update_playlist_stats_insert;
+
+DROP TRIGGER IF EXISTS update_playlist_stats_delete;
+
+ALTER TABLE custom_playlist_tracks
+    ADD COLUMN popularity INT DEFAULT 0 AFTER position;
+
+UPDATE custom_playlist_tracks cpt
+JOIN tracks t ON t.id = cpt.track_id
+SET cpt.popularity = IFNULL(t.popularity, 0);
+
+DELIMITER //
+CREATE PROCEDURE RecomputePlaylistStats(IN p_playlist_id INT)
+BEGIN
+    UPDATE custom_playlists p
+    LEFT JOIN (
+        SELECT playlist_id, COUNT(*) AS track_count, SUM(popularity) AS popularity_sum
+        FROM custom_playlist_tracks
+        WHERE p_playlist_id IS NULL OR playlist_id = p_playlist_id
+        GROUP BY playlist_id
+    ) s ON s.playlist_id = p.id
+    SET p.total_tracks = IFNULL(s.track_count, 0),
+        p.total_popularity = IFNULL(s.popularity_sum, 0)
+    WHERE p_playlist_id IS NULL OR p.id = p_playlist_id;
+END //
+
+CREATE PROCEDURE RebuildPlaylistGenreSummary(IN p_playlist_id INT)
+BEGIN
+    DELETE FROM playlist_genre_summary WHERE p_playlist_id IS NULL OR playlist_id = p_playlist_id;
+    INSERT INTO playlist_genre_summary (playlist_id, genre_id, track_count)
+    SELECT cpt.playlist_id, ag.genre_id, COUNT(*)
+    FROM custom_playlist_tracks cpt
+    JOIN artist_genres ag ON ag.track_id = cpt.track_id
+    WHERE p_playlist_id IS NULL OR cpt.playlist_id = p_playlist_id
+    GROUP BY cpt.playlist_id, ag.genre_id;
+END //
+DELIMITER ;
+
+-- Trigger-maintained totals summed popularity as of each insert; from now on they equal
+-- the sum of custom_playlist_tracks.popularity, so start from exactly that
+CALL RecomputePlaylistStats(NULL);
+
+CALL RebuildPlaylistGenreSummary(NULL);
+
+-- 4. Analytics read the summary
+CREATE OR REPLACE VIEW fast_analytics_view AS
+SELECT
+    p.id, p.playlist_name, p.description, p.mood_description, p.total_tracks,
+    CASE WHEN p.total_tracks > 0 THEN ROUND(p.total_popularity / p.total_tracks, 1) ELSE 0 END as avg_popularity,
+    (SELECT IFNULL(GROUP_CONCAT(g.name ORDER BY g.name SEPARATOR ', '), '')
+     FROM playlist_genre_summary s
+     JOIN genres g ON g.id = s.genre_id
+     WHERE s.playlist_id = p.id) as all_genres,
+    p.created_at
+FROM custom_playlists p;
+
+DROP PROCEDURE IF EXISTS GetUserPlaylistStats;
+
+DELIMITER //
+CREATE PROCEDURE GetUserPlaylistStats(IN p_limit INT)
+BEGIN
+    SELECT v.playlist_name, v.total_tracks, v.avg_popularity, v.all_genres, v.created_at
+    FROM (SELECT id FROM custom_playlists ORDER BY created_at DESC, id DESC LIMIT p_limit) newest
+    JOIN fast_analytics_view v ON v.id = newest.id
+    ORDER BY v.created_at DESC, v.id DESC;
+END //
+DELIMITER ;
@@ -0,0 +1,55 @@
+-- Schema tuned for the queries link.py runs:
+--   * Spotify IDs are always 22 base62 characters: CHAR(22) ASCII, binary (IDs are case-sensitive)
+--   * release_date is a real DATE; release_date_precision keeps whether Spotify gave a year, month or day
+--   * indexes for playlist track order (no filesort; the track columns still come from the rows),
+--     per-track playlist lookups and track history (both covering: answered from the index alone)
+--   * idx_track_name is dropped: nothing filters or sorts on track_name, it only slowed every upsert
+
+-- Every column of a foreign key pair changes together, so checks are off while they differ
+SET FOREIGN_KEY_CHECKS = 0;
+
+-- Dates that cannot become a DATE (e.g. Spotify's "0000") are unknown
+UPDATE tracks SET release_date = NULL
+WHERE release_date IS NOT NULL
+  AND (release_date NOT REGEXP '^[0-9]{4}-[0-9]{2}-[0-9]{2}$' OR release_date < '1000');
+
+-- Rows stored so far were padded to YYYY-MM-DD, so their precision stays NULL (unknown)
+-- until store_tracks_batch ingests the track again and rewrites both columns
+ALTER TABLE tracks
+    MODIFY id CHAR(22) CHARACTER SET ascii COLLATE ascii_bin NOT NULL,
+    MODIFY release_date DATE NULL,
+    ADD COLUMN release_date_precision ENUM('year', 'month', 'day') NULL AFTER release_date,
+    DROP INDEX idx_track_name;
+
+ALTER TABLE artists
+    MODIFY id CHAR(22) CHARACTER SET ascii COLLATE ascii_bin NOT NULL;
+
+ALTER TABLE track_features
+    MODIFY track_id CHAR(22) CHARACTER SET ascii COLLATE ascii_bin NOT NULL;
+
+-- The primary key (track_id, genre_id) already covers the per-track diff in store_tracks_batch
+ALTER TABLE artist_genres
+    MODIFY track_id CHAR(22) CHARACTER SET ascii COLLATE ascii_bin NOT NULL;
+
+ALTER TABLE track_history
+    MODIFY track_id CHAR(22) CHARACTER SET ascii COLLATE ascii_bin NULL,
+    ADD INDEX idx_history_track_time (track_id, requested_at);
+
+ALTER TABLE playlist_snapshots
+    MODIFY playlist_id CHAR(22) CHARACTER SET ascii COLLATE ascii_bin NOT NULL;
+
+ALTER TABLE playlist_source_tracks
+    MODIFY playlist_id CHAR(22) CHARACTER SET ascii COLLATE ascii_bin NOT NULL,
+    MODIFY track_id CHAR(22) CHARACTER SET ascii COLLATE ascii_bin NOT NULL;
+
+-- (playlist_id, position): ordered reads and deletes by position without a filesort
+-- (track_id, playlist_id): which playlists hold a track, for genre summary upkeep
+ALTER TABLE custom_playlist_tracks
+    MODIFY track_id CHAR(22) CHARACTER SET ascii COLLATE ascii_bin NULL,
+    ADD INDEX idx_cpt_playlist_position (playlist_id, position),
+    ADD INDEX idx_cpt_track_playlist (track_id, playlist_id);
+
+ALTER TABLE spotify_publish_jobs
+    MODIFY spotify_playlist_id CHAR(22) CHARACTER SET ascii COLLATE ascii_bin NOT NULL;
+
+SET FOREIGN_KEY_CHECKS = 1;
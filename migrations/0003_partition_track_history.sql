@@ -0,0 +1,137 @@
+-- Bounded track_history:
+--   * monthly RANGE partitions, so retention drops whole partitions instead of DELETEing rows
+--   * partitioned InnoDB tables cannot have foreign keys, so the FK to tracks goes
+--     (nothing deletes tracks; history rows of a vanished track simply age out)
+--   * track_request_daily holds request counts per track and day for trend queries
+--   * MaintainTrackHistory adds upcoming partitions and drops expired ones, daily via an event
+--     that reads its retention from track_history_settings
+--   * existing rows get a partition per month they span, so retention applies to them at once
+
+RENAME TABLE track_history TO track_history_unpartitioned;
+
+CREATE TABLE track_history (
+    id BIGINT AUTO_INCREMENT,
+    track_id CHAR(22) CHARACTER SET ascii COLLATE ascii_bin,
+    requested_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, requested_at),  -- the partitioning column must be part of every unique key
+    INDEX idx_history_track_time (track_id, requested_at)
+)
+PARTITION BY RANGE (UNIX_TIMESTAMP(requested_at)) (
+    PARTITION pmax VALUES LESS THAN MAXVALUE
+);
+
+CREATE TABLE track_request_daily (
+    day DATE,
+    track_id CHAR(22) CHARACTER SET ascii COLLATE ascii_bin,
+    request_count INT NOT NULL,
+    PRIMARY KEY (day, track_id),                        -- "most requested since" scans a day range
+    INDEX idx_daily_track_day (track_id, day)           -- one track's trend
+);
+
+-- Retention the daily event applies, one row; SpotifyAPI.maintain_track_history writes
+-- TRACK_HISTORY_RETENTION_DAYS / TRACK_ROLLUP_RETENTION_DAYS here
+CREATE TABLE track_history_settings (
+    id TINYINT PRIMARY KEY DEFAULT 1,
+    retention_days INT NOT NULL,
+    months_ahead INT NOT NULL,
+    rollup_retention_days INT NOT NULL,
+    CHECK (id = 1)
+);
+
+INSERT INTO track_history_settings (id, retention_days, months_ahead, rollup_retention_days) VALUES (1, 90, 2, 730);
+
+-- Splits pmax into monthly partitions from p_from's month through p_to's month
+-- (months already covered by an existing partition are skipped)
+DELIMITER //
+CREATE PROCEDURE AddTrackHistoryPartitions(IN p_from DATE, IN p_to DATE)
+BEGIN
+    DECLARE v_month DATE DEFAULT DATE_FORMAT(p_from, '%Y-%m-01');
+    DECLARE v_last_month DATE DEFAULT DATE_FORMAT(p_to, '%Y-%m-01');
+    DECLARE v_highest BIGINT;
+    DECLARE v_bound BIGINT;
+
+    SELECT MAX(CAST(PARTITION_DESCRIPTION AS UNSIGNED)) INTO v_highest
+    FROM information_schema.partitions
+    WHERE table_schema = DATABASE() AND table_name = 'track_history' AND PARTITION_DESCRIPTION <> 'MAXVALUE';
+
+    WHILE v_month <= v_last_month DO
+        SET v_bound = UNIX_TIMESTAMP(v_month + INTERVAL 1 MONTH);
+        IF v_highest IS NULL OR v_bound > v_highest THEN
+            SET @ddl = CONCAT('ALTER TABLE track_history REORGANIZE PARTITION pmax INTO (',
+                              'PARTITION p', DATE_FORMAT(v_month, '%Y%m'), ' VALUES LESS THAN (', v_bound, '), ',
+                              'PARTITION pmax VALUES LESS THAN MAXVALUE)');
+            PREPARE stmt FROM @ddl;
+            EXECUTE stmt;
+            DEALLOCATE PREPARE stmt;
+            SET v_highest = v_bound;
+        END IF;
+        SET v_month = v_month + INTERVAL 1 MONTH;
+    END WHILE;
+END //
+
+-- Adds partitions up to p_months_ahead months from now, then drops partitions whose rows
+-- are all older than p_retention_days (retention is per whole month) and daily rollups
+-- older than p_rollup_retention_days
+CREATE PROCEDURE MaintainTrackHistory(IN p_retention_days INT, IN p_months_ahead INT, IN p_rollup_retention_days INT)
+BEGIN
+    DECLARE v_partition VARCHAR(64);
+
+    CALL AddTrackHistoryPartitions(CURRENT_DATE, CURRENT_DATE + INTERVAL p_months_ahead MONTH);
+
+    expire: LOOP
+        SET v_partition = NULL;
+        SELECT PARTITION_NAME INTO v_partition
+        FROM information_schema.partitions
+        WHERE table_schema = DATABASE() AND table_name = 'track_history' AND PARTITION_DESCRIPTION <> 'MAXVALUE'
+          AND CAST(PARTITION_DESCRIPTION AS UNSIGNED) <= UNIX_TIMESTAMP(CURRENT_TIMESTAMP - INTERVAL p_retention_days DAY)
+        ORDER BY PARTITION_ORDINAL_POSITION
+        LIMIT 1;
+        IF v_partition IS NULL THEN
+            LEAVE expire;
+        END IF;
+        SET @ddl = CONCAT('ALTER TABLE track_history DROP PARTITION ', v_partition);
+        PREPARE stmt FROM @ddl;
+        EXECUTE stmt;
+        DEALLOCATE PREPARE stmt;
+    END LOOP;
+
+    DELETE FROM track_request_daily WHERE day < CURRENT_DATE - INTERVAL p_rollup_retention_days DAY;
+END //
+
+-- MaintainTrackHistory with the retention stored in track_history_settings
+CREATE PROCEDURE MaintainConfiguredTrackHistory()
+BEGIN
+    DECLARE v_retention_days INT;
+    DECLARE v_months_ahead INT;
+    DECLARE v_rollup_retention_days INT;
+
+    SELECT retention_days, months_ahead, rollup_retention_days
+    INTO v_retention_days, v_months_ahead, v_rollup_retention_days
+    FROM track_history_settings WHERE id = 1;
+
+    CALL MaintainTrackHistory(v_retention_days, v_months_ahead, v_rollup_retention_days);
+END //
+DELIMITER ;
+
+-- Partitions are created while the table is empty, so no existing row is moved twice
+SET @history_start = (SELECT MIN(requested_at) FROM track_history_unpartitioned);
+CALL AddTrackHistoryPartitions(IFNULL(@history_start, CURRENT_DATE), CURRENT_DATE + INTERVAL 2 MONTH);
+
+INSERT INTO track_history (id, track_id, requested_at)
+SELECT id, track_id, IFNULL(requested_at, CURRENT_TIMESTAMP) FROM track_history_unpartitioned;
+
+-- Backfilled from every existing row, before retention drops the oldest months
+INSERT INTO track_request_daily (day, track_id, request_count)
+SELECT DATE(requested_at), track_id, COUNT(*)
+FROM track_history_unpartitioned
+WHERE track_id IS NOT NULL
+GROUP BY DATE(requested_at), track_id;
+
+DROP TABLE track_history_unpartitioned;
+
+CALL MaintainConfiguredTrackHistory();
+
+-- Needs event_scheduler=ON (the MySQL 8 default); SpotifyAPI.maintain_track_history runs the same on demand
+CREATE EVENT track_history_maintenance
+ON SCHEDULE EVERY 1 DAY
+DO CALL MaintainConfiguredTrackHistory();
@@ -0,0 +1,341 @@
+import functools
+import os
+import threading
+import time
+import zlib
+import numpy as np
+from dotenv import load_dotenv
+from audio_features import FEATURE_COLUMNS, FeatureStore, mood_target
+from curator import MOOD_LEXICON
+from ranking import STOPWORDS, TOKEN_RE, release_year
+
+load_dotenv()
+
+NN_INDEX_PATH = os.getenv('NN_INDEX_PATH', '.track_index.npz')
+# Minimum seconds between automatic saves while tracks keep arriving
+NN_INDEX_SAVE_INTERVAL = float(os.getenv('NN_INDEX_SAVE_INTERVAL', '30'))
+
+GENRE_DIMS = 64
+DIMS = GENRE_DIMS + 2 + len(FEATURE_COLUMNS)  # genres | popularity, era | audio features
+# Cells probed per query; more probes trade latency for recall
+NN_INDEX_PROBES = int(os.getenv('NN_INDEX_PROBES', '16'))
+# Below this many tracks queries scan everything and no cells are trained
+MIN_TRAIN_SIZE = 2000
+# Cells are retrained once the index has grown this many times past the last training
+RETRAIN_GROWTH = 4
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE = 20000
+# Relative weight of each block in the cosine similarity
+GENRE_WEIGHT, POPULARITY_WEIGHT, ERA_WEIGHT, FEATURE_WEIGHT = 1.0, 0.3, 0.5, 0.6
+
+@functools.lru_cache(maxsize=None)
+def _genre_slots(genre):
+    """Hashed dimensions for a genre and its words, so "indie pop" sits near "pop" """
+    words = TOKEN_RE.findall(genre.lower())
+    return tuple(zlib.crc32(key.encode()) % GENRE_DIMS for key in [" ".join(words)] + words)
+
+def _unit(vector):
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def _unit_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+def track_vectors(tracks, features=None):
+    """(n, DIMS) unit-length float32 vectors of track records: genres, popularity, era, audio features.
+
+    `features` is an (n, len(FEATURE_COLUMNS)) FeatureStore-style matrix (NaN = unknown)
+    overriding the records' 'audio_features'.
+    """
+    vectors = np.zeros((len(tracks), DIMS), dtype=np.float32)
+    rows, slots = [], []
+    for row, track in enumerate(tracks):
+        for genre in track.get('artist_genres') or ():
+            genre_slots = _genre_slots(genre)
+            rows.extend([row] * len(genre_slots))
+            slots.extend(genre_slots)
+    genres = np.zeros((len(tracks), GENRE_DIMS), dtype=np.float32)
+    np.add.at(genres, (rows, slots), 1)
+    vectors[:, :GENRE_DIMS] = GENRE_WEIGHT * _unit_rows(genres)
+
+    popularity = np.array([t.get('popularity') or 0 for t in tracks], dtype=np.float32)
+    vectors[:, GENRE_DIMS] = POPULARITY_WEIGHT * (popularity / 100 - 0.5)
+    years = np.array([release_year(t.get('release_date')) or 0 for t in tracks], dtype=np.float32)
+    vectors[:, GENRE_DIMS + 1] = np.where(years > 0, ERA_WEIGHT * np.clip((years - 1995) / 30, -1, 1), 0)
+    if features is None and any(t.get('audio_features') for t in tracks):
+        features = FeatureStore.from_tracks(tracks).matrix
+    if features is not None:
+        vectors[:, GENRE_DIMS + 2:] = np.nan_to_num(FEATURE_WEIGHT * (features - 0.5), nan=0.0)
+    return _unit_rows(vectors)
+
+def mood_vector(mood_description):
+    """Query vector for a mood: genres it names or implies plus its audio-feature target"""
+    vector = np.zeros(DIMS, dtype=np.float32)
+    words = [w for w in TOKEN_RE.findall((mood_description or "").lower()) if w not in STOPWORDS]
+    genres = np.zeros(GENRE_DIMS, dtype=np.float32)
+    for word in words:
+        genres[list(_genre_slots(word))] += 1
+        for key, implied in MOOD_LEXICON.items():
+            if word.startswith(key):
+                for genre in implied:
+                    genres[list(_genre_slots(genre))] += 0.5
+    vector[:GENRE_DIMS] = GENRE_WEIGHT * _unit(genres)
+    target = mood_target(mood_description)
+    if target is not None:
+        values, weights = target
+        vector[GENRE_DIMS + 2:] = FEATURE_WEIGHT * (values - 0.5) * weights
+    return _unit(vector)
+
+class TrackIndex:
+    """Approximate nearest neighbours over track vectors (an inverted file).
+
+    Vectors are grouped into ~sqrt(n) cells by spherical k-means; a query
+    scans only the tracks of its NN_INDEX_PROBES closest cells and ranks
+    them by exact cosine similarity. New tracks join their closest cell as
+    they are added, and cells are retrained as the catalog grows. save()
+    writes ids, vectors and centroids with np.savez; cell membership is
+    recomputed on load.
+    """
+
+    def __init__(self, path=NN_INDEX_PATH, probes=NN_INDEX_PROBES, seed=7):
+        self.path = path
+        self.probes = probes
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._reset()
+        self._saved_at = time.monotonic()
+
+    def _reset(self):
+        self.ids = []
+        self.rows = {}
+        # Grown by doubling; rows past len(self.ids) are unused
+        self._buffer = np.zeros((1024, DIMS), dtype=np.float32)
+        # Audio features behind each vector (NaN = unknown), kept when a record arrives without them
+        self._features = np.full((1024, len(FEATURE_COLUMNS)), np.nan, dtype=np.float32)
+        self.centroids = None
+        self._cells = []
+        self._cell_arrays = None
+        self._cell_of = np.zeros(0, dtype=np.int32)
+        self._trained_size = 0
+        self._dirty = False
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, track_id):
+        return track_id in self.rows
+
+    @property
+    def _vectors(self):
+        return self._buffer[:len(self.ids)]
+
+    def feature_count(self):
+        """Indexed tracks with at least one known audio feature"""
+        with self._lock:
+            return int((~np.isnan(self._features[:len(self.ids)])).any(axis=1).sum())
+
+    def clear(self):
+        """Drop every track, e.g. before re-indexing the catalog from scratch"""
+        with self._lock:
+            self._reset()
+            self._dirty = True
+
+    def add(self, tracks):
+        """Insert or update track records (with optional 'audio_features').
+
+        A record without audio features keeps those already indexed for its
+        track, since ingest records never carry them.
+        """
+        if not tracks:
+            return
+        features = FeatureStore.from_tracks(tracks).matrix.astype(np.float32)
+        with self._lock:
+            for i in np.flatnonzero(np.isnan(features).all(axis=1)):
+                row = self.rows.get(tracks[i]['id'])
+                if row is not None:
+                    features[i] = self._features[row]
+            self._add_vectors([t['id'] for t in tracks], track_vectors(tracks, features), features)
+            self._dirty = True
+
+    def _add_vectors(self, ids, vectors, features):
+        # Last record wins when a batch repeats a track
+        latest = {track_id: i for i, track_id in enumerate(ids)}
+        if len(latest) < len(ids):
+            ids = list(latest)
+            vectors = vectors[list(latest.values())]
+            features = features[list(latest.values())]
+        first_row = len(self.ids)
+        new = []
+        updated = []
+        for i, track_id in enumerate(ids):
+            row = self.rows.get(track_id)
+            if row is None:
+                self.rows[track_id] = first_row + len(new)
+                new.append(i)
+            else:
+                self._buffer[row] = vectors[i]
+                self._features[row] = features[i]
+                updated.append(row)
+
+        if new:
+            size = first_row + len(new)
+            if size > len(self._buffer):
+                buffer = np.zeros((max(size, 2 * len(self._buffer)), DIMS), dtype=np.float32)
+                buffer[:first_row] = self._vectors
+                self._buffer = buffer
+                feature_buffer = np.full((len(buffer), len(FEATURE_COLUMNS)), np.nan, dtype=np.float32)
+                feature_buffer[:first_row] = self._features[:first_row]
+                self._features = feature_buffer
+            self._buffer[first_row:size] = vectors[new]
+            self._features[first_row:size] = features[new]
+            self.ids.extend(ids[i] for i in new)
+
+        if len(self) >= max(MIN_TRAIN_SIZE, RETRAIN_GROWTH * self._trained_size):
+            self._train()
+        elif self.centroids is not None:
+            for row in updated:
+                self._cells[self._cell_of[row]].remove(row)
+            self._assign(updated + list(range(first_row, len(self))))
+
+    def _train(self):
+        """Spherical k-means over a sample of the vectors, then reassign every track"""
+        rng = np.random.default_rng(self.seed)
+        vectors = self._vectors
+        if len(vectors) > KMEANS_SAMPLE:
+            vectors = vectors[rng.choice(len(vectors), KMEANS_SAMPLE, replace=False)]
+        # Sized for the catalog at the next retraining, so cells stay small as it grows
+        cell_count = min(len(vectors), int(np.sqrt(RETRAIN_GROWTH * len(self))))
+        centroids = vectors[rng.choice(len(vectors), cell_count, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            assignment = np.argmax(vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, vectors)
+            # Empty cells keep their old centroid
+            filled = np.bincount(assignment, minlength=len(centroids)) > 0
+            centroids[filled] = _unit_rows(sums[filled])
+        self._set_centroids(centroids)
+        self._trained_size = len(self)
+
+    def _set_centroids(self, centroids):
+        self.centroids = centroids
+        self._cells = [[] for _ in range(len(centroids))]
+        self._cell_of = np.zeros(0, dtype=np.int32)
+        self._assign(range(len(self)))
+
+    def _assign(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(self._cell_of) < len(self._buffer):
+            cell_of = np.zeros(len(self._buffer), dtype=np.int32)
+            cell_of[:len(self._cell_of)] = self._cell_of
+            self._cell_of = cell_of
+        if not len(rows):
+            return
+        cells = np.argmax(self._buffer[rows] @ self.centroids.T, axis=1)
+        self._cell_of[rows] = cells
+        self._cell_arrays = None
+        # Group by cell so each cell list is extended once
+        order = np.argsort(cells, kind='stable')
+        cell_ids, starts = np.unique(cells[order], return_index=True)
+        sorted_rows = rows[order].tolist()
+        for cell, start, end in zip(cell_ids.tolist(), starts.tolist(), starts[1:].tolist() + [len(rows)]):
+            self._cells[cell].extend(sorted_rows[start:end])
+
+    def query(self, vector, k=50, exclude=()):
+        """[(track_id, cosine similarity)] of the ~k nearest tracks, best first"""
+        if not len(self):
+            return []
+        vector = _unit(np.asarray(vector, dtype=np.float32))
+        with self._lock:
+            excluded = [self.rows[t] for t in exclude if t in self.rows]
+            if self.centroids is None:
+                rows = np.arange(len(self))
+            else:
+                if self._cell_arrays is None:
+                    self._cell_arrays = [np.array(cell, dtype=np.int64) for cell in self._cells]
+                probes = min(self.probes, len(self.centroids))
+                closest = np.argpartition(-(self.centroids @ vector), probes - 1)[:probes]
+                rows = np.concatenate([self._cell_arrays[cell] for cell in closest])
+            if excluded:
+                rows = rows[~np.isin(rows, excluded)]
+            if not len(rows):
+                return []
+            similarity = self._buffer[rows] @ vector
+            if len(rows) > k:
+                top = np.argpartition(-similarity, k - 1)[:k]
+                rows, similarity = rows[top], similarity[top]
+            # Best first, ties by insertion order so results are deterministic
+            order = np.lexsort((rows, -similarity))
+            return [(self.ids[rows[i]], float(similarity[i])) for i in order]
+
+    def similar_to(self, track_ids, k=50, mood_description=None):
+        """Tracks near the centroid of `track_ids` (nudged towards the mood), excluding the seeds"""
+        with self._lock:
+            seed_rows = [self.rows[t] for t in track_ids if t in self.rows]
+            centroid = self._vectors[seed_rows].mean(axis=0) if seed_rows else np.zeros(DIMS, dtype=np.float32)
+        if mood_description:
+            centroid = _unit(centroid) + mood_vector(mood_description)
+        if not centroid.any():
+            return []
+        return self.query(centroid, k, exclude=track_ids)
+
+    def save(self, path=None):
+        """Write the index atomically"""
+        path = path or self.path
+        with self._lock:
+            tmp_path = f"{path}.tmp.npz"
+            centroids = self.centroids if self.centroids is not None else np.zeros((0, DIMS), dtype=np.float32)
+            np.savez(tmp_path, ids=np.array(self.ids, dtype=str), vectors=self._vectors,
+                     features=self._features[:len(self.ids)], centroids=centroids, trained_size=self._trained_size)
+            os.replace(tmp_path, path)
+            self._dirty = False
+            self._saved_at = time.monotonic()
+
+    def maybe_save(self, min_interval=NN_INDEX_SAVE_INTERVAL):
+        """Save if there are unsaved changes and the last save is at least `min_interval` seconds old"""
+        if self._dirty and time.monotonic() - self._saved_at >= min_interval:
+            self.save()
+
+    def flush(self):
+        if self._dirty:
+            self.save()
+
+    @classmethod
+    def load(cls, path=NN_INDEX_PATH):
+        """The saved index at `path`, or an empty one when there is none (SpotifyAPI then rebuilds it from MySQL)"""
+        index = cls(path)
+        if not os.path.exists(path):
+            return index
+        try:
+            with np.load(path) as data:
+                ids = data['ids'].tolist()
+                vectors = data['vectors'].astype(np.float32)
+                # Files saved before features were kept separately: unknown until re-enriched
+                features = (data['features'].astype(np.float32) if 'features' in data.files
+                            else np.full((len(vectors), len(FEATURE_COLUMNS)), np.nan, dtype=np.float32))
+                centroids = data['centroids']
+                trained_size = int(data['trained_size'])
+            if vectors.shape[1:] != (DIMS,):
+                raise ValueError(f"saved with {vectors.shape[1:]} dimensions")
+        except Exception as e:
+            print(f"Warning: Error loading track index, starting empty (SpotifyAPI rebuilds it from MySQL): {e}")
+            return cls(path)
+        index._buffer = vectors
+        index._features = features
+        index.ids = ids
+        index.rows = {track_id: row for row, track_id in enumerate(ids)}
+        if len(centroids):
+            index._set_centroids(centroids)
+            index._trained_size = trained_size
+        return index
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+def default_track_index():
+    """The process-wide index, loaded from NN_INDEX_PATH on first use"""
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = TrackIndex.load()
+        return _default_index
@@ -0,0 +1,134 @@
+import math
+import re
+import numpy as np
+from genre_index import GenreIndex
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Words that say nothing about which tracks fit a mood
+STOPWORDS = {
+    "a", "an", "and", "the", "for", "to", "of", "with", "in", "on", "my", "some", "me",
+    "music", "songs", "song", "tracks", "playlist", "mix", "vibes", "vibe", "feel", "like"
+}
+
+POPULAR_WORDS = {"popular", "hits", "hit", "mainstream", "chart", "charts", "famous", "top"}
+OBSCURE_WORDS = {"underground", "obscure", "hidden", "gems", "deep", "cuts", "rare", "niche"}
+DECADE_RE = re.compile(r"\b(?:(19|20)?([0-9])0)'?s\b")
+
+# Relative weight of each field in the text score
+FIELD_WEIGHTS = {"track_name": 1.0, "artist": 1.0, "album": 0.5}
+
+def tokenize(text):
+    """Lowercase word tokens minus stopwords, plus joined forms ("lo-fi" -> "lofi", "hip hop" -> "hiphop")"""
+    text = (text or "").lower()
+    tokens = [t for t in TOKEN_RE.findall(text) if t not in STOPWORDS]
+    words = ["".join(TOKEN_RE.findall(w)) for w in text.split()]
+    words = [w for w in words if w and w not in STOPWORDS]
+    tokens.extend(w for w in words if w not in tokens)
+    tokens.extend(a + b for a, b in zip(words, words[1:]))
+    return tokens
+
+def release_year(release_date):
+    try:
+        return int(str(release_date)[:4])
+    except (TypeError, ValueError):
+        return None
+
+def era_bonus(mood_description, years):
+    """1.0 for tracks released in a decade the mood names ("90s", "1980s"), else 0.0"""
+    bonus = np.zeros(len(years), dtype=np.float32)
+    for century, decade in DECADE_RE.findall((mood_description or "").lower()):
+        start = int((century or ("20" if decade in "012" else "19")) + decade + "0")
+        bonus += ((years >= start) & (years < start + 10)).astype(np.float32)
+    return bonus
+
+class CandidateRanker:
+    """Scores candidate tracks against a mood description without calling the LLM.
+
+    Built once per candidate pool; each rank() call is a handful of NumPy
+    operations, so a 10k-track pool costs the same prompt as a 100-track one.
+    """
+
+    def __init__(self, tracks):
+        self.tracks = tracks
+        self.genre_index = GenreIndex(tracks)
+        self.genre_tokens = {genre: set(tokenize(genre)) for genre in self.genre_index.genres}
+        genre_counts = np.unpackbits(self.genre_index.bits.view(np.uint8), axis=1).sum(axis=1)
+        self.genre_norms = np.sqrt(np.maximum(genre_counts, 1)).astype(np.float32)
+
+        # Inverted index over name/artist/album tokens: token -> (rows, term weights)
+        postings = {}
+        for row, track in enumerate(tracks):
+            weights = {}
+            for field, field_weight in FIELD_WEIGHTS.items():
+                for token in tokenize(track.get(field, '')):
+                    weights[token] = weights.get(token, 0.0) + field_weight
+            for token, weight in weights.items():
+                postings.setdefault(token, ([], []))
+                postings[token][0].append(row)
+                postings[token][1].append(weight)
+
+        n_tracks = len(tracks)
+        self.postings = {}
+        text_norms = np.zeros(n_tracks, dtype=np.float32)
+        for token, (rows, weights) in postings.items():
+            idf = math.log((1 + n_tracks) / (1 + len(rows))) + 1
+            rows = np.asarray(rows, dtype=np.int32)
+            weights = np.asarray(weights, dtype=np.float32) * idf
+            self.postings[token] = (rows, weights)
+            np.add.at(text_norms, rows, weights ** 2)
+        self.text_norms = np.sqrt(np.maximum(text_norms, 1e-6))
+
+        self.popularity = np.array([t.get('popularity') or 0 for t in tracks], dtype=np.float32) / 100
+        self.years = np.array([release_year(t.get('release_date')) or 0 for t in tracks], dtype=np.int32)
+
+    def matching_genres(self, mood_tokens):
+        """Genres sharing a word (or a prefix of 4+ letters) with the mood"""
+        matched = []
+        for genre, tokens in self.genre_tokens.items():
+            for token in mood_tokens:
+                if token in tokens or (len(token) >= 4 and any(t.startswith(token) for t in tokens)):
+                    matched.append(genre)
+                    break
+        return matched
+
+    def score(self, mood_description):
+        """Relevance of every track to the mood, higher is better"""
+        mood_tokens = tokenize(mood_description)
+        n_tracks = len(self.tracks)
+        if n_tracks == 0:
+            return np.zeros(0, dtype=np.float32)
+
+        # Genres carry most of the signal; the bitset index scores all tracks at once
+        genre_score = self.genre_index.match_count(self.matching_genres(mood_tokens)) / self.genre_norms
+
+        text_score = np.zeros(n_tracks, dtype=np.float32)
+        for token in set(mood_tokens):
+            if token in self.postings:
+                rows, weights = self.postings[token]
+                np.add.at(text_score, rows, weights)
+        text_score /= self.text_norms
+
+        scores = 2.0 * genre_score + text_score
+
+        # Era hints like "90s" or "1980s"
+        scores += era_bonus(mood_description, self.years)
+
+        words = set(mood_tokens)
+        if words & POPULAR_WORDS:
+            scores += self.popularity
+        if words & OBSCURE_WORDS:
+            scores += 1 - self.popularity
+
+        # Small popularity prior so ties resolve sensibly and deterministically
+        return scores + 0.01 * self.popularity
+
+    def top_k(self, mood_description, k):
+        """Indices of the k best tracks, best first (ties keep the original order)"""
+        scores = self.score(mood_description)
+        order = np.lexsort((np.arange(len(scores)), -scores))
+        return [int(i) for i in order[:k]]
+
+    def rank(self, mood_description, k):
+        """The k best track dicts for the mood"""
+        return [self.tracks[i] for i in self.top_k(mood_description, k)]
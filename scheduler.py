@@ -0,0 +1,150 @@
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+import requests
+from spotipy.exceptions import SpotifyException
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Lower number = served first when several callers wait for a token
+INTERACTIVE = 0
+BACKGROUND = 1
+
+SPOTIFY_RATE = float(os.getenv('SPOTIFY_RATE', '10'))     # sustained requests per second
+SPOTIFY_BURST = float(os.getenv('SPOTIFY_BURST', '20'))   # bucket size
+SPOTIFY_MAX_RETRIES = int(os.getenv('SPOTIFY_MAX_RETRIES', '5'))
+
+RETRYABLE_STATUSES = {500, 502, 503, 504}
+
+class RequestScheduler:
+    """Token-bucket scheduler for Spotify calls with 429/Retry-After handling.
+
+    Every call takes a token; when several callers wait, interactive requests
+    are served before background ones. A 429 pauses the whole bucket for
+    Retry-After seconds and halves the rate, which then creeps back up on
+    success, so we settle just under whatever limit Spotify enforces.
+    """
+
+    def __init__(self, rate=SPOTIFY_RATE, burst=SPOTIFY_BURST, max_retries=SPOTIFY_MAX_RETRIES,
+                 base_delay=0.5, max_delay=30.0, min_rate=1.0):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.burst = burst
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._cond = threading.Condition()
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters = []  # heap of (priority, sequence) tickets
+        self._sequence = itertools.count()
+
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+
+    def call(self, fn, *args, priority=INTERACTIVE, **kwargs):
+        """Run fn(*args, **kwargs) within the rate budget, retrying 429s, 5xx and network errors"""
+        attempt = 0
+        while True:
+            self._acquire(priority)
+            try:
+                result = fn(*args, **kwargs)
+                self._on_success()
+                return result
+            except SpotifyException as e:
+                if e.http_status == 429:
+                    delay = self._on_throttled(e)
+                elif e.http_status in RETRYABLE_STATUSES:
+                    delay = self._backoff(attempt)
+                else:
+                    raise
+                error = e
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                delay = self._backoff(attempt)
+                error = e
+
+            attempt += 1
+            with self._cond:
+                if attempt > self.max_retries:
+                    self.failures += 1
+                    raise error
+                self.retries += 1
+            time.sleep(delay)
+
+    def _acquire(self, priority):
+        with self._cond:
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if now < self._paused_until:
+                        wait = self._paused_until - now
+                    elif self._waiters[0] != ticket:
+                        wait = None  # woken when the head of the queue takes its token
+                    elif self._tokens >= 1:
+                        self._tokens -= 1
+                        self.calls += 1
+                        heapq.heappop(self._waiters)
+                        self._cond.notify_all()
+                        return
+                    else:
+                        wait = (1 - self._tokens) / self.rate
+                    self._cond.wait(wait)
+            except BaseException:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+                raise
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _on_success(self):
+        with self._cond:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + 0.1)
+
+    def _on_throttled(self, error):
+        headers = getattr(error, 'headers', None) or {}
+        try:
+            retry_after = float(headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            retry_after = self.base_delay
+        # Jitter so paused callers don't all hit the API in the same instant
+        delay = retry_after + random.uniform(0, self.base_delay)
+        with self._cond:
+            self.throttled += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = 0
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self._cond.notify_all()
+        return delay
+
+    def _backoff(self, attempt):
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def stats(self):
+        with self._cond:
+            return {
+                'calls': self.calls,
+                'retries': self.retries,
+                'throttled': self.throttled,
+                'failures': self.failures,
+                'rate': round(self.rate, 2)
+            }
+
+# One budget per process: every SpotifyAPI instance shares the same rate limit
+spotify_scheduler = RequestScheduler()
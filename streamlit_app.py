@@ -2,8 +2,9 @@
 import streamlit as st
 import json
 import os
-from link import SpotifyAPI
-from llm_handler import LLMHandler
+from link import SpotifyAPI, CUSTOM_PLAYLIST_PAGE_SIZE
+from llm_handler import llm_registry
+from curator import LocalCurator
 import pandas as pd
 from datetime import datetime
 
@@ -178,8 +179,8 @@ def initialize_session_state():
         st.session_state.selected_playlist = None
     if 'tracks_data' not in st.session_state:
         st.session_state.tracks_data = None
-    if 'custom_playlists' not in st.session_state:
-        st.session_state.custom_playlists = None
+    if 'playlist_tracks' not in st.session_state:
+        st.session_state.playlist_tracks = {}
     if 'llm_handler' not in st.session_state:
         st.session_state.llm_handler = None
 
@@ -188,6 +189,8 @@ def connect_spotify():
     try:
         if st.session_state.spotify_api is None:
             st.session_state.spotify_api = SpotifyAPI()
+            # Applies the configured history retention, which the daily MySQL event then keeps using
+            st.session_state.spotify_api.maintain_track_history()
             st.success("✅ Successfully connected to Spotify!")
         return True
     except Exception as e:
@@ -195,15 +198,13 @@ def connect_spotify():
         return False
 
 def connect_ai():
-    """Initialize AI connection"""
-    try:
-        if st.session_state.llm_handler is None:
-            st.session_state.llm_handler = LLMHandler()
-            st.success("✅ AI connection established!")
+    """Attach the process-wide AI handler; its health check is cached across reruns and sessions"""
+    ai_working, message, handler = llm_registry.status()
+    st.session_state.llm_handler = handler
+    if ai_working:
         return True
-    except Exception as e:
-        st.warning(f"⚠️ AI connection failed: {e}")
-        return False
+    st.warning(f"⚠️ AI connection failed: {message}")
+    return False
 
 def fetch_playlists():
     """Fetch user's playlists"""
@@ -244,7 +245,7 @@ def fetch_tracks():
     st.header("🎵 Analyze Tracks")
     
     if st.session_state.selected_playlist:
-        max_tracks = min(st.session_state.selected_playlist['tracks_total'], 100)
+        max_tracks = st.session_state.selected_playlist['tracks_total']
         limit = st.slider(
             "Number of tracks to analyze:",
             min_value=5,
@@ -257,10 +258,12 @@ def fetch_tracks():
             with st.spinner(f"Analyzing {limit} tracks from '{st.session_state.selected_playlist['name']}'..."):
                 st.session_state.tracks_data = st.session_state.spotify_api.get_playlist_tracks(
                     st.session_state.selected_playlist['id'], 
-                    limit=limit
+                    limit=limit,
+                    snapshot_id=st.session_state.selected_playlist.get('snapshot_id')
                 )
                 
                 if st.session_state.tracks_data:
+                    st.session_state.spotify_api.enrich_audio_features(st.session_state.tracks_data)
                     st.success(f"✅ Successfully analyzed {len(st.session_state.tracks_data)} tracks!")
                     
                     # Display track preview
@@ -278,6 +281,13 @@ def fetch_tracks():
                 else:
                     st.error("❌ Failed to fetch tracks from the playlist!")
 
+def playlist_tracks_frame(tracks):
+    """DataFrame of custom playlist tracks for display"""
+    tracks_df = pd.DataFrame(tracks)
+    tracks_df = tracks_df.reindex(columns=['position', 'track_name', 'artist', 'album'])
+    tracks_df.columns = ['#', 'Track Name', 'Artist', 'Album']
+    return tracks_df
+
 def create_custom_playlist():
     """Create custom playlist using AI"""
     st.header("🎨 Create Custom Playlist")
@@ -306,6 +316,20 @@ def create_custom_playlist():
             value=min(10, len(st.session_state.tracks_data))
         )
         
+        similar_count = st.number_input(
+            "➕ Similar tracks from your other synced playlists:",
+            min_value=0,
+            max_value=500,
+            value=0,
+            step=25,
+            help="Widens the candidates with the closest matches from every track ingested so far"
+        )
+        
+        regenerate = st.checkbox(
+            "🔄 Regenerate",
+            help="Ask the AI again instead of reusing the result of an identical earlier request"
+        )
+        
         if st.button("✨ Generate Playlist with AI", type="primary"):
             if not mood_description:
                 st.warning("⚠️ Please describe the mood for your playlist!")
@@ -314,32 +338,49 @@ def create_custom_playlist():
             # Test AI connection
             ai_connected = connect_ai()
             
+            candidates = st.session_state.tracks_data
+            if similar_count:
+                candidates = st.session_state.spotify_api.expand_candidates(
+                    candidates, mood_description, k=int(similar_count)
+                )
+            
+            # Tracks are drawn into this placeholder as the AI streams them back
+            st.subheader("🎶 Your Custom Playlist")
+            tracks_placeholder = st.empty()
+            streamed_tracks = []
+            
+            def show_track(track):
+                streamed_tracks.append(track)
+                tracks_placeholder.dataframe(playlist_tracks_frame(streamed_tracks), width="stretch")
+            
             with st.spinner("🎵 AI is curating your perfect playlist..."):
                 try:
-                    custom_playlist = st.session_state.llm_handler.analyze_tracks_and_create_playlist(
-                        tracks_data=st.session_state.tracks_data,
-                        mood_description=mood_description,
-                        playlist_name=playlist_name,
-                        max_tracks=max_tracks
-                    )
+                    if ai_connected:
+                        custom_playlist = st.session_state.llm_handler.analyze_tracks_and_create_playlist(
+                            tracks_data=candidates,
+                            mood_description=mood_description,
+                            playlist_name=playlist_name,
+                            max_tracks=max_tracks,
+                            regenerate=regenerate,
+                            stream=True,
+                            on_track=show_track
+                        )
+                    else:
+                        st.info("💡 AI unavailable, curating locally from genres, era and popularity.")
+                        custom_playlist = LocalCurator(candidates).curate(
+                            mood_description, playlist_name, max_tracks
+                        )
+                    
+                    # Final table (also covers the non-streaming fallback)
+                    tracks_placeholder.dataframe(playlist_tracks_frame(custom_playlist['tracks']), width="stretch")
                     
                     # Store in database
                     st.session_state.spotify_api.store_custom_playlist(custom_playlist, mood_description)
                     
                     # Display the generated playlist
                     st.success(f"🎉 Your custom playlist '{custom_playlist['playlist_name']}' has been created!")
-                    
-                    # Show playlist details
-                    st.subheader("🎶 Your Custom Playlist")
                     st.write(f"**Description:** {custom_playlist['description']}")
                     
-                    # Display tracks in a table
-                    tracks_df = pd.DataFrame(custom_playlist['tracks'])
-                    tracks_df = tracks_df[['position', 'track_name', 'artist', 'album']]
-                    tracks_df.columns = ['#', 'Track Name', 'Artist', 'Album']
-                    
-                    st.dataframe(tracks_df, width="stretch")
-                    
                 except Exception as e:
                     st.error(f"❌ Error generating playlist: {e}")
                     st.info("💡 Try adjusting your mood description or selecting more tracks to analyze.")
@@ -349,13 +390,36 @@ def view_custom_playlists():
     st.header("📂 Your Custom Playlists")
     
     if st.session_state.spotify_api:
+        api = st.session_state.spotify_api
         with st.spinner("Loading your custom playlists..."):
-            custom_playlists = st.session_state.spotify_api.get_custom_playlists()
+            total = api.count_custom_playlists()
             
-            if not custom_playlists:
+            if not total:
                 st.info("You haven't created any custom playlists yet. Create one in the 'Create Playlist' section!")
                 return
             
+            if st.button("📤 Export all to Spotify", help="Publish every playlist not yet on Spotify, resuming unfinished ones"):
+                with st.spinner("Publishing playlists to Spotify..."):
+                    results = api.export_custom_playlists()
+                published = sum(1 for spotify_id in results.values() if spotify_id)
+                if published == len(results):
+                    st.success(f"✅ Published {published} playlists to Spotify")
+                else:
+                    st.warning(f"⚠️ Published {published} of {len(results)} playlists, export again to resume the rest")
+            
+            pages = (total + CUSTOM_PLAYLIST_PAGE_SIZE - 1) // CUSTOM_PLAYLIST_PAGE_SIZE
+            page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, step=1)
+            custom_playlists = api.get_custom_playlists(limit=CUSTOM_PLAYLIST_PAGE_SIZE,
+                                                        offset=(page - 1) * CUSTOM_PLAYLIST_PAGE_SIZE)
+            
+            # Tracks load only for playlists whose "Show tracks" box is ticked, all of them in one
+            # bulk query, and stay cached for the session (stored playlists never change here)
+            tracks_cache = st.session_state.playlist_tracks
+            wanted = [p['id'] for p in custom_playlists
+                      if st.session_state.get(f"show_tracks_{p['id']}") and p['id'] not in tracks_cache]
+            if wanted:
+                tracks_cache.update(api.get_custom_playlist_tracks_bulk(wanted))
+            
             for playlist in custom_playlists:
                 with st.expander(f"🎵 {playlist['playlist_name']} - {playlist['created_at'].strftime('%Y-%m-%d')}"):
                     col1, col2 = st.columns([3, 1])
@@ -366,9 +430,17 @@ def view_custom_playlists():
                     
                     with col2:
                         st.write(f"**Created:** {playlist['created_at'].strftime('%b %d, %Y')}")
+                        if st.button("📤 Publish", key=f"publish_{playlist['id']}"):
+                            spotify_playlist_id = api.publish_custom_playlist(playlist['id'])
+                            if spotify_playlist_id:
+                                st.success(f"[Open in Spotify](https://open.spotify.com/playlist/{spotify_playlist_id})")
+                            else:
+                                st.error("❌ Publishing failed, try again to resume")
                     
                     # Show tracks
-                    tracks = st.session_state.spotify_api.get_custom_playlist_tracks(playlist['id'])
+                    if not st.checkbox(f"Show {playlist['total_tracks']} tracks", key=f"show_tracks_{playlist['id']}"):
+                        continue
+                    tracks = tracks_cache.get(playlist['id'])
                     if tracks:
                         tracks_df = pd.DataFrame(tracks)
                         st.dataframe(tracks_df[['position', 'track_name', 'artist', 'album']], 
@@ -385,16 +457,16 @@ def show_playlist_analytics():
         st.info("👈 Click 'Connect to Spotify' in the sidebar")
         return
     
-    # Refresh custom playlists for analytics
+    # Count custom playlists for analytics
     with st.spinner("Loading your playlists..."):
-        st.session_state.custom_playlists = st.session_state.spotify_api.get_custom_playlists()
+        playlist_count = st.session_state.spotify_api.count_custom_playlists()
     
-    if not st.session_state.custom_playlists:
+    if not playlist_count:
         st.info("📭 No custom playlists found. Create some playlists first!")
         st.write("💡 Go to 'Create Playlist' to generate your first AI-powered playlist!")
         return
     
-    st.success(f"✅ Found {len(st.session_state.custom_playlists)} custom playlists!")
+    st.success(f"✅ Found {playlist_count} custom playlists!")
     
     # Get user playlist stats
     with st.spinner("Analyzing playlist statistics..."):
@@ -458,6 +530,12 @@ def show_playlist_analytics():
             st.info("No statistics data available")
     else:
         st.info("No playlist statistics to display")
+
+    # Trends read the daily rollup, never the raw history
+    top_tracks = st.session_state.spotify_api.get_top_requested_tracks(days=7, limit=10)
+    if top_tracks:
+        st.subheader("🔥 Most Requested Tracks This Week")
+        st.dataframe(pd.DataFrame(top_tracks)[['track_name', 'artist', 'requests']], width="stretch")
     
     # ... rest of the function remains the same ...
 
@@ -483,7 +561,8 @@ def main():
             fetch_playlists()
         
         if st.button("Connect to AI"):
-            connect_ai()
+            if connect_ai():
+                st.success("✅ AI connection established!")
         
         st.markdown("---")
         
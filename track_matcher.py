@@ -0,0 +1,117 @@
+import re
+import unicodedata
+import numpy as np
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+# "(feat. X)", "[Remastered 2011]", "(Live)" ... carry no identity
+DECORATION_RE = re.compile(r"\s*[\(\[](?:feat|ft|with|from|remaster|live|mono|stereo|radio|single|bonus|explicit)[^\)\]]*[\)\]]")
+# "- Remastered 2011", "- Radio Edit", "- Live at ..." suffixes
+SUFFIX_RE = re.compile(r"\s+-\s+(?:[^-]*remaster[^-]*|[^-]*version|[^-]*edit|live[^-]*|mono|stereo)$")
+
+# Minimum Dice similarity of name+artist trigrams for a fuzzy match
+FUZZY_THRESHOLD = 0.6
+
+def normalize(text):
+    """Lowercase, accent-free, punctuation-free form of a name"""
+    text = str(text or '')
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = "".join(c for c in text if not unicodedata.combining(c))
+    text = text.lower()
+    if '(' in text or '[' in text or ' - ' in text:
+        text = SUFFIX_RE.sub('', DECORATION_RE.sub('', text))
+    return " ".join(WORD_RE.findall(text.replace('&', ' and ')))
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def trigram_code(gram):
+    """A normalized (ASCII) trigram packed into one integer"""
+    return (ord(gram[0]) << 16) | (ord(gram[1]) << 8) | ord(gram[2])
+
+def sorted_runs(values):
+    """(distinct values, start of each run) of a sorted array"""
+    starts = np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1])))
+    return values[starts], starts
+
+def trigram_postings(texts):
+    """({trigram code: rows containing it, ascending}, distinct trigrams per row) of normalized texts"""
+    padded = [f"  {text} " for text in texts]
+    lengths = np.fromiter(map(len, padded), dtype=np.int64, count=len(padded))
+    chars = np.frombuffer("".join(padded).encode('ascii'), dtype=np.uint8).astype(np.int64)
+    codes = (chars[:-2] << 16) | (chars[1:-1] << 8) | chars[2:]
+    # Drop the trigrams that straddle two texts
+    rows = np.repeat(np.arange(len(padded)), lengths)[:len(codes)]
+    starts = np.cumsum(lengths) - lengths
+    inside = np.arange(len(codes)) - starts[rows] <= lengths[rows] - 3
+    # One sort groups rows by trigram, in row order, and puts repeats of a trigram in a row side by side
+    keys, _ = sorted_runs(np.sort((codes[inside] << 32) | rows[inside]))
+    gram_codes, bounds = sorted_runs(keys >> 32)
+    rows = (keys & 0xFFFFFFFF).astype(np.int32)
+    postings = dict(zip(gram_codes.tolist(), np.split(rows, bounds[1:])))
+    return postings, np.bincount(rows, minlength=len(padded))
+
+class TrackMatcher:
+    """Maps (track name, artist) pairs from the LLM back to candidate tracks.
+
+    Exact matches on normalized keys are a dict lookup; near misses fall
+    back to a trigram index. Both are built on first need, once per
+    candidate pool, and ties always resolve to the earliest candidate.
+    """
+
+    def __init__(self, tracks, threshold=FUZZY_THRESHOLD):
+        self.tracks = tracks
+        self.threshold = threshold
+        self._keys = None
+        self._postings = None
+
+    def _build_keys(self):
+        self._normalized = [(normalize(t.get('track_name')), normalize(t.get('artist'))) for t in self.tracks]
+        self._keys = {}
+        for row, key in enumerate(self._normalized):
+            self._keys.setdefault(key, row)
+
+    def _build_trigrams(self):
+        self._postings, self._sizes = trigram_postings([f"{name} {artist}" for name, artist in self._normalized])
+
+    def _fuzzy_match(self, text):
+        """Row with the best Dice similarity to `text`, scoring only rows that share a trigram with it"""
+        if self._postings is None:
+            self._build_trigrams()
+        grams = trigrams(text)
+        rows = [self._postings[code] for code in map(trigram_code, grams) if code in self._postings]
+        if not rows:
+            return None
+        # Shared trigram counts of just the rows hit, never a vector over every candidate
+        hits = np.sort(np.concatenate(rows))
+        candidates, starts = sorted_runs(hits)
+        shared = np.diff(np.append(starts, len(hits)))
+        scores = 2 * shared / (len(grams) + self._sizes[candidates])
+        # Candidates are in row order, so the earliest of equal scores wins
+        best = int(np.argmax(scores))
+        return int(candidates[best]) if scores[best] >= self.threshold else None
+
+    def match(self, track_name, artist):
+        """Row of the best candidate, or None when nothing is close enough"""
+        if self._keys is None:
+            self._build_keys()
+        name = normalize(track_name)
+        raw_artist = str(artist or '')
+        artist = normalize(raw_artist)
+
+        row = self._keys.get((name, artist))
+        if row is not None:
+            return row
+        # The model sometimes lists every artist where we keep only the primary one
+        primary = normalize(re.split(r",| feat\.? | ft\.? ", raw_artist.lower())[0])
+        row = self._keys.get((name, primary))
+        if row is not None or not self.tracks:
+            return row
+
+        return self._fuzzy_match(f"{name} {artist}")
+
+    def match_track(self, track_name, artist):
+        """The best candidate track dict, or None"""
+        row = self.match(track_name, artist)
+        return self.tracks[row] if row is not None else None